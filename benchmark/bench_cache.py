@@ -0,0 +1,70 @@
+"""Benchmark reopening of RMF files from the on-disk cache.
+
+Writes an RMF file containing a number of chains of coarse-grained
+beads, then times opening it with an empty cache ("cold", which reads
+the RMF file and fills the cache) and again once it has been cached
+("warm", which does not touch the RMF file). Each open includes building
+the ChimeraX atoms, so the difference is the cost of reading the file.
+
+Run with `python benchmark/bench_cache.py [number of beads]`.
+"""
+
+import os
+import sys
+import time
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(TOPDIR, 'test'))
+import utils  # noqa: E402
+utils.set_search_paths(TOPDIR)
+
+import src.io  # noqa: E402
+import src.cache  # noqa: E402
+
+RMF = utils.import_rmf_module()
+
+
+def make_rmf_file(fname, num_beads, beads_per_chain=1000):
+    r = RMF.create_rmf_file(fname)
+    r.add_frame("root", RMF.FRAME)
+    rn = r.get_root_node()
+    pf = RMF.ParticleFactory(r)
+    cf = RMF.ChainFactory(r)
+    chain = None
+    for i in range(num_beads):
+        if i % beads_per_chain == 0:
+            chain = rn.add_child("chain %d" % i, RMF.REPRESENTATION)
+            cf.get(chain).set_chain_id("C%d" % (i // beads_per_chain))
+        p = pf.get(chain.add_child("bead %d" % i, RMF.REPRESENTATION))
+        p.set_mass(1.)
+        p.set_radius(4.)
+        p.set_coordinates(RMF.Vector3(i, 0., 0.))
+
+
+def timed_open(session, fname, cache):
+    rl = src.io._RMFLoader()
+    rl.cache = cache
+    start = time.perf_counter()
+    rl.load(fname, session)
+    return time.perf_counter() - start
+
+
+def main():
+    num_beads = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    session = utils.make_session()
+    with utils.temporary_directory() as tmpdir:
+        fname = os.path.join(tmpdir, 'test.rmf')
+        make_rmf_file(fname, num_beads)
+        cache = src.cache._RMFCache(os.path.join(tmpdir, 'cache'),
+                                    1024 * 1024 * 1024)
+        print("RMF file of %d beads:" % num_beads)
+        print("  cold open (no cache): %.3fs"
+              % timed_open(session, fname, None))
+        print("  cold open (filling cache): %.3fs"
+              % timed_open(session, fname, cache))
+        print("  warm open (from cache): %.3fs"
+              % timed_open(session, fname, cache))
+
+
+if __name__ == '__main__':
+    main()
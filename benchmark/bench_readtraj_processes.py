@@ -0,0 +1,87 @@
+"""Benchmark reading of RMF trajectories with multiple worker processes.
+
+Writes a synthetic RMF file (see rmfgen.py) with a trajectory, then times
+`rmf readtraj` of every state of the file with the frames split between
+different numbers of worker processes, and reports the speedup of each
+compared to reading every frame in a single process. Each read includes
+adding the coordsets to the ChimeraX models.
+
+Run with `python benchmark/bench_readtraj_processes.py [--beads N]
+[--frames N] [processes ...]`.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(TOPDIR, 'test'))
+import utils  # noqa: E402
+utils.set_search_paths(TOPDIR)
+
+import src.io  # noqa: E402
+import src.cmd  # noqa: E402
+from src.settings import get_settings  # noqa: E402
+import rmfgen  # noqa: E402
+
+
+class _Logger:
+    def info(self, msg, is_html=False):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def status(self, msg, **kwargs):
+        pass
+
+
+def timed_readtraj(fname, processes):
+    session = utils.make_session()
+    session.logger = _Logger()
+    get_settings(session).cache_size = 0
+    structures, status = src.io.open_rmf(session, fname, background=False)
+    m, = structures
+    start = time.perf_counter()
+    src.cmd.readtraj(session, m, processes=processes)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark reading RMF trajectories in parallel")
+    parser.add_argument("processes", type=int, nargs="*",
+                        help="numbers of worker processes to try "
+                             "(default: 1, 2, 4 and so on up to the "
+                             "number of CPUs)")
+    parser.add_argument("--beads", type=int, default=1000,
+                        help="beads per chain (default: %(default)s)")
+    parser.add_argument("--frames", type=int, default=1000,
+                        help="trajectory frames (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs of each benchmark")
+    args = parser.parse_args()
+    processes = args.processes
+    if not processes:
+        processes = [1]
+        while processes[-1] * 2 <= (os.cpu_count() or 1):
+            processes.append(processes[-1] * 2)
+    with utils.temporary_directory() as tmpdir:
+        fname = os.path.join(tmpdir, 'traj.rmf3')
+        nbeads = rmfgen.make_rmf_file(fname, beads=args.beads, chains=4,
+                                      states=2, frames=args.frames)
+        print("RMF file of %d beads, %d frames (%d CPUs):"
+              % (nbeads, args.frames, os.cpu_count() or 1))
+        serial = None
+        for p in processes:
+            elapsed = min(timed_readtraj(fname, p)
+                          for _ in range(args.repeat))
+            if serial is None:
+                serial = elapsed if p == 1 else timed_readtraj(fname, 1)
+            print("  %3d process%s: %8.3fs  (speedup %.2fx)"
+                  % (p, " " if p == 1 else "es", elapsed, serial / elapsed))
+
+
+if __name__ == '__main__':
+    main()
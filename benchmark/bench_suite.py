@@ -0,0 +1,291 @@
+"""Benchmark suite for reading RMF files, with regression checks.
+
+Synthetic RMF files of increasing size (see rmfgen.py) are read using
+the ChimeraX mocks in test/mock, and the following are measured:
+
+  open        open_rmf with the cache disabled
+  open cached open_rmf of a file already in the cache
+  readtraj    reading every trajectory frame of the first state
+  viewer      building the RMF Viewer and walking its entire tree
+  session     saving and then restoring the RMF model in a session
+
+For each, the best wall time over several runs is reported, plus counts
+of the work done (for example, the number of RMF decorator probes or
+atoms created, from the profile of each operation). Unlike times, counts
+do not depend on the machine, so any increase in a count compared to the
+baseline in baseline.json is reported as a regression. Times are only
+checked (with a tolerance) if the baseline contains them, so the
+baseline in the repository contains only counts; save a local baseline
+with --save-baseline (and compare against it with --baseline) to also
+check times.
+
+Run with `python benchmark/bench_suite.py [--save-baseline] [case ...]`.
+The exit status is 1 if any regressions were found.
+"""
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(TOPDIR, 'test'))
+import utils  # noqa: E402
+utils.set_search_paths(TOPDIR)
+
+import src.io  # noqa: E402
+import src.cmd  # noqa: E402
+import src.tool  # noqa: E402
+from src import profiling  # noqa: E402
+from src.settings import get_settings  # noqa: E402
+from Qt.QtCore import QModelIndex  # noqa: E402
+import rmfgen  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+# Arguments to rmfgen.make_rmf_file() for each case
+CASES = {
+    'small': dict(beads=100, chains=2, copies=2, states=2,
+                  resolutions=(1., 10.), features=50, bonds=50, segments=5,
+                  refframes=True, frames=5),
+    'medium': dict(beads=1000, chains=4, copies=2, states=2,
+                   resolutions=(1., 10.), features=500, bonds=500,
+                   segments=20, refframes=True, frames=10),
+    'large': dict(beads=5000, chains=8, copies=2, states=2,
+                  resolutions=(1., 10., 30.), features=5000, bonds=5000,
+                  segments=100, refframes=True, frames=20),
+}
+
+DEFAULT_CASES = ['small', 'medium']
+
+
+class _Logger:
+    def info(self, msg, is_html=False):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def status(self, msg, **kwargs):
+        pass
+
+
+def _make_session():
+    session = utils.make_session()
+    session.logger = _Logger()
+    return session
+
+
+def _profile_counts(profile):
+    """Get the machine-independent parts of an _RMFProfile"""
+    counts = {}
+    for name, (ns, calls, objects) in profile.phases.items():
+        counts[name + ' calls'] = calls
+        if objects:
+            counts[name + ' objects'] = objects
+    return counts
+
+
+def _open(session, fname, cache_size):
+    get_settings(session).cache_size = cache_size
+    structures, status = src.io.open_rmf(session, fname, background=False)
+    session.models.add(structures)
+    return structures[0], profiling.get_last_profile()
+
+
+def bench_open(fname):
+    session = _make_session()
+    start = time.perf_counter()
+    m, profile = _open(session, fname, 0)
+    return time.perf_counter() - start, _profile_counts(profile)
+
+
+def bench_open_cached(fname):
+    session = _make_session()
+    # Make sure the file is in the cache
+    _open(session, fname, 512)
+    start = time.perf_counter()
+    m, profile = _open(session, fname, 512)
+    return time.perf_counter() - start, _profile_counts(profile)
+
+
+def bench_readtraj(fname):
+    session = _make_session()
+    m, profile = _open(session, fname, 0)
+    state = m.child_models()[0]
+    start = time.perf_counter()
+    src.cmd.readtraj(session, state)
+    elapsed = time.perf_counter() - start
+    counts = _profile_counts(profiling.get_last_profile())
+    counts['coordsets'] = len(state.coordset_ids)
+    return elapsed, counts
+
+
+def _walk_tree_model(model):
+    """Visit every row of a Qt item model, as a fully expanded QTreeView
+       would, and return the number of rows"""
+    rows = 0
+    todo = [QModelIndex()]
+    while todo:
+        parent = todo.pop()
+        for row in range(model.rowCount(parent)):
+            index = model.index(row, 0, parent)
+            model.data(index, 0)
+            model.parent(index)
+            rows += 1
+            todo.append(index)
+    return rows
+
+
+def bench_viewer(fname):
+    session = _make_session()
+    m, profile = _open(session, fname, 0)
+    start = time.perf_counter()
+    viewer = src.tool.RMFViewer(session, "RMF Viewer")
+    tree_model = src.tool._RMFHierarchyModel(m.rmf_hierarchy,
+                                             m._selected_rmf_resolutions)
+    rows = _walk_tree_model(tree_model)
+    elapsed = time.perf_counter() - start
+    return elapsed, {'tree rows': rows,
+                     'model panes': viewer.model_stack.count()}
+
+
+def _snapshot(session, obj, counts):
+    """Recursively snapshot obj, roughly as ChimeraX does when saving
+       a session"""
+    if hasattr(obj, 'take_snapshot') and not isinstance(obj, type):
+        counts['objects saved'] += 1
+        return ('state', type(obj),
+                _snapshot(session, obj.take_snapshot(session, None), counts))
+    elif isinstance(obj, dict):
+        return {k: _snapshot(session, v, counts) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(session, v, counts) for v in obj)
+    else:
+        return obj
+
+
+def _restore(session, data):
+    """Restore data saved by _snapshot()"""
+    if isinstance(data, tuple) and len(data) == 3 and data[0] == 'state':
+        return data[1].restore_snapshot(session, _restore(session, data[2]))
+    elif isinstance(data, dict):
+        return {k: _restore(session, v) for k, v in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return type(data)(_restore(session, v) for v in data)
+    else:
+        return data
+
+
+def bench_session(fname):
+    session = _make_session()
+    m, profile = _open(session, fname, 0)
+    counts = {'objects saved': 0}
+    start = time.perf_counter()
+    saved = pickle.dumps(_snapshot(session, m, counts))
+    _restore(session, pickle.loads(saved))
+    session.triggers.activate_trigger('end restore session', session)
+    return time.perf_counter() - start, counts
+
+
+BENCHMARKS = [('open', bench_open), ('open cached', bench_open_cached),
+              ('readtraj', bench_readtraj), ('viewer', bench_viewer),
+              ('session', bench_session)]
+
+
+def run_case(case, tmpdir, repeat):
+    """Run every benchmark on the given case; return a dict of results"""
+    fname = os.path.join(tmpdir, '%s.rmf3' % case)
+    nbeads = rmfgen.make_rmf_file(fname, **CASES[case])
+    print("%s: %d beads, %d bytes" % (case, nbeads, os.stat(fname).st_size))
+    results = {}
+    for name, bench in BENCHMARKS:
+        times = []
+        for i in range(repeat):
+            elapsed, counts = bench(fname)
+            times.append(elapsed)
+        results[name] = {'time': min(times), 'counts': counts}
+        print("  %-12s %8.3fs" % (name, min(times)))
+    return results
+
+
+def compare(case, results, baseline, tolerance):
+    """Return a list of regressions of results compared to baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if 'time' in base and result['time'] > base['time'] * (1 + tolerance):
+            regressions.append("%s %s: %.3fs (baseline %.3fs)"
+                               % (case, name, result['time'], base['time']))
+        for key, count in sorted(result['counts'].items()):
+            base_count = base['counts'].get(key)
+            if base_count is not None and count > base_count:
+                regressions.append("%s %s: %s %d (baseline %d)"
+                                   % (case, name, key, count, base_count))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark reading of synthetic RMF files")
+    parser.add_argument("cases", nargs="*",
+                        help="cases to run, from %s (default: %s)"
+                        % (", ".join(CASES), " ".join(DEFAULT_CASES)))
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs of each benchmark")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save results, including times, as the "
+                             "new baseline")
+    parser.add_argument("--counts-only", action="store_true",
+                        help="save only counts, not times, in the baseline "
+                             "(as for the baseline in the repository, since "
+                             "times depend on the machine)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed fractional increase in time "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    cases = args.cases or DEFAULT_CASES
+    for case in cases:
+        if case not in CASES:
+            parser.error("unknown case %s" % case)
+
+    profiling.set_enabled(True)
+    try:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+    except FileNotFoundError:
+        baseline = {}
+    all_results = {}
+    regressions = []
+    with utils.temporary_directory() as tmpdir:
+        for case in cases:
+            all_results[case] = run_case(case, tmpdir, args.repeat)
+            regressions.extend(compare(case, all_results[case],
+                                       baseline.get(case, {}),
+                                       args.tolerance))
+    if args.save_baseline:
+        if args.counts_only:
+            for results in all_results.values():
+                for result in results.values():
+                    del result['time']
+        baseline.update(all_results)
+        with open(args.baseline, 'w') as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        print("Saved baseline to %s" % args.baseline)
+    elif regressions:
+        print("Regressions compared to baseline:")
+        for r in regressions:
+            print("  " + r)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark traversal of RMF hierarchies.
+
+Compares the explicit-stack _walk_tree() engine with the recursive
+walkers it replaced, using the resolution filter from the RMF Viewer
+tool and the 'rmf hierarchy' command's HTML output on a wide tree.
+The engine alone is also run on a single chain of nodes, which is far
+deeper than Python's recursion limit.
+
+Run with `python benchmark/bench_traversal.py [number of nodes]`.
+"""
+
+import os
+import sys
+import time
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(TOPDIR, 'test'))
+import utils  # noqa: E402
+utils.set_search_paths(TOPDIR)
+
+import src.io  # noqa: E402
+import src.cmd  # noqa: E402
+
+
+class _Node:
+    __slots__ = ['name', 'children', 'resolution', '_filtered_children']
+
+    def __init__(self, name):
+        self.name = name
+        self.children = []
+        self.resolution = None
+        self._filtered_children = self.children
+
+
+def make_wide_tree(num_nodes, branching=10):
+    """Make a tree of num_nodes nodes, each with up to `branching`
+       children"""
+    nodes = [_Node('root')]
+    for i in range(1, num_nodes):
+        node = _Node('node %d' % i)
+        nodes[(i - 1) // branching].children.append(node)
+        nodes.append(node)
+    return nodes[0]
+
+
+def make_deep_tree(num_nodes):
+    """Make a tree of num_nodes nodes, each the only child of the previous"""
+    root = node = _Node('root')
+    for i in range(1, num_nodes):
+        child = _Node('node %d' % i)
+        node.children.append(child)
+        node = child
+    return root
+
+
+def recursive_filter_resolution(node, resolutions):
+    node._filtered_children = [c for c in node.children
+                               if c.resolution in resolutions]
+    for c in node.children:
+        recursive_filter_resolution(c, resolutions)
+
+
+def walk_filter_resolution(node, resolutions):
+    def visit(node, context):
+        node._filtered_children = [c for c in node.children
+                                   if c.resolution in resolutions]
+        return [(c, None) for c in node.children]
+    src.io._walk_tree([(node, None)], visit)
+
+
+def recursive_print_hierarchy(node, depth, level=0):
+    yield "<li>%s" % node.name
+    if node.children and (depth < 0 or depth > level):
+        yield "<ul>"
+        for child in node.children:
+            for h in recursive_print_hierarchy(child, depth, level + 1):
+                yield h
+        yield "</ul>"
+    yield "</li>"
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    resolutions = set((None,))
+
+    tree = make_wide_tree(num_nodes)
+    print("Wide tree of %d nodes:" % num_nodes)
+    print("  resolution filter, recursive: %.3fs"
+          % timeit(recursive_filter_resolution, tree, resolutions))
+    print("  resolution filter, _walk_tree: %.3fs"
+          % timeit(walk_filter_resolution, tree, resolutions))
+    print("  hierarchy HTML, recursive: %.3fs"
+          % timeit(lambda: list(recursive_print_hierarchy(tree, -1))))
+    print("  hierarchy HTML, _walk_tree: %.3fs"
+          % timeit(src.cmd._print_hierarchy, tree, -1))
+
+    tree = make_deep_tree(num_nodes)
+    print("Deep tree of %d nodes:" % num_nodes)
+    try:
+        recursive_filter_resolution(tree, resolutions)
+    except RecursionError:
+        print("  resolution filter, recursive: RecursionError")
+    print("  resolution filter, _walk_tree: %.3fs"
+          % timeit(walk_filter_resolution, tree, resolutions))
+    print("  hierarchy HTML, _walk_tree: %.3fs"
+          % timeit(src.cmd._print_hierarchy, tree, -1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark creation of ChimeraX atoms when opening RMF files.
+
+Writes a synthetic RMF file (see rmfgen.py), then times opening it with
+atom properties (coordinates, radii, masses, colors and draw modes) set
+one atom at a time, and with ChimeraX's vectorized Atoms setters, and
+reports the speedup of the latter. The cache is not used, so each open
+reads the whole file.
+
+Run with `python benchmark/bench_vectorized.py [--beads N] [--chains N]`.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(TOPDIR, 'test'))
+import utils  # noqa: E402
+utils.set_search_paths(TOPDIR)
+
+import src.io  # noqa: E402
+import rmfgen  # noqa: E402
+
+
+def timed_open(session, fname, vectorized):
+    rl = src.io._RMFLoader(vectorized=vectorized)
+    start = time.perf_counter()
+    rl.load(fname, session)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark vectorized creation of RMF atoms")
+    parser.add_argument("--beads", type=int, default=10000,
+                        help="beads per chain (default: %(default)s)")
+    parser.add_argument("--chains", type=int, default=4,
+                        help="chains (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs of each benchmark")
+    args = parser.parse_args()
+    session = utils.make_session()
+    with utils.temporary_directory() as tmpdir:
+        fname = os.path.join(tmpdir, 'test.rmf3')
+        nbeads = rmfgen.make_rmf_file(fname, beads=args.beads,
+                                      chains=args.chains)
+        print("RMF file of %d beads:" % nbeads)
+        times = {}
+        for vectorized in (False, True):
+            times[vectorized] = min(timed_open(session, fname, vectorized)
+                                    for _ in range(args.repeat))
+        print("  per-atom properties:   %.3fs" % times[False])
+        print("  vectorized properties: %.3fs (speedup %.2fx)"
+              % (times[True], times[False] / times[True]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Generate synthetic RMF files for benchmarking.
+
+Files are written with the copy of RMF included in the bundle, and can
+be scaled up to exercise every part of the reader: multiple states,
+chains and copies of each chain, multiple resolutions (as RMF
+alternatives), features, bonds, segments, reference frames and
+trajectory frames.
+
+Run with `python benchmark/rmfgen.py [options] output.rmf3`, or import
+and call make_rmf_file() from other benchmarks.
+"""
+
+import math
+import os
+import sys
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(TOPDIR, 'test'))
+import utils  # noqa: E402
+utils.set_search_paths(TOPDIR)
+
+RMF = utils.import_rmf_module()
+
+# Residue types, assigned in turn to beads at resolution 1
+RESIDUE_TYPES = ('ALA', 'GLY', 'LEU', 'SER', 'LYS')
+
+
+class _Generator:
+    def __init__(self, r):
+        self.r = r
+        self.particlef = RMF.ParticleFactory(r)
+        self.coloredf = RMF.ColoredFactory(r)
+        self.residuef = RMF.ResidueFactory(r)
+        self.fragmentf = RMF.FragmentFactory(r)
+        self.chainf = RMF.ChainFactory(r)
+        self.copyf = RMF.CopyFactory(r)
+        self.statef = RMF.StateFactory(r)
+        self.resolutionf = RMF.ExplicitResolutionFactory(r)
+        self.altf = RMF.AlternativesFactory(r)
+        self.refframef = RMF.ReferenceFrameFactory(r)
+        self.bondf = RMF.BondFactory(r)
+        self.represf = RMF.RepresentationFactory(r)
+        self.segmentf = RMF.SegmentFactory(r)
+        # (particle, base coordinates) for every particle, so that they
+        # can be moved in subsequent frames
+        self.particles = []
+        # Reference frame decorators, also moved in subsequent frames
+        self.refframes = []
+
+    def add_beads(self, parent, beads, resolution, offset):
+        """Add `beads` beads, each of `resolution` residues, under the
+           given parent node, and return the bead nodes"""
+        nodes = []
+        for i in range(beads):
+            if resolution == 1:
+                n = parent.add_child("bead %d" % i, RMF.REPRESENTATION)
+                r = self.residuef.get(n)
+                r.set_residue_index(i + 1)
+                r.set_residue_type(RESIDUE_TYPES[i % len(RESIDUE_TYPES)])
+            else:
+                first = i * int(resolution) + 1
+                n = parent.add_child("%d-%d" % (first,
+                                                first + int(resolution) - 1),
+                                     RMF.REPRESENTATION)
+                self.fragmentf.get(n).set_residue_indexes(
+                    list(range(first, first + int(resolution))))
+            # Place beads along a helix, one per residue at resolution 1
+            t = (i + 0.5) * resolution
+            coord = (offset[0] + 2.3 * math.cos(t * 1.75),
+                     offset[1] + 2.3 * math.sin(t * 1.75),
+                     offset[2] + 1.5 * t)
+            p = self.particlef.get(n)
+            p.set_mass(110. * resolution)
+            p.set_radius(3. * resolution ** (1. / 3.))
+            p.set_coordinates(RMF.Vector3(*coord))
+            self.coloredf.get(n).set_rgb_color(
+                RMF.Vector3(float(i % 3 == 0), float(i % 3 == 1),
+                            float(i % 3 == 2)))
+            self.particles.append((p, coord))
+            nodes.append(n)
+        return nodes
+
+    def add_chain(self, parent, ichain, icopy, beads, resolutions,
+                  refframes):
+        """Add a chain with the given number of beads at the finest
+           resolution, and return the bead nodes at that resolution"""
+        chain_id = chr(ord('A') + ichain % 26)
+        n = parent.add_child("%s.%d" % (chain_id, icopy), RMF.REPRESENTATION)
+        self.chainf.get(n).set_chain_id(chain_id)
+        self.copyf.get(n).set_copy_index(icopy)
+        offset = (50. * ichain, 50. * icopy, 0.)
+        if refframes:
+            rf = self.refframef.get(n)
+            rf.set_rotation(RMF.Vector4(1., 0., 0., 0.))
+            rf.set_translation(RMF.Vector3(*offset))
+            self.refframes.append((rf, offset))
+            offset = (0., 0., 0.)
+        if len(resolutions) == 1:
+            return self.add_beads(n, beads, resolutions[0], offset)
+        rep = n.add_child("representation", RMF.REPRESENTATION)
+        self.resolutionf.get(rep).set_explicit_resolution(resolutions[0])
+        nodes = self.add_beads(rep, beads, resolutions[0], offset)
+        alt = self.altf.get(rep)
+        for res in resolutions[1:]:
+            root = self.r.add_node("representation %g" % res,
+                                   RMF.REPRESENTATION)
+            self.resolutionf.get(root).set_explicit_resolution(res)
+            self.add_beads(root, max(1, int(beads * resolutions[0] / res)),
+                           res, offset)
+            alt.add_alternative(root, RMF.PARTICLE)
+        return nodes
+
+    def add_bonds(self, parent, nodes, bonds):
+        """Bond up to `bonds` consecutive pairs of the given bead nodes"""
+        for i in range(min(bonds, len(nodes) - 1)):
+            b = self.bondf.get(parent.add_child("bond %d" % i, RMF.BOND))
+            b.set_bonded_0(nodes[i].get_id().get_index())
+            b.set_bonded_1(nodes[i + 1].get_id().get_index())
+
+    def add_segments(self, parent, segments):
+        for i in range(segments):
+            s = self.segmentf.get(parent.add_child("segment %d" % i,
+                                                   RMF.GEOMETRY))
+            s.set_coordinates_list([RMF.Vector3(0., 0., 5. * i),
+                                    RMF.Vector3(10., 0., 5. * i)])
+
+    def add_features(self, parent, nodes, features):
+        """Add features, each a restraint between two of the given nodes"""
+        for i in range(features):
+            n = parent.add_child("feature %d" % i, RMF.FEATURE)
+            p0 = nodes[i % len(nodes)]
+            p1 = nodes[(i * 7 + len(nodes) // 2) % len(nodes)]
+            self.represf.get(n).set_representation([p0.get_id(),
+                                                    p1.get_id()])
+
+    def add_frame(self, iframe):
+        """Add a trajectory frame, with every particle and reference
+           frame slightly moved"""
+        self.r.add_frame("frame %d" % iframe, RMF.FRAME)
+        shift = 0.1 * iframe
+        for p, coord in self.particles:
+            p.set_coordinates(RMF.Vector3(coord[0] + shift, coord[1],
+                                          coord[2]))
+        for rf, offset in self.refframes:
+            rf.set_rotation(RMF.Vector4(1., 0., 0., 0.))
+            rf.set_translation(RMF.Vector3(offset[0], offset[1] + shift,
+                                           offset[2]))
+
+
+def make_rmf_file(fname, beads=1000, chains=1, copies=1, states=1,
+                  resolutions=(1.,), features=0, bonds=0, segments=0,
+                  refframes=False, frames=1):
+    """Write a synthetic RMF file.
+
+       Each of the `states` states contains `chains` chains, each present
+       in `copies` copies, with `beads` beads at the finest of the given
+       `resolutions`. Each further resolution is added as an RMF
+       alternative with proportionally fewer beads. Each state also
+       contains up to `bonds` bonds and `segments` segments, and
+       `features` features link beads in the first state. If `refframes`
+       is True, each chain copy is placed with an RMF reference frame.
+       `frames` is the total number of trajectory frames, in each of
+       which every particle moves slightly.
+
+       Return the number of particles at the finest resolution."""
+    r = RMF.create_rmf_file(fname)
+    r.set_producer("RMF benchmark generator")
+    r.add_frame("frame 0", RMF.FRAME)
+    rn = r.get_root_node()
+    g = _Generator(r)
+    resolutions = sorted(resolutions)
+    first_state_nodes = []
+    for istate in range(states):
+        s = rn.add_child("state %d" % istate, RMF.REPRESENTATION)
+        g.statef.get(s).set_state_index(istate)
+        state_nodes = []
+        for ichain in range(chains):
+            for icopy in range(copies):
+                state_nodes.extend(g.add_chain(s, ichain, icopy, beads,
+                                               resolutions, refframes))
+        g.add_bonds(s, state_nodes, bonds)
+        g.add_segments(s, segments)
+        if istate == 0:
+            first_state_nodes = state_nodes
+    if first_state_nodes:
+        g.add_features(rn, first_state_nodes, features)
+    for iframe in range(1, frames):
+        g.add_frame(iframe)
+    r.flush()
+    return len(first_state_nodes) * states
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic RMF file for benchmarking")
+    parser.add_argument("output", help="RMF file to write")
+    parser.add_argument("--beads", type=int, default=1000,
+                        help="beads per chain at the finest resolution")
+    parser.add_argument("--chains", type=int, default=1)
+    parser.add_argument("--copies", type=int, default=1)
+    parser.add_argument("--states", type=int, default=1)
+    parser.add_argument("--resolutions", default="1",
+                        help="comma-separated list of resolutions")
+    parser.add_argument("--features", type=int, default=0)
+    parser.add_argument("--bonds", type=int, default=0)
+    parser.add_argument("--segments", type=int, default=0)
+    parser.add_argument("--refframes", action="store_true",
+                        help="place each chain with a reference frame")
+    parser.add_argument("--frames", type=int, default=1)
+    args = parser.parse_args()
+    n = make_rmf_file(
+        args.output, beads=args.beads, chains=args.chains,
+        copies=args.copies, states=args.states,
+        resolutions=[float(x) for x in args.resolutions.split(',')],
+        features=args.features, bonds=args.bonds, segments=args.segments,
+        refframes=args.refframes, frames=args.frames)
+    print("Wrote %s with %d beads" % (args.output, n))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,24 @@ class _MyAPI(BundleAPI):
         elif ci.name == "rmf readtraj":
             func = cmd.readtraj
             desc = cmd.readtraj_desc
+        elif ci.name == "rmf settings":
+            func = cmd.settings
+            desc = cmd.settings_desc
+        elif ci.name == "rmf cancel":
+            func = cmd.cancel
+            desc = cmd.cancel_desc
+        elif ci.name == "rmf cache clear":
+            func = cmd.cache_clear
+            desc = cmd.cache_clear_desc
+        elif ci.name == "rmf profile":
+            func = cmd.profile
+            desc = cmd.profile_desc
+        elif ci.name == "rmf openensemble":
+            func = cmd.openensemble
+            desc = cmd.openensemble_desc
+        elif ci.name == "rmf frame":
+            func = cmd.frame
+            desc = cmd.frame_desc
         else:
             raise ValueError(
                 "trying to register unknown command: %s" % ci.name)
@@ -54,7 +72,7 @@ class _MyAPI(BundleAPI):
     @staticmethod
     def get_class(class_name):
         io_classes = frozenset(
-            ('_RMFModel', '_RMFState', '_RMFHierarchyNode',
+            ('_RMFModel', '_RMFState', '_RMFHierarchy', '_RMFHierarchyNode',
              '_RMFFeature', '_RMFProvenance', '_RMFSampleProvenance',
              '_RMFDrawing', '_RMFScriptProvenance',
              '_RMFSoftwareProvenance', '_RMFStructureProvenance',
@@ -0,0 +1,185 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+"""On-disk cache of the information read from RMF files, so that files
+   which have not changed since they were last opened can be reopened
+   without reading (or even opening) the RMF file itself."""
+
+import hashlib
+import json
+import os
+import zipfile
+import numpy
+
+# Increase this whenever the format of the cached data changes
+CACHE_VERSION = 5
+
+# Number of bytes at the start of each RMF file used as its signature
+_SIGNATURE_SIZE = 65536
+
+
+def _encode_meta(obj):
+    """Convert the 'meta' entry of cached data to a form that can be
+       stored as JSON, keeping track of tuples, sets and dicts with
+       non-string keys so that they can be restored by _decode_meta()"""
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    elif isinstance(obj, numpy.generic):
+        return obj.item()
+    elif isinstance(obj, list):
+        return [_encode_meta(x) for x in obj]
+    elif isinstance(obj, tuple):
+        return {'tuple': [_encode_meta(x) for x in obj]}
+    elif isinstance(obj, (set, frozenset)):
+        return {'set': [_encode_meta(x) for x in obj]}
+    elif isinstance(obj, dict):
+        return {'dict': [[_encode_meta(k), _encode_meta(v)]
+                         for k, v in obj.items()]}
+    else:
+        raise TypeError("Cannot cache object of type %s"
+                        % type(obj).__name__)
+
+
+def _decode_meta(obj):
+    """Restore an object converted by _encode_meta()"""
+    if isinstance(obj, list):
+        return [_decode_meta(x) for x in obj]
+    elif isinstance(obj, dict):
+        (kind, value), = obj.items()
+        if kind == 'tuple':
+            return tuple(_decode_meta(x) for x in value)
+        elif kind == 'set':
+            return set(_decode_meta(x) for x in value)
+        elif kind == 'dict':
+            return {_decode_meta(k): _decode_meta(v) for k, v in value}
+        else:
+            raise ValueError("Unknown cached object type %s" % kind)
+    else:
+        return obj
+
+
+class _RMFCache(object):
+    """A directory of cached RMF file contents, each stored as a NumPy
+       .npz file. Once the total size of the cache exceeds `max_size`
+       bytes, the least recently used files are removed."""
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def get_key(self, path, options):
+        """Get the key used to cache the given RMF file. This depends on
+           the file's absolute path, size, modification time and
+           signature (a hash of the start of the file), plus `options`,
+           a tuple of the options used to read the file."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        h = hashlib.sha1()
+        h.update(repr((CACHE_VERSION, path, st.st_size, st.st_mtime_ns,
+                       options)).encode('utf-8'))
+        with open(path, 'rb') as fh:
+            h.update(fh.read(_SIGNATURE_SIZE))
+        return h.hexdigest()
+
+    def _get_filename(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key):
+        """Get the data stored with the given key, as a dict of NumPy
+           arrays, or None if it is not in the cache"""
+        fname = self._get_filename(key)
+        try:
+            # Cache files never contain pickled objects, so loading one
+            # cannot run arbitrary code
+            with numpy.load(fname, allow_pickle=False) as npz:
+                data = dict(npz.items())
+            data['meta'] = _decode_meta(json.loads(
+                data['meta'].tobytes().decode('utf-8')))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, EOFError,
+                zipfile.BadZipFile):
+            # Remove corrupt or unreadable cache files
+            self._remove(fname)
+            return None
+        # Mark the file as recently used
+        os.utime(fname)
+        return data
+
+    def save(self, key, data):
+        """Store the given dict of NumPy arrays with the given key. The
+           'meta' entry can be any combination of None, numbers, strings,
+           lists, tuples, sets and dicts, and is stored as JSON. The cache
+           is only an optimization, so failure to write it (e.g. if the
+           disk is full, or 'meta' contains other objects) is not an
+           error."""
+        data = dict(data)
+        try:
+            meta = json.dumps(_encode_meta(data['meta']))
+        except (TypeError, ValueError):
+            return
+        data['meta'] = numpy.frombuffer(meta.encode('utf-8'),
+                                        dtype=numpy.uint8)
+        fname = self._get_filename(key)
+        # Write to a temporary file first so that other processes never
+        # see a partially-written cache file
+        tmpname = '%s.%d.tmp' % (fname, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmpname, 'wb') as fh:
+                numpy.savez(fh, **data)
+            os.replace(tmpname, fname)
+        except OSError:
+            self._remove(tmpname)
+            return
+        self.evict()
+
+    def _get_files(self):
+        """Get (last used time, size, filename) for each cache file"""
+        try:
+            names = [n for n in os.listdir(self.directory)
+                     if n.endswith('.npz')]
+        except FileNotFoundError:
+            return []
+        files = []
+        for n in names:
+            fname = os.path.join(self.directory, n)
+            try:
+                st = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, fname))
+        return files
+
+    def evict(self):
+        """Remove the least recently used files until the cache is no
+           larger than the maximum size"""
+        files = sorted(self._get_files())
+        total = sum(f[1] for f in files)
+        for mtime, size, fname in files:
+            if total <= self.max_size:
+                break
+            self._remove(fname)
+            total -= size
+
+    def clear(self):
+        """Remove every file from the cache. Return the number removed."""
+        files = self._get_files()
+        for mtime, size, fname in files:
+            self._remove(fname)
+        return len(files)
+
+    def _remove(self, fname):
+        try:
+            os.unlink(fname)
+        except FileNotFoundError:
+            pass
+
+
+def get_cache(session):
+    """Get the cache of RMF files. Caching is disabled if its maximum size
+       (set by the `rmf settings` command) is zero."""
+    from .settings import get_settings
+    from chimerax import app_dirs
+    max_size = get_settings(session).cache_size
+    return _RMFCache(os.path.join(app_dirs.user_cache_dir, 'RMF'),
+                     max(max_size, 0) * 1024 * 1024)
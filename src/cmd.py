@@ -1,9 +1,17 @@
 # vim: set expandtab shiftwidth=4 softtabstop=4:
 
+import collections
+import contextlib
+import os
 import sys
+import threading
+import time
 import numpy
 from chimerax.core.commands import CmdDesc
-from chimerax.core.commands import IntArg, ModelArg
+from chimerax.core.commands import IntArg, ModelArg, BoolArg, StringArg
+from chimerax.core.commands import ListOf
+from chimerax.atomic import Atom
+from .io import _walk_tree, _get_resolutions_arg
 
 
 class _StateSelector:
@@ -17,15 +25,23 @@ class _StateSelector:
         self.seen_states += 1
 
 
-def _print_hierarchy(node, depth, level=0):
-    yield "<li>%s" % node.name
-    if node.children and (depth < 0 or depth > level):
-        yield "<ul>"
-        for child in node.children:
-            for h in _print_hierarchy(child, depth, level + 1):
-                yield h
-        yield "</ul>"
-    yield "</li>"
+def _print_hierarchy(node, depth):
+    def visit(i, level):
+        html.append("<li>%s" % names[name[i]])
+        children = h.get_children(i)
+        if children and (depth < 0 or depth > level):
+            html.append("<ul>")
+            return [(child, level + 1) for child in children]
+
+    def post(i, level):
+        if h.first_child[i] >= 0 and (depth < 0 or depth > level):
+            html.append("</ul>")
+        html.append("</li>")
+    h = node._hierarchy
+    names, name = h.names, h.name
+    html = []
+    _walk_tree([(node._index, 0)], visit, post)
+    return html
 
 
 def _hierarchy_html(model, depth):
@@ -91,25 +107,215 @@ def chains(session, model):
 chains_desc = CmdDesc(required=[("model", ModelArg)])
 
 
+class _RMFStateTrajectory(object):
+    """Reading of the trajectory of a single state by _RMFTrajectoryLoader,
+       one frame at a time"""
+
+    def __init__(self, model, state, state_node, order, coords):
+        self.state, self.state_node = state, state_node
+        self.order, self.coords = order, coords
+        self.state_index = state_node.get_index()
+        # If a previous read found that no particle moves, every frame
+        # has the same coordinates, so only the first need be read
+        self.known_static = self.state_index in model._rmf_static_states
+        #: True until a frame is read that differs from the first
+        self.static = True
+        self._first_coords = None
+
+    def read(self, RMF, r):
+        """Read the coordinates of the state in the file's current frame"""
+        RMF.get_all_global_coordinates(r, self.state_node, self.coords)
+        if self._first_coords is None:
+            self._first_coords = self.coords.copy()
+        elif self.static:
+            self.static = numpy.array_equal(self.coords, self._first_coords)
+
+    def add_coordset(self, nframe, coords=None):
+        """Add the coordinates last read (or the given coordinates of every
+           particle under the state node) as the coordset for a frame"""
+        if coords is None:
+            coords = self.coords
+        self.state.add_coordset(nframe + 1, coords if self.order is None
+                                else coords[self.order])
+
+
+def _read_frames_shared(path, buffer, node_indexes, columns, frames, rows,
+                        shm_name, shape):
+    """Read the given frames of an RMF file into rows of an array in
+       shared memory, of the given shape, for _RMFTrajectoryLoader in
+       parallel mode. The coordinates of the particles under each node go
+       in the corresponding (start, end) range of columns. Return the number
+       of frames read. This is run in a worker process, so opens the file
+       itself."""
+    if sys.platform == 'darwin':
+        from .mac import RMF
+    elif sys.platform == 'linux':
+        from .linux import RMF
+    else:
+        from .windows import RMF
+    from multiprocessing import shared_memory
+    from .io import _open_rmf_handle
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        coords = numpy.ndarray(shape, dtype=numpy.float64, buffer=shm.buf)
+        r = _open_rmf_handle(RMF, path, buffer)
+        nodes = [r.get_node(RMF.NodeID(i)) for i in node_indexes]
+        for row, nframe in zip(rows, frames):
+            r.set_current_frame(RMF.FrameID(nframe))
+            for node, (start, end) in zip(nodes, columns):
+                RMF.get_all_global_coordinates(r, node,
+                                               coords[row, start:end])
+    finally:
+        # Views of the shared memory must go before it can be closed
+        coords = None
+        shm.close()
+    return len(frames)
+
+
+class _RMFFrameReader(object):
+    """Read the coordinates of one state's atoms from an RMF file, a frame
+       at a time, with its own file handle. Only the RMF library is used,
+       not any ChimeraX object, so this can be used in a worker thread.
+       Get one with _RMFTrajectoryLoader.get_frame_reader()."""
+
+    def __init__(self, path, buffer, node_index, order, numparticles):
+        self.path, self.buffer = path, buffer
+        self.node_index, self.order = node_index, order
+        self._coords = numpy.empty((numparticles, 3))
+        self._rmf = self._node = None
+
+    def read(self, nframe, out):
+        """Read the coordinates in the given frame into the array `out`"""
+        if sys.platform == 'darwin':
+            from .mac import RMF
+        elif sys.platform == 'linux':
+            from .linux import RMF
+        else:
+            from .windows import RMF
+        if self._rmf is None:
+            from .io import _open_rmf_handle
+            self._rmf = _open_rmf_handle(RMF, self.path, self.buffer)
+            self._node = self._rmf.get_node(RMF.NodeID(self.node_index))
+        self._rmf.set_current_frame(RMF.FrameID(nframe))
+        if self.order is None:
+            RMF.get_all_global_coordinates(self._rmf, self._node, out)
+        else:
+            RMF.get_all_global_coordinates(self._rmf, self._node,
+                                           self._coords)
+            numpy.take(self._coords, self.order, axis=0, out=out)
+
+    def close(self):
+        self._rmf = self._node = None
+
+
 class _RMFTrajectoryLoader:
     def __init__(self):
-        pass
+        #: If set, an _RMFProfile in which to record each phase of loading
+        self.profile = None
+        #: Number of worker processes to read trajectory frames with;
+        #: if more than one, the frames are split between them
+        self.processes = 1
 
     def load(self, state, first, last, step):
+        """Read frames `first` through `last` (inclusive, or the last frame
+           in the file if None) in steps of `step` into coordsets of the
+           given _RMFState. The RMF file handle, decorator factories and
+           state node are taken from the model's pool of handles if
+           possible. Return the number of frames read."""
+        return self.load_states([state], first, last, step)
+
+    def load_states(self, states, first, last, step):
+        """Read frames into coordsets of each of the given _RMFStates, all
+           of which must be from the same _RMFModel, as for load(). Each
+           frame is read from the file only once, for all of the states."""
+        if sys.platform == 'darwin':
+            from .mac import RMF
+        elif sys.platform == 'linux':
+            from .linux import RMF
+        else:
+            from .windows import RMF
+        if not states:
+            return 0
+        with self._get_handle(RMF, states[0]) as h:
+            return self._load(RMF, h, states[0].parent, states, first, last,
+                              step)
+
+    def read_frame(self, state, nframe, out=None):
+        """Read a single frame from the RMF file, and return the
+           coordinates of the given _RMFState's atoms in that frame.
+           If `out` is given, it is a NumPy array of the right shape
+           which the coordinates are read into."""
         if sys.platform == 'darwin':
             from .mac import RMF
         elif sys.platform == 'linux':
             from .linux import RMF
         else:
             from .windows import RMF
+        with self._get_handle(RMF, state) as h:
+            r = h.rmf_file
+            numframes = r.get_number_of_frames()
+            if not 0 <= nframe < numframes:
+                raise ValueError("Cannot read frame %d; the file has %d "
+                                 "frame%s" % (nframe, numframes,
+                                              "" if numframes == 1 else "s"))
+            state_node, order, coords = self._find_state(RMF, h, state.parent,
+                                                         state)
+            if out is not None and order is None:
+                coords = out
+            start = time.perf_counter_ns()
+            r.set_current_frame(RMF.FrameID(nframe))
+            RMF.get_all_global_coordinates(r, state_node, coords)
+            self._record('read frames', start, 1)
+            if order is None:
+                return coords
+            else:
+                return numpy.take(coords, order, axis=0, out=out)
 
+    def get_frame_reader(self, state):
+        """Get an _RMFFrameReader for the given _RMFState. This looks at
+           ChimeraX objects, so must be called from the main thread, but
+           the reader itself can then be used from any thread."""
+        if sys.platform == 'darwin':
+            from .mac import RMF
+        elif sys.platform == 'linux':
+            from .linux import RMF
+        else:
+            from .windows import RMF
         model = state.parent
-        istate = model.child_models().index(state)
-        r = RMF.open_rmf_file_read_only(model.rmf_filename)
-        self.statef = RMF.StateConstFactory(r)
-        self.particlef = RMF.ParticleConstFactory(r)
-        self.ballf = RMF.BallConstFactory(r)
+        with self._get_handle(RMF, state) as h:
+            state_node, order, coords = self._find_state(RMF, h, model,
+                                                         state)
+            # Compressed files are decompressed when first opened, so get
+            # the buffer only once the handle has been acquired
+            return _RMFFrameReader(model.rmf_filename, model._rmf_buffer,
+                                   state_node.get_index(), order, len(coords))
 
+    @contextlib.contextmanager
+    def _get_handle(self, RMF, state):
+        """Get an _RMFFileHandle of the state's RMF file from the model's
+           pool, and give it back to the pool afterwards"""
+        pool = state.parent._rmf_handles
+        start = time.perf_counter_ns()
+        h = pool.acquire(RMF)
+        # Only a handle that has not been used before was just opened
+        if h.last_used is None:
+            self._record('open file', start)
+        self.statef = h.statef
+        self.particlef = h.particlef
+        self.ballf = h.ballf
+        self.iparticlef = h.iparticlef
+        self.represf = h.represf
+        self.altf = h.altf
+        self.PARTICLE = RMF.PARTICLE
+        self.GAUSSIAN_PARTICLE = RMF.GAUSSIAN_PARTICLE
+        self.PROVENANCE = RMF.PROVENANCE
+        try:
+            yield h
+        finally:
+            pool.release(h)
+
+    def _load(self, RMF, h, model, states, first, last, step):
+        r = h.rmf_file
         numframes = r.get_number_of_frames()
         if last is None or last >= numframes:
             last = numframes - 1
@@ -117,14 +323,165 @@ class _RMFTrajectoryLoader:
         if len(frames_to_read) == 0:
             return 0
 
-        state_node = self._get_state_node(r, istate)
-        coords = numpy.empty((len(state.atoms), 3))
-        for nframe in frames_to_read:
-            r.set_current_frame(RMF.FrameID(nframe))
-            RMF.get_all_global_coordinates(r, state_node, coords)
-            state.add_coordset(nframe + 1, coords)
+        trajs = [_RMFStateTrajectory(model, state,
+                                     *self._find_state(RMF, h, model, state))
+                 for state in states]
+        start = time.perf_counter_ns()
+        if self.processes > 1 and len(frames_to_read) > 1:
+            frames_read = self._load_parallel(RMF, h, model, trajs,
+                                              frames_to_read)
+        else:
+            frames_read = self._load_serial(RMF, r, trajs, frames_to_read)
+        if len(frames_to_read) == numframes > 1:
+            model._rmf_static_states.update(t.state_index for t in trajs
+                                            if t.static)
+        self._record('read frames', start, frames_read)
         return len(frames_to_read)
 
+    def _load_serial(self, RMF, r, trajs, frames_to_read):
+        """Read each frame in turn in this process, and return the number
+           of frames read from the file"""
+        frames_read = 0
+        for i, nframe in enumerate(frames_to_read):
+            to_read = [t for t in trajs if i == 0 or not t.known_static]
+            # Move to each frame only once, for all states
+            if to_read:
+                r.set_current_frame(RMF.FrameID(nframe))
+                frames_read += 1
+            for t in to_read:
+                t.read(RMF, r)
+            for t in trajs:
+                t.add_coordset(nframe)
+        return frames_read
+
+    def _load_parallel(self, RMF, h, model, trajs, frames_to_read):
+        """Split the frames between `processes` worker processes, each of
+           which reads its frames into a single array in shared memory, and
+           add coordsets from that array. Return the number of frames read
+           from the file."""
+        import concurrent.futures
+        from multiprocessing import shared_memory
+        frames_read = 0
+        static = [t for t in trajs if t.known_static]
+        moving = [t for t in trajs if not t.known_static]
+        if static:
+            # Only the first frame of states known not to move need be read
+            h.rmf_file.set_current_frame(RMF.FrameID(frames_to_read[0]))
+            frames_read += 1
+            for t in static:
+                t.read(RMF, h.rmf_file)
+                for nframe in frames_to_read:
+                    t.add_coordset(nframe)
+        if not moving:
+            return frames_read
+
+        ends = numpy.cumsum([len(t.coords) for t in moving])
+        columns = [(int(end) - len(t.coords), int(end))
+                   for t, end in zip(moving, ends)]
+        shape = (len(frames_to_read), int(ends[-1]), 3)
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(1, int(numpy.prod(shape)) * 8))
+        try:
+            coords = numpy.ndarray(shape, dtype=numpy.float64,
+                                   buffer=shm.buf)
+            processes = min(self.processes, len(frames_to_read))
+            rows = numpy.array_split(numpy.arange(len(frames_to_read)),
+                                     processes)
+            frames = numpy.array(frames_to_read)
+            node_indexes = [t.state_index for t in moving]
+            with concurrent.futures.ProcessPoolExecutor(processes) as ex:
+                futures = [ex.submit(_read_frames_shared, model.rmf_filename,
+                                     model._rmf_buffer, node_indexes,
+                                     columns, frames[chunk].tolist(),
+                                     chunk.tolist(), shm.name, shape)
+                           for chunk in rows]
+                frames_read += sum(f.result() for f in futures)
+            for t, (begin, end) in zip(moving, columns):
+                tcoords = coords[:, begin:end]
+                t.static = bool((tcoords == tcoords[0]).all())
+                for i, nframe in enumerate(frames_to_read):
+                    t.add_coordset(nframe, tcoords[i])
+        finally:
+            # Views of the shared memory must go before it can be closed
+            coords = tcoords = None
+            shm.close()
+            shm.unlink()
+        return frames_read
+
+    def _find_state(self, RMF, h, model, state):
+        """Find the RMF node for the given state, using the handle's
+           record of earlier searches if possible. Return the node, the
+           order of the state's atoms in the coordinates of the node's
+           particles (or None if they are the same), and an array to read
+           those coordinates into."""
+        r = h.rmf_file
+        start = time.perf_counter_ns()
+        key = None
+        for index, s in model._rmf_states.items():
+            if s is state:
+                key = ('state node', index)
+        if key is None:
+            istate = model.child_models().index(state)
+            key = ('unnamed state node', istate)
+        state_node = h.found.get(key)
+        if state_node is None:
+            if key[0] == 'state node':
+                state_node = r.get_node(RMF.NodeID(key[1]))
+            else:
+                state_node = self._get_state_node(r, key[1])
+            h.found[key] = state_node
+        if model._rmf_read_resolutions is None:
+            # Every particle under the state node has a ChimeraX atom
+            order = None
+            coords = numpy.empty((len(state.atoms), 3))
+        else:
+            # Only some particles were read, so pick those out of the
+            # coordinates of all particles. More atoms may have been read
+            # since the order was last found, so check their number too.
+            key = ('atom order', state_node.get_index(), len(state.atoms))
+            if key not in h.found:
+                h.found[key] = self._get_atom_order(model, state, state_node)
+            order, numparticles = h.found[key]
+            coords = numpy.empty((numparticles, 3))
+        self._record('find state', start)
+        return state_node, order, coords
+
+    def _record(self, phase, start, objects=0):
+        """Record the time since `start` (from time.perf_counter_ns())
+           for the given phase, if profiling"""
+        if self.profile is not None:
+            self.profile.add(phase, time.perf_counter_ns() - start, objects)
+
+    def _get_atom_order(self, model, state, state_node):
+        """Get the index of each atom in the given state in the list of
+           coordinates of all particles under the state node (the order used
+           by RMF.get_all_global_coordinates), plus the number of particles.
+           This is needed if not all particles were read."""
+        def visit_rmf(node, context):
+            if (self.represf.get_is(node)
+                    or node.get_type() == self.PROVENANCE):
+                return
+            if self.iparticlef.get_is(node) or self.ballf.get_is(node):
+                particle_index[node.get_index()] = len(particle_index)
+            children = list(node.get_children())
+            if self.altf.get_is(node):
+                alt = self.altf.get(node)
+                children.extend(list(alt.get_alternatives(self.PARTICLE))[1:])
+                children.extend(alt.get_alternatives(self.GAUSSIAN_PARTICLE))
+            return [(child, None) for child in children]
+
+        particle_index = {}
+        _walk_tree([(state_node, None)], visit_rmf)
+        h = model.rmf_hierarchy._hierarchy
+        node_rmf_index = h.rmf_index
+        rmf_index = {}
+        for i, obj in h.get_node_objects():
+            if isinstance(obj, Atom) and obj.structure is state:
+                rmf_index[obj] = int(node_rmf_index[i])
+        order = numpy.array([particle_index[rmf_index[a]]
+                             for a in state.atoms], dtype=numpy.intp)
+        return order, len(particle_index)
+
     def _get_state_node(self, r, istate):
         """Return the RMF node corresponding to the istate'th state"""
         def _check_node(node, root, statesel):
@@ -148,17 +505,281 @@ class _RMFTrajectoryLoader:
         return c
 
 
-def readtraj(session, model, first=0, last=None, step=1):
-    if (not hasattr(model, 'atoms') or model.parent is None
-            or not hasattr(model.parent, 'rmf_filename')):
+# Default maximum size, in megabytes, of the frames of a streamed
+# trajectory kept in memory
+_DEFAULT_STREAM_CACHE_SIZE = 1024
+
+# Default number of upcoming frames of a streamed trajectory to read ahead
+# of time, and the number of frames that can be held while waiting to be
+# shown
+_DEFAULT_PREFETCH = 8
+_DEFAULT_PREFETCH_BUFFER = 16
+
+
+class _RMFFrameCache(object):
+    """Coordinates of recently read trajectory frames, keyed by frame index.
+       Once their total size exceeds `max_size` bytes, the least recently
+       used frames are dropped."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        #: Total size, in bytes, of all frames in the cache
+        self.size = 0
+        self._frames = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, nframe):
+        return nframe in self._frames
+
+    def get(self, nframe):
+        """Get the coordinates of the given frame, or None"""
+        coords = self._frames.get(nframe)
+        if coords is not None:
+            self._frames.move_to_end(nframe)
+        return coords
+
+    def clear(self):
+        self._frames.clear()
+        self.size = 0
+
+    def add(self, nframe, coords):
+        old = self._frames.pop(nframe, None)
+        if old is not None:
+            self.size -= old.nbytes
+        self._frames[nframe] = coords
+        self.size += coords.nbytes
+        while self.size > self.max_size:
+            nframe, coords = self._frames.popitem(last=False)
+            self.size -= coords.nbytes
+
+
+class _RMFFramePrefetcher(object):
+    """Read upcoming frames of a _RMFTrajectoryStream in a worker thread,
+       with its own RMF file handle, into a ring of `size` preallocated
+       coordinate arrays, so that showing them later needs only a copy.
+       Use request() to set the frames to read."""
+
+    def __init__(self, stream, size):
+        self.stream = stream
+        # Everything the worker thread needs from ChimeraX objects is
+        # found here, in the main thread
+        self._reader = stream.loader.get_frame_reader(stream.state)
+        natoms = len(stream.state.atoms)
+        self._ring = numpy.empty((size, natoms, 3))
+        # The frame held in each slot of the ring, or None
+        self._slot_frame = [None] * size
+        # The next slot to reuse
+        self._next_slot = 0
+        # Frames to read, most urgent first
+        self._wanted = []
+        self._stopped = False
+        #: The exception that stopped the worker thread, if any
+        self.error = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get(self, nframe):
+        """Get a copy of the coordinates of the given frame if it has
+           been read, otherwise None"""
+        with self._cond:
+            if nframe in self._slot_frame:
+                return self._ring[self._slot_frame.index(nframe)].copy()
+
+    def request(self, frames):
+        """Read the given frames (most urgent first), at most one ring's
+           worth, replacing any earlier request"""
+        with self._cond:
+            self._wanted = list(frames)[:len(self._slot_frame)]
+            self._cond.notify()
+
+    def wait(self):
+        """Wait until all requested frames have been read"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._stopped
+                                or self._get_work() is None)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _get_work(self):
+        """Get the next frame to read, and the slot to read it into,
+           or None if there is nothing to do"""
+        todo = [f for f in self._wanted if f not in self._slot_frame]
+        if not todo:
+            return None
+        size = len(self._slot_frame)
+        for i in range(size):
+            slot = (self._next_slot + i) % size
+            if self._slot_frame[slot] not in self._wanted:
+                return todo[0], slot
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stopped
+                                        or self._get_work() is not None)
+                    if self._stopped:
+                        return
+                    nframe, slot = self._get_work()
+                    self._slot_frame[slot] = None
+                    self._next_slot = (slot + 1) % len(self._slot_frame)
+                self._reader.read(nframe, self._ring[slot])
+                with self._cond:
+                    self._slot_frame[slot] = nframe
+                    self._cond.notify_all()
+        except Exception as e:
+            # Frames will be read in the main thread instead
+            self.error = e
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+        finally:
+            self._reader.close()
+
+
+class _RMFTrajectoryStream(object):
+    """The trajectory of an RMF state, read from the file one frame at a
+       time when that frame is shown, rather than all at once into
+       coordsets. Recently shown frames are kept in a _RMFFrameCache.
+       If `prefetch` is nonzero, that many of the frames that follow
+       the one shown (in the direction of the last change of frame) are
+       read ahead of time by a _RMFFramePrefetcher with a ring of
+       `prefetch_buffer` frames."""
+
+    def __init__(self, state, frames, cache_size, prefetch=0,
+                 prefetch_buffer=0):
+        self.state = state
+        #: The frames that can be shown, as a range
+        self.frames = frames
+        self.cache = _RMFFrameCache(cache_size)
+        self.loader = _RMFTrajectoryLoader()
+        #: The frame currently shown, if any
+        self.current_frame = None
+        self.prefetch = prefetch
+        self.prefetch_buffer = max(prefetch_buffer, prefetch)
+        #: The _RMFFramePrefetcher, once a frame has been shown
+        self.prefetcher = None
+        # +1 if the frame shown last moved forwards, -1 if backwards
+        self._direction = 1
+
+    def close(self):
+        """Stop reading frames ahead of time"""
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
+    def atoms_changed(self):
+        """Forget every frame read so far, as atoms were added to the
+           state. Frames (and the prefetcher's ring) are read again with
+           the new number of atoms when next needed."""
+        self.close()
+        self.cache.clear()
+
+    def get_coords(self, nframe):
+        """Get the coordinates of the state's atoms in the given frame"""
+        coords = self.cache.get(nframe)
+        if coords is None and self.prefetcher is not None:
+            coords = self.prefetcher.get(nframe)
+            if coords is not None:
+                self.cache.add(nframe, coords)
+        if coords is None:
+            coords = self.loader.read_frame(self.state, nframe)
+            self.cache.add(nframe, coords)
+        return coords
+
+    def show(self, nframe):
+        """Move the state's atoms to their positions in the given frame"""
+        self.state.atoms.coords = self.get_coords(nframe)
+        if self.current_frame is not None and nframe != self.current_frame:
+            self._direction = 1 if nframe > self.current_frame else -1
+        self.current_frame = nframe
+        if self.prefetch > 0:
+            self._prefetch(nframe)
+
+    def _prefetch(self, nframe):
+        """Start reading the frames that are likely to be shown next"""
+        if self.prefetcher is None:
+            self.prefetcher = _RMFFramePrefetcher(self, self.prefetch_buffer)
+        if self.prefetcher.error is not None:
+            return
+        pos = self.frames.index(nframe)
+        upcoming = [self.frames[pos + self._direction * i]
+                    for i in range(1, self.prefetch + 1)
+                    if 0 <= pos + self._direction * i < len(self.frames)]
+        # Frames already in the cache need not be read again
+        self.prefetcher.request(f for f in upcoming if f not in self.cache)
+
+
+def _is_rmf_state(model):
+    return (hasattr(model, 'atoms') and model.parent is not None
+            and hasattr(model.parent, 'rmf_filename'))
+
+
+def _get_rmf_states(model, states):
+    """Get the RMF states of the given top-level RMF model (all of them,
+       or only those with the given state indexes, as for the `states`
+       option to `open`)"""
+    from .io import _RMFState
+    if states is None:
+        return [m for m in model.child_models() if isinstance(m, _RMFState)]
+    by_index = {model._rmf_state_indexes[ind]: state
+                for ind, state in model._rmf_states.items()
+                if ind in model._rmf_state_indexes and not state.was_deleted}
+    unknown = sorted(set(i for i in states if i not in by_index))
+    if unknown:
+        from chimerax.core.errors import UserError
+        raise UserError("%s has no state%s %s read from the RMF file"
+                        % (model, "" if len(unknown) == 1 else "s",
+                           ", ".join(str(i) for i in unknown)))
+    return [by_index[i] for i in dict.fromkeys(states)]
+
+
+def readtraj(session, model, first=0, last=None, step=1, stream=False,
+             cache_size=_DEFAULT_STREAM_CACHE_SIZE,
+             prefetch=_DEFAULT_PREFETCH,
+             prefetch_buffer=_DEFAULT_PREFETCH_BUFFER, states=None,
+             processes=1):
+    if hasattr(model, 'rmf_filename'):
+        # Read the trajectory of several states of a top-level RMF model
+        rmf_model = model
+        rmf_states = _get_rmf_states(model, states)
+    elif _is_rmf_state(model):
+        rmf_model = model.parent
+        rmf_states = [model]
+    else:
         print("%s does not look like an RMF state" % model)
         return
+    if stream:
+        for state in rmf_states:
+            _stream_traj(session, state, first, last, step, cache_size,
+                         prefetch, prefetch_buffer)
+        return
+    from . import profiling
     t = _RMFTrajectoryLoader()
-    numframes = t.load(model, first, last, step)
-    if numframes:
+    t.profile = profiling.new_profile('readtraj', rmf_model.rmf_filename)
+    t.processes = processes
+    cprofile = profiling.start_cprofile()
+    try:
+        numframes = t.load_states(rmf_states, first, last, step)
+    finally:
+        profiling.finish(t.profile, cprofile)
+    if numframes and len(rmf_states) > 1:
+        session.logger.info(
+            "Read %d frames into coordsets of %d states; use "
+            "'coordset slider %s' to view"
+            % (numframes, len(rmf_states),
+               ' '.join('#' + s.id_string for s in rmf_states)))
+    elif numframes:
         session.logger.info(
             "Read %d frames into coordset; use 'coordset slider #%s' to view"
-            % (numframes, model.id_string))
+            % (numframes, rmf_states[0].id_string))
     else:
         session.logger.warning("No frames were read")
 
@@ -166,4 +787,171 @@ def readtraj(session, model, first=0, last=None, step=1):
 readtraj_desc = CmdDesc(required=[("model", ModelArg)],
                         optional=[("first", IntArg),
                                   ("last", IntArg),
-                                  ("step", IntArg)])
+                                  ("step", IntArg)],
+                        keyword=[("stream", BoolArg),
+                                 ("cache_size", IntArg),
+                                 ("prefetch", IntArg),
+                                 ("prefetch_buffer", IntArg),
+                                 ("states", ListOf(IntArg)),
+                                 ("processes", IntArg)])
+
+
+def _stream_traj(session, model, first, last, step, cache_size, prefetch,
+                 prefetch_buffer):
+    if sys.platform == 'darwin':
+        from .mac import RMF
+    elif sys.platform == 'linux':
+        from .linux import RMF
+    else:
+        from .windows import RMF
+    pool = model.parent._rmf_handles
+    h = pool.acquire(RMF)
+    try:
+        numframes = h.rmf_file.get_number_of_frames()
+    finally:
+        pool.release(h)
+    if last is None or last >= numframes:
+        last = numframes - 1
+    frames = range(first, last + 1, step)
+    if len(frames) == 0:
+        session.logger.warning("No frames were read")
+        return
+    if model._rmf_stream is not None:
+        model._rmf_stream.close()
+    model._rmf_stream = _RMFTrajectoryStream(
+        model, frames, max(cache_size, 0) * 1024 * 1024,
+        max(prefetch, 0), prefetch_buffer)
+    session.logger.info(
+        "%d frames will be read on demand; use 'rmf frame #%s' to view"
+        % (len(frames), model.id_string))
+
+
+def frame(session, model, index=None):
+    if not _is_rmf_state(model):
+        print("%s does not look like an RMF state" % model)
+        return
+    stream = model._rmf_stream
+    if stream is None:
+        # Stream the entire trajectory with the default cache size
+        _stream_traj(session, model, 0, None, 1, _DEFAULT_STREAM_CACHE_SIZE,
+                     _DEFAULT_PREFETCH, _DEFAULT_PREFETCH_BUFFER)
+        stream = model._rmf_stream
+        if stream is None:
+            return
+    if index is None:
+        frames, cache = stream.frames, stream.cache
+        current = stream.current_frame
+        session.logger.info(
+            "Showing frame %d of frames %d-%d (step %d); %d frame%s "
+            "(%.1f MB) in memory"
+            % (model.parent._rmf_frame if current is None else current,
+               frames[0], frames[-1], frames.step, len(cache),
+               "" if len(cache) == 1 else "s", cache.size / 1024. / 1024.))
+        return
+    if index not in stream.frames:
+        session.logger.warning("Frame %d is not in the trajectory" % index)
+        return
+    stream.show(index)
+
+
+frame_desc = CmdDesc(required=[("model", ModelArg)],
+                     optional=[("index", IntArg)])
+
+
+def openensemble(session, files, resolution=None, states=None, combine=False,
+                 processes=None):
+    import glob
+    from .io import open_rmf_ensemble
+    paths = sorted(glob.glob(os.path.expanduser(files)))
+    if not paths:
+        session.logger.warning("No files match %s" % files)
+        return []
+    models, status = open_rmf_ensemble(
+        session, paths, resolution=resolution, states=states,
+        combine=combine, processes=processes)
+    session.models.add(models)
+    session.logger.info(status)
+    return models
+
+
+openensemble_desc = CmdDesc(required=[("files", StringArg)],
+                            keyword=[("resolution", _get_resolutions_arg()),
+                                     ("states", ListOf(IntArg)),
+                                     ("combine", BoolArg),
+                                     ("processes", IntArg)])
+
+
+def settings(session, resolution=None, background=None, cache_size=None):
+    from .settings import get_settings
+    s = get_settings(session)
+    if resolution == 'all':
+        s.resolutions = None
+    elif resolution == 'coarsest':
+        s.resolutions = resolution
+    elif resolution is not None:
+        s.resolutions = sorted(float(r) for r in resolution)
+    if background is not None:
+        s.background = background
+    if cache_size is not None:
+        s.cache_size = max(cache_size, 0)
+    if s.resolutions is None:
+        res = "all"
+    elif s.resolutions == 'coarsest':
+        res = "coarsest"
+    else:
+        res = ", ".join("%.1f" % r for r in s.resolutions)
+    session.logger.info("Resolutions read by default from RMF files: %s\n"
+                        "Read RMF files in the background: %s\n"
+                        "Maximum size of the RMF cache: %s"
+                        % (res, "yes" if s.background else "no",
+                           "%d MB" % s.cache_size if s.cache_size
+                           else "disabled"))
+
+
+settings_desc = CmdDesc(keyword=[("resolution", _get_resolutions_arg()),
+                                 ("background", BoolArg),
+                                 ("cache_size", IntArg)])
+
+
+def cache_clear(session):
+    from .cache import get_cache
+    n = get_cache(session).clear()
+    session.logger.info("Removed %d file%s from the RMF cache"
+                        % (n, "" if n == 1 else "s"))
+
+
+cache_clear_desc = CmdDesc()
+
+
+def cancel(session):
+    from .io import _RMFBackgroundLoad
+    loads = [load for load in _RMFBackgroundLoad.active
+             if load.session is session]
+    for load in loads:
+        load.cancel()
+    if loads:
+        session.logger.info("Cancelled reading of %s"
+                            % ", ".join(load.name for load in loads))
+    else:
+        session.logger.warning("No RMF files are being read")
+
+
+cancel_desc = CmdDesc()
+
+
+def profile(session, enable=None):
+    from . import profiling
+    if enable is not None:
+        profiling.set_enabled(enable)
+        session.logger.info("Profiling of RMF file reads %s"
+                            % ("enabled" if enable else "disabled"))
+        return
+    p = profiling.get_last_profile()
+    if p is None:
+        session.logger.warning("No RMF profile has been recorded; use "
+                               "'rmf profile true' to enable profiling")
+    else:
+        session.logger.info(p.get_html(), is_html=True)
+
+
+profile_desc = CmdDesc(optional=[("enable", BoolArg)])
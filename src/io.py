@@ -1,1179 +1,3465 @@
-# vim: set expandtab shiftwidth=4 softtabstop=4:
-
-import numpy
-import os.path
-import sys
-import weakref
-import copy
-
-from chimerax.atomic import Atom, Atoms, Bond, Pseudobond
-from chimerax.core.state import State
-from chimerax.core.models import Model
-from chimerax.atomic import Structure, AtomicStructure, AtomicShapeDrawing
-
-
-class _MockRMFNode:
-    __slots__ = ['name', 'rmf_index']
-
-    def __init__(self, data):
-        self.name, self.rmf_index = data['name'], data['rmf_index']
-
-    def get_name(self):
-        return self.name
-
-    def get_index(self):
-        return self.rmf_index
-
-
-try:
-    import chimerax.open_command
-
-    class RMFOpenerInfo(chimerax.open_command.OpenerInfo):
-        def open(self, session, data, file_name, **kw):
-            return open_rmf(session, data)
-except ImportError:
-    pass
-
-
-def open_rmf(session, path):
-    """Read an RMF file from a named file.
-
-    Returns the 2-tuple return value appropriate for the
-    ``chimerax.core.toolshed.BundleAPI.open_file`` method.
-    """
-    rl = _RMFLoader()
-    r, structures = rl.load(path, session)
-
-    numframes = r.get_number_of_frames()
-    producer = r.get_producer()
-    status = ("Opened RMF file%s with %d frame%s."
-              % (" produced with %s," % producer if producer else "",
-                 numframes, "" if numframes == 1 else "s"))
-    if structures[0]._rmf_resolutions:
-        status += (" Representation read at the following resolutions: %s."
-                   % ", ".join("%.1f" % i for i in
-                               sorted(structures[0]._rmf_resolutions)))
-    if numframes > 1:
-        status += (" Only the first frame was read; to read additional "
-                   "frames, use the 'rmf readtraj' command.")
-    if session.ui.is_gui:
-        from chimerax.core.commands import run
-        run(session, 'tool show "RMF Viewer"', log=False)
-    return structures, status
-
-
-class _RMFState(AtomicStructure):
-    """Representation of structure corresponding to a single RMF state"""
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._features = None
-        # Assume the structure is atomic until we encounter coordinates without
-        # atomic information
-        self._atomic = True
-
-    def take_snapshot(self, session, flags):
-        data = {'version': 1,
-                'atomic structure state':
-                    AtomicStructure.take_snapshot(self, session, flags)}
-        return data
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFState(session, auto_style=False, log_info=False)
-        s.set_state_from_snapshot(session, data)
-        return s
-
-    def set_state_from_snapshot(self, session, data):
-        AtomicStructure.set_state_from_snapshot(
-            self, session, data['atomic structure state'])
-
-    def _add_pseudobond(self, atoms):
-        f = self._get_features()
-        b = f.new_pseudobond(*atoms)
-        b.halfbond = False
-        return b
-
-    def _get_features(self):
-        """Get the pseudobond group used to display RMF features"""
-        if self._features is None:
-            self._features = self.pseudobond_group("Features")
-        return self._features
-
-    def apply_auto_styling(self, *args, **kwargs):
-        # Only apply auto styling for truly atomic structures
-        if self._atomic:
-            super().apply_auto_styling(*args, **kwargs)
-
-
-class _RMFDrawing(Structure):
-    """Representation of RMF geometry"""
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._drawing = AtomicShapeDrawing('geometry')
-        self.add_drawing(self._drawing)
-
-    def take_snapshot(self, session, flags):
-        data = {'version': 1,
-                'drawing': self._drawing,
-                'structure state':
-                    Structure.take_snapshot(self, session, flags)}
-        return data
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFDrawing(session)
-        s.set_state_from_snapshot(session, data)
-        return s
-
-    def set_state_from_snapshot(self, session, data):
-        Structure.set_state_from_snapshot(self, session,
-                                          data['structure state'])
-        self._drawing = data['drawing']
-        self.add_drawing(self._drawing)
-
-
-class _RMFModel(Model):
-    """Representation of the top level of an RMF model"""
-    def __init__(self, session, filename):
-        name = os.path.splitext(os.path.basename(filename))[0]
-        self._unnamed_state = None
-        self._drawing = None
-        self._provenance = None
-        self._provenance_map = {}
-        self._rmf_resolutions = set()
-        # We always want to show nodes with no explicit resolution
-        self._selected_rmf_resolutions = set((None,))
-        self._rmf_chains = []
-        super().__init__(name, session)
-
-    def take_snapshot(self, session, flags):
-        pm = {filename: model.id
-              for filename, model in self._provenance_map.items()
-              if not model.was_deleted}
-        data = {'version': 1,
-                'model state': Model.take_snapshot(self, session, flags),
-                'rmf_filename': self.rmf_filename,
-                'rmf_features': self.rmf_features,
-                'rmf_provenance': self.rmf_provenance,
-                'rmf_hierarchy': self.rmf_hierarchy,
-                'provenance_map': pm,
-                'rmf_resolutions': self._rmf_resolutions,
-                'selected_rmf_resolutions': self._selected_rmf_resolutions,
-                'rmf_chains': self._rmf_chains}
-        return data
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFModel(session, '')
-        s.set_state_from_snapshot(session, data)
-        # Map session data back to ChimeraX objects only after all models have
-        # been loaded (and not later, since they refer to model IDs and atom
-        # indices which could be changed by the user after session-load)
-        session.triggers.add_handler(
-            'end restore session',
-            lambda trigger, session, model=s:
-            _restore_chimera_obj(session, model))
-        return s
-
-    def set_state_from_snapshot(self, session, data):
-        Model.set_state_from_snapshot(self, session, data['model state'])
-        self.rmf_filename = data['rmf_filename']
-        self.rmf_features = data['rmf_features']
-        self.rmf_provenance = data['rmf_provenance']
-        self.rmf_hierarchy = data['rmf_hierarchy']
-        self._provenance_map = data['provenance_map']
-        self._rmf_resolutions = data['rmf_resolutions']
-        self._selected_rmf_resolutions = data['selected_rmf_resolutions']
-        self._rmf_chains = data['rmf_chains']
-
-    def _add_rmf_resolution(self, res):
-        self._rmf_resolutions.add(res)
-        self._selected_rmf_resolutions.add(res)
-
-    def get_drawing(self):
-        if self._drawing is None:
-            self._drawing = _RMFDrawing(self.session, name="Geometry")
-            self.add([self._drawing])
-        return self._drawing
-
-    def _has_provenance(self, name):
-        """Return True iff provenance from the given name has been read"""
-        return name in self._provenance_map
-
-    def _update_provenance_map(self):
-        """Make sure that provenance mapping is up to date, by deleting
-           references to models that have been closed since the map was
-           last modified."""
-        to_delete = [name for name, model
-                     in self._provenance_map.items() if model.was_deleted]
-        for name in to_delete:
-            del self._provenance_map[name]
-
-    def _add_provenance(self, name, p):
-        """Add a Model containing provenance information keyed by the given
-           name (usually a filename)"""
-        if self._provenance is None or self._provenance.was_deleted:
-            self._provenance = Model('Provenance', self.session)
-            self.add([self._provenance])
-        self._provenance_map[name] = p
-        self._provenance.add([p])
-        return self._provenance
-
-    def _add_state(self, name):
-        """Create and return a new _RMFState"""
-        s = _RMFState(self.session, name=name)
-        self.add([s])
-        return s
-
-    def _add_rmf_chain(self, chain, hierarchy):
-        self._rmf_chains.append((chain.get_chain_id(), hierarchy))
-
-    def get_unnamed_state(self):
-        """Get the 'unnamed' state, used for structure that isn't the
-           child of an RMF State node."""
-        if self._unnamed_state is None:
-            self._unnamed_state = self._add_state('Unnamed state')
-        return self._unnamed_state
-
-    def add_shape(self, vertices, normals, triangles, name):
-        drawing = self.get_drawing()
-        drawing._drawing.add_shape(vertices, normals, triangles,
-                                   numpy.array([255, 255, 255, 255]),
-                                   description=name)
-
-
-class _RMFHierarchyNode(State):
-    """Represent a single RMF node.
-       Note that features (restraints) are stored outside of this hierarchy,
-       as _RMFFeature objects, as are provenance nodes."""
-    __slots__ = ['name', 'rmf_index', 'children', 'parent', 'chimera_obj',
-                 'resolution', '_filtered_children']
-
-    def __init__(self, rmf_node):
-        self.name = rmf_node.get_name()
-        self.rmf_index = rmf_node.get_index()
-        self.children = []
-        self.resolution = None
-        self._filtered_children = self.children
-        self.chimera_obj = None
-        self.parent = None
-
-    def take_snapshot(self, session, flags):
-        data = {'version': 1,
-                'name': self.name,
-                'rmf_index': self.rmf_index,
-                'resolution': self.resolution,
-                'chimera_obj': _save_snapshot_chimera_obj(self.chimera_obj),
-                'children': self.children}
-        return data
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFHierarchyNode(_MockRMFNode(data))
-        s.resolution = data['resolution']
-        s.chimera_obj = data['chimera_obj']
-        s.add_children(data['children'])
-        return s
-
-    def add_children(self, children):
-        for child in children:
-            self.children.append(child)
-            # avoid circular reference
-            child.parent = weakref.ref(self)
-
-
-def _save_snapshot_chimera_obj(obj):
-    """Snapshot a Chimera object. We can't store these directly in the session
-       (and rely on ChimeraX's own snapshot code) since this would result
-       in a circular reference (since they refer to the model, which also
-       holds the top-level rmf_hierarchy or rmf_features list)"""
-    if obj is None:
-        return None
-    if isinstance(obj, Atoms):
-        data = {'type': 'Atoms',
-                'indices': obj.coord_indices}
-        if obj.single_structure:
-            data['single_structure'] = (
-                obj.structures[0].id if len(obj.structures) > 0 else None)
-        else:
-            data['structures'] = [s.id for s in obj.structures]
-        return data
-    elif isinstance(obj, Atom):
-        data = {'type': 'Atom',
-                'index': obj.coord_index,
-                'structure': obj.structure.id}
-        return data
-    elif isinstance(obj, Bond):
-        s = obj.atoms[0].structure
-        data = {'type': 'Bond',
-                'index': s.bonds.index(obj),
-                'structure': s.id}
-        return data
-    elif isinstance(obj, Pseudobond):
-        s = obj.atoms[0].structure
-        data = {'type': 'Pseudobond',
-                'structure': s.id,
-                'index': s._features.pseudobonds.index(obj)}
-        return data
-    raise TypeError("Don't know how to snapshot %s" % str(obj))
-
-
-def _load_snapshot_chimera_obj(session, data, model_by_id):
-    """Map data from _save_snapshot_chimera_obj back to a ChimeraX object"""
-    if data is None:
-        return None
-    elif data['type'] == 'Atoms':
-        if 'single_structure' in data:
-            if data['single_structure'] is None:
-                return Atoms()
-            m = model_by_id[data['single_structure']]
-            atoms = [m.atoms[x] for x in data['indices']]
-        else:
-            atoms = []
-            for s, ind in zip(data['structures'], data['indices']):
-                atoms.append(model_by_id[s].atoms[ind])
-        obj = Atoms(atoms)
-        return obj
-    elif data['type'] == 'Atom':
-        return model_by_id[data['structure']].atoms[data['index']]
-    elif data['type'] == 'Bond':
-        return model_by_id[data['structure']].bonds[data['index']]
-    elif data['type'] == 'Pseudobond':
-        f = model_by_id[data['structure']]._get_features()
-        obj = f.pseudobonds[data['index']]
-        return obj
-    raise TypeError("Don't know how to load snapshot %s" % str(data))
-
-
-def _restore_nodes_chimera_obj(session, nodes, model_by_id):
-    """Replace chimera_obj session data with actual objects for all listed
-       nodes"""
-    for n in nodes:
-        n.chimera_obj = _load_snapshot_chimera_obj(session, n.chimera_obj,
-                                                   model_by_id)
-        _restore_nodes_chimera_obj(session, n.children, model_by_id)
-
-
-def _restore_chimera_obj(session, model):
-    """Replace chimera_obj session data with actual objects for the given
-       RMF model"""
-    model_by_id = {m.id: m for m in session.models.list()}
-
-    model._provenance_map = {
-        filename: model_by_id[mid]
-        for filename, mid in model._provenance_map.items()}
-    _restore_nodes_chimera_obj(session, model.rmf_features, model_by_id)
-    _restore_nodes_chimera_obj(session, [model.rmf_hierarchy], model_by_id)
-
-    # Only need to call this once per model
-    from chimerax.core.triggerset import DEREGISTER
-    return DEREGISTER
-
-
-class _RMFFeature(State):
-    """Represent a single feature in an RMF file."""
-
-    __slots__ = ['name', 'rmf_index', 'chimera_obj', 'children', 'parent']
-
-    def __init__(self, rmf_node):
-        self.name = rmf_node.get_name()
-        self.rmf_index = rmf_node.get_index()
-        self.children = []
-        self.chimera_obj = None
-        self.parent = None
-
-    def take_snapshot(self, session, flags):
-        data = {'version': 1,
-                'name': self.name,
-                'rmf_index': self.rmf_index,
-                'chimera_obj': _save_snapshot_chimera_obj(self.chimera_obj),
-                'children': self.children}
-        return data
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFFeature(_MockRMFNode(data))
-        for child in data['children']:
-            s.add_child(child)
-        s.chimera_obj = data['chimera_obj']
-        return s
-
-    def add_child(self, child):
-        self.children.append(child)
-        # avoid circular reference
-        child.parent = weakref.ref(self)
-
-
-class _RMFProvenance(State):
-    """Represent some provenance of the RMF file."""
-
-    _snapshot_keys = []
-
-    def __init__(self, rmf_node):
-        self._name = rmf_node.get_name()
-        self.rmf_index = rmf_node.get_index()
-        self.chimera_obj = None
-        self.previous = None
-        self.next = None
-        self.hierarchy_node = None
-
-    def set_previous(self, previous):
-        """Add another _RMFProvenance node that represents the previous state
-           of the system"""
-        self.previous = previous
-        previous.next = weakref.proxy(self)
-
-    def load(self, session, model):
-        """Override to load file(s) referenced by this object into the
-           given session and model."""
-        pass
-
-    def take_snapshot(self, session, flags):
-        data = {'version': 1,
-                'name': self._name,
-                'rmf_index': self.rmf_index,
-                'previous': self.previous,
-                'hierarchy_node': self.hierarchy_node}
-        for k in self._snapshot_keys:
-            data[k] = getattr(self, k)
-        return data
-
-    def set_state_from_snapshot(self, data):
-        self.hierarchy_node = data['hierarchy_node']
-        if data['previous']:
-            self.set_previous(data['previous'])
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFProvenance(_MockRMFNode(data))
-        s.set_state_from_snapshot(data)
-        return s
-
-    # Displayed name of this provenance (defaults to the name of the RMF node)
-    name = property(lambda self: self._name)
-
-
-def _atomic_model_reader(filename):
-    """Get a ChimeraX function to read the given atomic model (PDB, mmCIF)"""
-    if filename.endswith('.cif'):
-        from chimerax.mmcif import open_mmcif
-        return open_mmcif
-    elif filename.endswith('.pdb'):
-        from chimerax.pdb import open_pdb
-        return open_pdb
-
-
-def _prune_chains(model, chains):
-    """Delete all but the given chains from the model"""
-    atoms_to_del = [atoms for _, cid, atoms in model.atoms.by_chain
-                    if cid not in chains]
-    for atoms in atoms_to_del:
-        atoms.delete()
-
-
-class _RMFStructureProvenance(_RMFProvenance):
-    """Represent a structure file (PDB, mmCIF) used as input for an RMF"""
-
-    _snapshot_keys = ['chain', 'residue_offset', 'filename', 'allchains']
-
-    def __init__(self, rmf_node, prov, provenance_chains):
-        super().__init__(rmf_node)
-        #: The chain ID used in the given file
-        self.chain = prov.get_chain()
-        #: Value to add to RMF residue numbers to get residue numbers
-        #: in the file (usually zero)
-        self.residue_offset = prov.get_residue_offset()
-        #: Full path to PDB/mmCIF file
-        self.filename = prov.get_filename()
-        # Keep track of *all* chains we're interested in in this structure
-        # (across all provenance nodes in the RMF file)
-        self.allchains = provenance_chains.setdefault(self.filename, set())
-        self.allchains.add(self.chain)
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        class MockStructureProvenance:
-            def __init__(self, data):
-                self.data = data
-
-            def get_chain(self):
-                return self.data['chain']
-
-            def get_residue_offset(self):
-                return self.data['residue_offset']
-
-            def get_filename(self):
-                return self.data['filename']
-        s = _RMFStructureProvenance(_MockRMFNode(data),
-                                    MockStructureProvenance(data), {})
-        s.set_state_from_snapshot(data)
-        return s
-
-    def set_state_from_snapshot(self, data):
-        _RMFProvenance.set_state_from_snapshot(self, data)
-        self.allchains = data['allchains']
-
-    def load(self, session, model):
-        # Note that we load all chains referenced by the RMF file, as this is
-        # more efficient than creating a separate model for each chain.
-        if model._has_provenance(self.filename):
-            return
-        if not os.path.exists(self.filename):
-            session.logger.warning("Not reading %s; does not exist"
-                                   % self.filename)
-        else:
-            open_model = _atomic_model_reader(self.filename)
-            if open_model:
-                with open(self.filename) as fh:
-                    models, msg = open_model(
-                        session, fh, os.path.basename(self.filename),
-                        auto_style=False, log_info=False)
-                    _prune_chains(models[0], self.allchains)
-                model._add_provenance(self.filename, models[0])
-            else:
-                session.logger.warning("Not reading %s; file format "
-                                       "not recognized" % self.filename)
-
-    def _get_name(self):
-        return ("Chain %s from %s"
-                % (self.chain, os.path.basename(self.filename)))
-    name = property(_get_name)
-
-
-class _RMFSampleProvenance(_RMFProvenance):
-    """Information about how an RMF model was sampled"""
-
-    _snapshot_keys = ['frames', 'iterations', 'method', 'replicas']
-
-    def __init__(self, rmf_node, prov):
-        super().__init__(rmf_node)
-        #: Number of frames generated in the sampling
-        self.frames = prov.get_frames()
-        #: Number of scoring function iterations per frame
-        self.iterations = prov.get_iterations()
-        #: Sampling method used (e.g. Monte Carlo)
-        self.method = prov.get_method()
-        #: Number of replicas used in replica exchange sampling
-        self.replicas = prov.get_replicas()
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        class MockSampleProvenance:
-            def __init__(self, data):
-                self.data = data
-
-            def get_frames(self):
-                return self.data['frames']
-
-            def get_iterations(self):
-                return self.data['iterations']
-
-            def get_method(self):
-                return self.data['method']
-
-            def get_replicas(self):
-                return self.data['replicas']
-        s = _RMFSampleProvenance(
-            _MockRMFNode(data), MockSampleProvenance(data))
-        s.set_state_from_snapshot(data)
-        return s
-
-    def _get_name(self):
-        return ("Sampling using %s making %d frames"
-                % (self.method, self.frames))
-    name = property(_get_name)
-
-
-class _RMFScriptProvenance(_RMFProvenance):
-    """Information about the script used to build an RMF model"""
-
-    _snapshot_keys = ['filename']
-
-    def __init__(self, rmf_node, prov):
-        super().__init__(rmf_node)
-        #: Full path to the script
-        self.filename = prov.get_filename()
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        class MockScriptProvenance:
-            def __init__(self, data):
-                self.data = data
-
-            def get_filename(self):
-                return self.data['filename']
-        s = _RMFScriptProvenance(
-            _MockRMFNode(data), MockScriptProvenance(data))
-        s.set_state_from_snapshot(data)
-        return s
-
-    def _get_name(self):
-        return ("Using script %s" % self.filename)
-    name = property(_get_name)
-
-
-class _RMFSoftwareProvenance(_RMFProvenance):
-    """Information about the software used to build an RMF model"""
-
-    _snapshot_keys = ['location', 'software_name', 'version']
-
-    def __init__(self, rmf_node, prov):
-        super().__init__(rmf_node)
-        #: URL to obtain the software
-        self.location = prov.get_location()
-        #: Name of the software package
-        self.software_name = prov.get_name()
-        #: Version of the software used
-        self.version = prov.get_version()
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        class MockSoftwareProvenance:
-            def __init__(self, data):
-                self.data = data
-
-            def get_location(self):
-                return self.data['location']
-
-            def get_name(self):
-                return self.data['software_name']
-
-            def get_version(self):
-                return self.data['version']
-        s = _RMFSoftwareProvenance(_MockRMFNode(data),
-                                   MockSoftwareProvenance(data))
-        s.set_state_from_snapshot(data)
-        return s
-
-    def _get_name(self):
-        return ("Using software %s version %s from %s" %
-                (self.software_name, self.version, self.location))
-    name = property(_get_name)
-
-
-class _RMFEMRestraintGMMProvenance(_RMFProvenance):
-    """Information about an electron microscopy restraint read from GMMs"""
-
-    _snapshot_keys = ['filename']
-
-    def __init__(self, rmf_node, filename):
-        super().__init__(rmf_node)
-        self.filename = filename
-        # The original MRC file (if known)
-        mrc = self._parse_gmm(rmf_node, filename)
-        if mrc:
-            self.set_previous(mrc)
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFEMRestraintGMMProvenance(_MockRMFNode(data), data['filename'])
-        s.set_state_from_snapshot(data)
-        return s
-
-    def _parse_gmm(self, rmf_node, filename):
-        """Extract metadata from the GMM file (to find the original MRC file)
-           if available"""
-        if not os.path.exists(filename):
-            return
-        with open(filename) as fh:
-            for line in fh:
-                if line.startswith('# data_fn: '):
-                    relpath = line[11:].rstrip('\r\n')
-                    fname = os.path.join(os.path.dirname(filename), relpath)
-                    return _RMFEMRestraintMRCProvenance(rmf_node, fname)
-
-    def load(self, session, model):
-        if self.previous:
-            self.previous.load(session, model)
-
-    def _get_name(self):
-        return ("Gaussian Mixture Model from %s"
-                % os.path.basename(self.filename))
-    name = property(_get_name)
-
-
-class _RMFEMRestraintMRCProvenance(_RMFProvenance):
-    """Information about an electron microscopy restraint read from MRC"""
-
-    _snapshot_keys = ['filename']
-
-    def __init__(self, rmf_node, filename):
-        super().__init__(rmf_node)
-        self.filename = filename
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFEMRestraintMRCProvenance(_MockRMFNode(data), data['filename'])
-        s.set_state_from_snapshot(data)
-        return s
-
-    def load(self, session, model):
-        if not model._has_provenance(self.filename):
-            from chimerax.map.volume import open_map
-            from chimerax.map_data import UnknownFileType
-            try:
-                maps, msg = open_map(session, self.filename)
-            except UnknownFileType:
-                return
-            v = maps[0]
-            v.set_display_style('image')
-            v.show()
-            model._add_provenance(self.filename, v)
-
-    def _get_name(self):
-        return "EM map from %s" % os.path.basename(self.filename)
-    name = property(_get_name)
-
-
-class _RMFXLMSRestraintProvenance(_RMFProvenance):
-    """Information about an XL-MS restraint"""
-
-    _snapshot_keys = ['filename']
-
-    def __init__(self, rmf_node, filename):
-        super().__init__(rmf_node)
-        self.filename = filename
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFXLMSRestraintProvenance(_MockRMFNode(data), data['filename'])
-        s.set_state_from_snapshot(data)
-        return s
-
-    def _get_name(self):
-        return "XL-MS data from %s" % os.path.basename(self.filename)
-    name = property(_get_name)
-
-
-class _RMFSAXSRestraintProvenance(_RMFProvenance):
-    """Information about a SAXS restraint"""
-
-    _snapshot_keys = ['filename']
-
-    def __init__(self, rmf_node, filename):
-        super().__init__(rmf_node)
-        self.filename = filename
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFSAXSRestraintProvenance(_MockRMFNode(data), data['filename'])
-        s.set_state_from_snapshot(data)
-        return s
-
-    def _get_name(self):
-        return "SAXS profile from %s" % os.path.basename(self.filename)
-    name = property(_get_name)
-
-
-class _RMFEM2DRestraintProvenance(_RMFProvenance):
-    """Information about a 2D EM restraint"""
-
-    _snapshot_keys = ['filename', 'pixel_size']
-
-    def __init__(self, rmf_node, filename, pixel_size):
-        super().__init__(rmf_node)
-        self.filename = filename
-        self.pixel_size = pixel_size
-
-    @staticmethod
-    def restore_snapshot(session, data):
-        s = _RMFEM2DRestraintProvenance(
-            _MockRMFNode(data), data['filename'], data['pixel_size'])
-        s.set_state_from_snapshot(data)
-        return s
-
-    def load(self, session, model):
-        if not model._has_provenance(self.filename):
-            from chimerax.map.volume import open_map
-            from chimerax.map_data import UnknownFileType
-            try:
-                maps, msg = open_map(session, self.filename)
-            except UnknownFileType:
-                return
-            v = maps[0]
-            v.data.set_step((self.pixel_size, self.pixel_size, v.data.step[2]))
-            # todo: set orientation
-            v.set_display_style('image')
-            v.show()
-            model._add_provenance(self.filename, v)
-
-    def _get_name(self):
-        return "EM class average from %s" % os.path.basename(self.filename)
-    name = property(_get_name)
-
-
-class _RMFHierarchyInfo(object):
-    """Track structural information encountered through the RMF hierarchy"""
-    def __init__(self, top_level, CoordinateTransformer):
-        self.top_level = top_level
-        self._refframe = self._state = self._chain = self._copy = None
-        self._resolution = self._resnum = self._restype = None
-        self._residue = None
-        self._resnum_for_chain = {}
-        self.CoordinateTransformer = CoordinateTransformer
-
-    def _set_reference_frame(self, rf):
-        """Set the current reference frame from an RMF ReferenceFrame node"""
-        self._refframe = self.CoordinateTransformer(
-            self._refframe or self.CoordinateTransformer(), rf)
-
-    def handle_node(self, node, hierarchy, loader):
-        """Extract structural information from the given RMF node.
-           Return the _RMFHierarchyInfo object containing this information.
-           This may be the current object, or a new one."""
-        def copy_if_needed(x):
-            # Make a copy if we need to so we don't mess with the information
-            # used by parent nodes
-            if x is self:
-                return copy.copy(x)
-            else:
-                return x
-        rhi = self
-        if loader.statef.get_is(node):
-            rhi = copy_if_needed(rhi)
-            rhi._state = self.top_level._add_state(node.get_name())
-        if loader.refframef.get_is(node):
-            rhi = copy_if_needed(rhi)
-            rhi._set_reference_frame(loader.refframef.get(node))
-        if loader.chainf.get_is(node):
-            rhi = copy_if_needed(rhi)
-            rhi._chain = (node, loader.chainf.get(node))
-            self.top_level._add_rmf_chain(rhi._chain[1], hierarchy)
-        if loader.copyf.get_is(node):
-            rhi = copy_if_needed(rhi)
-            rhi._copy = loader.copyf.get(node).get_copy_index()
-        if loader.resolutionf.get_is(node):
-            rhi = copy_if_needed(rhi)
-            n = loader.resolutionf.get(node)
-            rhi._resolution = n.get_explicit_resolution()
-            self.top_level._add_rmf_resolution(rhi._resolution)
-        if loader.fragmentf.get_is(node):
-            rhi = copy_if_needed(rhi)
-            f = loader.fragmentf.get(node)
-            resinds = f.get_residue_indexes()
-            rhi._residue = None  # clear residue cache
-            rhi._resnum = resinds[len(resinds) // 2]
-            rhi._restype = 'UNK'  # Guess type
-        if loader.residuef.get_is(node):
-            rhi = copy_if_needed(rhi)
-            r = loader.residuef.get(node)
-            rhi._residue = None  # clear residue cache
-            rhi._resnum = r.get_residue_index()
-            rhi._restype = r.get_residue_type()
-        return rhi
-
-    def get_state(self):
-        """Get the current state"""
-        if self._state:
-            return self._state
-        else:
-            # If we're not under a State node, use the unnamed state
-            return self.top_level.get_unnamed_state()
-
-    def get_residue(self):
-        """Get the current residue"""
-        if self._residue is None:  # Use cached residue if available
-            state = self.get_state()
-            if self._chain is None:
-                chain_id = 'X'
-            else:
-                chain_id = self._chain[1].get_chain_id()
-            if self._resnum is None:
-                # If RMF provides no residue info, make it up
-                resnum = self._resnum_for_chain.setdefault(chain_id, 0) + 1
-                self._residue = state.new_residue('UNK', chain_id, resnum)
-                self._resnum_for_chain[chain_id] = resnum
-            else:
-                self._residue = state.new_residue(self._restype, chain_id,
-                                                  self._resnum)
-            if self._chain:
-                self._residue.rmf_name = self._chain[0].get_name()
-            if self._copy is not None:
-                self._residue.copy = self._copy
-            if self._resolution is not None:
-                self._residue.resolution = self._resolution
-        return self._residue
-
-    def new_atom(self, p, mass, name=None, element='C'):
-        """Create and return a new ChimeraX Atom for the given Particle
-           (and Atom, if applicable) node.
-           Call add_atom() to complete adding the atom to the model."""
-        state = self.get_state()
-        if name is None:
-            name = 'C'
-            state._atomic = False
-        atom = state.new_atom(name, element)
-        if self._refframe:
-            atom.coord = self._refframe.get_global_coordinates(
-                p.get_coordinates())
-        else:
-            atom.coord = p.get_coordinates()
-        atom.mass = mass
-        atom.radius = p.get_radius()
-        atom.draw_mode = atom.SPHERE_STYLE
-        return atom
-
-    def new_bond(self, a1, a2):
-        state = a1.structure
-        return state.new_bond(a1, a2)
-
-    def new_feature(self, atoms):
-        if len(atoms) == 2:
-            # Make and return a pseudobond if the feature acts on 2 atoms
-            state = atoms[0].structure
-            return state._add_pseudobond(atoms)
-        else:
-            # Otherwise, return the list of atoms the feature acts on
-            return Atoms(atoms)
-
-    def new_segment(self, coords, name):
-        # todo: don't rely on chimerax.bild (not public API)
-        from chimerax.bild.bild import get_cylinder
-        if len(coords) != 2:
-            return
-        a = numpy.array(coords[0])
-        b = numpy.array(coords[1])
-        # Skip zero-length lines
-        if numpy.linalg.norm(a - b) < 1e-6:
-            return
-        vertices, normals, triangles = get_cylinder(1.0, a, b)
-        self.top_level.add_shape(vertices, normals, triangles, name)
-
-    def add_atom(self, atom):
-        residue = self.get_residue()
-        residue.add_atom(atom)
-
-
-class _RMFLoader(object):
-    """Load information from an RMF file"""
-
-    _feature_provenance_class = {
-        'IMP.isd.GaussianEMRestraint': _RMFEMRestraintGMMProvenance,
-        'IMP.pmi.CrossLinkingMassSpectrometryRestraint':
-            _RMFXLMSRestraintProvenance,
-        'IMP.saxs.Restraint': _RMFSAXSRestraintProvenance,
-    }
-
-    def __init__(self):
-        pass
-
-    def load(self, path, session):
-        if sys.platform == 'darwin':
-            from .mac import RMF
-        elif sys.platform == 'linux':
-            from .linux import RMF
-        else:
-            from .windows import RMF
-
-        self.GAUSSIAN_PARTICLE = RMF.GAUSSIAN_PARTICLE
-        self.PARTICLE = RMF.PARTICLE
-        self.PROVENANCE = RMF.PROVENANCE
-
-        r = RMF.open_rmf_file_read_only(path)
-        self.particlef = RMF.ParticleConstFactory(r)
-        self.iparticlef = RMF.IntermediateParticleConstFactory(r)
-        self.gparticlef = RMF.GaussianParticleConstFactory(r)
-        self.ballf = RMF.BallConstFactory(r)
-        self.strucprovf = RMF.StructureProvenanceConstFactory(r)
-        self.sampleprovf = RMF.SampleProvenanceConstFactory(r)
-        self.scriptprovf = RMF.ScriptProvenanceConstFactory(r)
-        self.softwareprovf = RMF.SoftwareProvenanceConstFactory(r)
-        self.coloredf = RMF.ColoredConstFactory(r)
-        self.chainf = RMF.ChainConstFactory(r)
-        self.fragmentf = RMF.FragmentConstFactory(r)
-        self.residuef = RMF.ResidueConstFactory(r)
-        self.refframef = RMF.ReferenceFrameConstFactory(r)
-        self.statef = RMF.StateConstFactory(r)
-        self.bondf = RMF.BondConstFactory(r)
-        self.represf = RMF.RepresentationConstFactory(r)
-        self.altf = RMF.AlternativesConstFactory(r)
-        self.copyf = RMF.CopyConstFactory(r)
-        self.resolutionf = RMF.ExplicitResolutionConstFactory(r)
-        self.atomf = RMF.AtomConstFactory(r)
-        self.segmentf = RMF.SegmentConstFactory(r)
-        self.rmf_index_to_atom = {}
-
-        imp_restraint_cat = r.get_category("IMP restraint")
-        keys = dict((r.get_name(k), k)
-                    for k in r.get_keys(imp_restraint_cat))
-        self.rsr_typek = keys.get('type')
-        self.rsr_pixelsizek = keys.get('pixel size')
-
-        imp_restraint_fn_cat = r.get_category("IMP restraint files")
-        keys = dict((r.get_name(k), k)
-                    for k in r.get_keys(imp_restraint_fn_cat))
-        self.rsr_filenamek = keys.get('filename')
-        self.rsr_imagefilesk = keys.get('image files')
-
-        r.set_current_frame(RMF.FrameID(0))
-
-        top_level = _RMFModel(session, path)
-        rhi = _RMFHierarchyInfo(top_level, RMF.CoordinateTransformer)
-        top_level.rmf_filename = os.path.abspath(path)
-        top_level.rmf_features = []
-        top_level.rmf_provenance = []
-        # The set of chain IDs to read from each named input structure file
-        _provenance_chains = {}
-        top_level.rmf_hierarchy, = self._handle_node(r.get_root_node(), rhi,
-                                                     top_level.rmf_features,
-                                                     top_level.rmf_provenance,
-                                                     os.path.dirname(path),
-                                                     _provenance_chains, None)
-        return r, [top_level]
-
-    def _add_atom(self, node, p, mass, rhi):
-        if self.atomf.get_is(node):
-            ap = self.atomf.get(node)
-            name = node.get_name()
-            # ChimeraX names must not exceed 4 characters, so strip RMF/IMP
-            # HET: prefix if present
-            if name.startswith('HET:'):
-                name = name[4:].strip()
-            atom = rhi.new_atom(p, mass, name=name, element=ap.get_element())
-        else:
-            atom = rhi.new_atom(p, mass)
-        self.rmf_index_to_atom[node.get_index()] = atom
-        if self.coloredf.get_is(node):
-            c = self.coloredf.get(node)
-            # RMF colors are 0-1 and has no alpha; ChimeraX uses 0-255
-            atom.color = [x * 255. for x in c.get_rgb_color()] + [255]
-        rhi.add_atom(atom)
-        return atom
-
-    def _handle_provenance(self, node, provenance_chains, parent_node):
-        if self.strucprovf.get_is(node):
-            prov = _RMFStructureProvenance(node, self.strucprovf.get(node),
-                                           provenance_chains)
-        elif self.sampleprovf.get_is(node):
-            prov = _RMFSampleProvenance(node, self.sampleprovf.get(node))
-        elif self.scriptprovf.get_is(node):
-            prov = _RMFScriptProvenance(node, self.scriptprovf.get(node))
-        elif self.softwareprovf.get_is(node):
-            prov = _RMFSoftwareProvenance(node, self.softwareprovf.get(node))
-        else:
-            prov = _RMFProvenance(node)
-        # Provenance nodes *should* only have at most one "child"
-        for child in node.get_children():
-            prov.set_previous(self._handle_provenance(child, provenance_chains,
-                                                      parent_node))
-        prov.hierarchy_node = parent_node
-        return prov
-
-    def _handle_feature_provenance(self, node, rmf_dir):
-        def get_node_filename(node):
-            fname = node.get_value(self.rsr_filenamek)
-            if fname:
-                # path is relative to that of the RMF file
-                return os.path.join(rmf_dir, fname)
-        # noop if these keys aren't in the file at all
-        if self.rsr_typek is None:
-            return
-        rsrtype = node.get_value(self.rsr_typek)
-        if self.rsr_filenamek:
-            cls = self._feature_provenance_class.get(rsrtype)
-            if cls:
-                fname = get_node_filename(node)
-                if fname:
-                    return cls(node, fname)
-        if rsrtype == 'IMP.em2d.PCAFitRestraint':
-            return self._make_em2d_provenance(node, rmf_dir)
-
-    def _make_em2d_provenance(self, node, rmf_dir):
-        if not self.rsr_imagefilesk or not self.rsr_pixelsizek:
-            return
-        pixel_size = node.get_value(self.rsr_pixelsizek)
-        images = node.get_value(self.rsr_imagefilesk)
-        if images and pixel_size:
-            return [_RMFEM2DRestraintProvenance(
-                node, os.path.join(rmf_dir, fname), pixel_size)
-                for fname in images]
-
-    def _handle_feature(self, node, parent_rhi, rmf_dir, provenance):
-        feature = _RMFFeature(node)
-        feature.chimera_obj = self._add_feature(
-            self.represf.get(node), parent_rhi)
-        # Extract provenance from restraint if present
-        p = self._handle_feature_provenance(node, rmf_dir)
-        if p:
-            if isinstance(p, list):
-                provenance.extend(p)
-            else:
-                provenance.append(p)
-        for child in node.get_children():
-            if self.represf.get_is(child):
-                feature.add_child(self._handle_feature(child, parent_rhi,
-                                                       rmf_dir, provenance))
-        return feature
-
-    def _handle_node(self, node, parent_rhi, features, provenance, rmf_dir,
-                     provenance_chains, parent_node):
-        # Features are handled outside of the regular hierarchy
-        if self.represf.get_is(node):
-            features.append(self._handle_feature(node, parent_rhi, rmf_dir,
-                                                 provenance))
-            return []
-
-        # Provenance is handled outside of the regular hierarchy
-        if node.get_type() == self.PROVENANCE:
-            provenance.append(self._handle_provenance(node, provenance_chains,
-                                                      parent_node))
-            return []
-
-        rmf_nodes = [_RMFHierarchyNode(node)]
-        # Get hierarchy-related info from this node (e.g. chain, state)
-        rhi = parent_rhi.handle_node(node, rmf_nodes[0], self)
-        rmf_nodes[0].resolution = rhi._resolution
-        if self.iparticlef.get_is(node):
-            # todo: special handling for Gaussians; right now we assume that
-            # every Gaussian is also a Particle, as 1) this is the case for
-            # IMP-generated structures and 2) particlef.get_is() returns True
-            # for Gaussians anyway (since it appears to only check for mass)
-            ip = self.iparticlef.get(node)
-            mass = 0.
-            if self.particlef.get_is(node):
-                mass = self.particlef.get(node).get_mass()
-            atom = self._add_atom(node, ip, mass, rhi)
-            rmf_nodes[0].chimera_obj = atom
-        elif self.ballf.get_is(node):
-            # balls have no mass
-            atom = self._add_atom(node, self.ballf.get(node), 0., rhi)
-            rmf_nodes[0].chimera_obj = atom
-        if self.bondf.get_is(node):
-            bond = self._add_bond(self.bondf.get(node), rhi)
-            rmf_nodes[0].chimera_obj = bond
-        if self.segmentf.get_is(node):
-            self._add_segment(self.segmentf.get(node), node.get_name(), rhi)
-        for child in node.get_children():
-            rmf_nodes[0].add_children(self._handle_node(
-                child, rhi, features, provenance, rmf_dir, provenance_chains,
-                rmf_nodes[0]))
-        # Handle any alternatives (usually different resolutions)
-        # Alternatives replace the current node - they are not children of
-        # it - so use parent_rhi, not rhi.
-        if self.altf.get_is(node):
-            alt = self.altf.get(node)
-            # The node itself should be the first alternative, so ignore that
-            for p in alt.get_alternatives(self.PARTICLE)[1:]:
-                rmf_nodes.extend(self._handle_node(
-                    p, parent_rhi, features,
-                    provenance, rmf_dir, provenance_chains, rmf_nodes[0]))
-            for gauss in alt.get_alternatives(self.GAUSSIAN_PARTICLE):
-                rmf_nodes.extend(self._handle_node(
-                    gauss, parent_rhi, features,
-                    provenance, rmf_dir, provenance_chains, rmf_nodes[0]))
-        return rmf_nodes
-
-    def _add_bond(self, bond, rhi):
-        rmfatom0 = bond.get_bonded_0()
-        rmfatom1 = bond.get_bonded_1()
-        atom0 = self.rmf_index_to_atom[rmfatom0.get_index()]
-        atom1 = self.rmf_index_to_atom[rmfatom1.get_index()]
-        return rhi.new_bond(atom0, atom1)
-
-    def _add_feature(self, feature, rhi):
-        atoms = [self.rmf_index_to_atom.get(x.get_index())
-                 for x in feature.get_representation()]
-        return rhi.new_feature([a for a in atoms if a is not None])
-
-    def _add_segment(self, segment, name, rhi):
-        rhi.new_segment(segment.get_coordinates_list(), name)
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+import numpy
+import os.path
+import sys
+import threading
+import time
+import weakref
+import functools
+import hashlib
+
+from chimerax.atomic import Atom, Atoms, Bond, Pseudobond
+from chimerax.core.state import State
+from chimerax.core.models import Model
+from chimerax.atomic import Structure, AtomicStructure, AtomicShapeDrawing
+from chimerax.atomic import AtomicShapeInfo
+
+
+def _walk_tree(roots, visit, post=None):
+    """Walk one or more trees depth-first.
+
+       `roots` is an iterable of (node, context) pairs. For each node,
+       `visit(node, context)` is called (in pre-order) and should return
+       a sequence of (child, child_context) pairs to walk next (or None
+       if there are none). If given, `post(node, context)` is called
+       (in post-order) once all of the node's children have been walked.
+
+       An explicit stack is used rather than recursion, so that arbitrarily
+       deep trees can be walked, and without the overhead of a Python
+       function call per level of the tree."""
+    stack = list(roots)
+    stack.reverse()
+    pop, push, extend = stack.pop, stack.append, stack.extend
+    while stack:
+        node, context = pop()
+        if node is None:
+            # Marker for a post-order callback
+            post(*context)
+            continue
+        if post is not None:
+            push((None, (node, context)))
+        children = visit(node, context)
+        if children:
+            extend(reversed(children))
+
+
+class _MockRMFNode:
+    __slots__ = ['name', 'rmf_index']
+
+    def __init__(self, data):
+        self.name, self.rmf_index = data['name'], data['rmf_index']
+
+    def get_name(self):
+        return self.name
+
+    def get_index(self):
+        return self.rmf_index
+
+
+try:
+    import chimerax.open_command
+
+    class RMFOpenerInfo(chimerax.open_command.OpenerInfo):
+        def open(self, session, data, file_name, *, resolution=None,
+                 states=None, background=None, frame=0, trajectory=False,
+                 first=0, last=None, step=1, static_topology=False, **kw):
+            return open_rmf(session, data, resolution=resolution,
+                            states=states, background=background,
+                            frame=frame, trajectory=trajectory,
+                            first=first, last=last, step=step,
+                            static_topology=static_topology)
+
+        @property
+        def open_args(self):
+            from chimerax.core.commands import ListOf, IntArg, BoolArg
+            return {'resolution': _get_resolutions_arg(),
+                    'states': ListOf(IntArg),
+                    'background': BoolArg,
+                    'frame': IntArg,
+                    'trajectory': BoolArg,
+                    'first': IntArg,
+                    'last': IntArg,
+                    'step': IntArg,
+                    'static_topology': BoolArg}
+except ImportError:
+    pass
+
+
+def _get_resolutions_arg():
+    """Get the annotation used for a list of resolutions to read"""
+    from chimerax.core.commands import Or, EnumOf, ListOf, FloatArg
+    return Or(EnumOf(['all', 'coarsest']), ListOf(FloatArg))
+
+
+def _decompress_gzip(path):
+    import gzip
+    with gzip.open(path, 'rb') as fh:
+        return fh.read()
+
+
+def _decompress_xz(path):
+    import lzma
+    with lzma.open(path, 'rb') as fh:
+        return fh.read()
+
+
+def _decompress_zstd(path):
+    try:
+        from compression import zstd  # Python 3.14 or later
+    except ImportError:
+        try:
+            import zstandard
+        except ImportError:
+            raise IOError("Reading zstd-compressed RMF files requires "
+                          "Python 3.14 or the zstandard package")
+        with open(path, 'rb') as fh:
+            return zstandard.ZstdDecompressor().stream_reader(fh).readall()
+    with zstd.open(path, 'rb') as fh:
+        return fh.read()
+
+
+# Functions to decompress RMF files, by file extension
+_DECOMPRESSORS = {'.gz': _decompress_gzip, '.xz': _decompress_xz,
+                  '.zst': _decompress_zstd}
+
+
+def _is_compressed(path):
+    """Return True iff the given RMF file is compressed"""
+    return os.path.splitext(path)[1].lower() in _DECOMPRESSORS
+
+
+def _read_rmf_buffer(path):
+    """Decompress the given compressed RMF file, and return its
+       contents as bytes. Only RMF3 files can be read this way."""
+    return _DECOMPRESSORS[os.path.splitext(path)[1].lower()](path)
+
+
+def _open_rmf_handle(RMF, path, buffer=None):
+    """Open an RMF file read-only. If `buffer` (the contents of the file,
+       as bytes) is given, it is read instead of the file at `path`."""
+    if buffer is None:
+        return RMF.open_rmf_file_read_only(path)
+    else:
+        return RMF.open_rmf_buffer_read_only(RMF.BufferConstHandle(buffer))
+
+
+def open_rmf(session, path, resolution=None, states=None, background=None,
+             data=None, frame=0, trajectory=False, first=0, last=None,
+             step=1, static_topology=False):
+    """Read an RMF file from a named file.
+
+    The file can be compressed with gzip, xz or zstd (if the file name
+    ends in .gz, .xz or .zst respectively), in which case it is
+    decompressed into memory rather than to a temporary file. Only RMF3
+    files can be read compressed.
+
+    If `data` is given, it is the contents of an RMF3 file, as bytes,
+    which is read instead of the file at `path`. `path` is then only used
+    to name the model and to find any files the RMF file refers to, and
+    the RMF cache is not used.
+
+    If `resolution` is given, it is a list of the resolutions of
+    representation to read, 'all' to read every resolution, or 'coarsest'
+    to read only the lowest resolution of each set of alternative
+    representations. Otherwise, the default from the RMF settings is used.
+
+    If `states` is given, it is a list of the indexes (starting at zero)
+    of the states to read; otherwise, all states are read.
+
+    Coordinates are read from the given `frame` (by default, the first).
+    If `trajectory` is True, frames `first` through `last` (inclusive; by
+    default, the last frame in the file) in steps of `step` are also read
+    into coordsets of every state, as for the 'rmf readtraj' command, but
+    without opening the file again.
+
+    If `static_topology` is True, topology (masses, radii, elements,
+    residues and chain IDs) is read from the static data of each RMF node
+    rather than from `frame`, which is only used for nodes that have no
+    static data. Which fields were read from static data is reported in
+    the status message.
+
+    If `background` is True (or it is None and the RMF settings say so),
+    and a GUI is available, the file is read in a background thread so as
+    not to block the user interface, and the models are added to the
+    session once it has been read. In this case no models are returned.
+
+    Returns the 2-tuple return value appropriate for the
+    ``chimerax.core.toolshed.BundleAPI.open_file`` method.
+    """
+    from .settings import get_settings
+    settings = get_settings(session)
+    if resolution is None:
+        resolution = settings.resolutions
+    if background is None:
+        background = settings.background
+    rl = _RMFLoader(resolutions=None if resolution in (None, 'all')
+                    else resolution, states=states)
+    rl.frame = frame
+    rl.static_topology = static_topology
+    if trajectory:
+        rl.trajectory = (first, last, step)
+    from .cache import get_cache
+    cache = get_cache(session)
+    if cache.max_size > 0 and data is None:
+        rl.cache = cache
+    rl.buffer = data
+    from . import profiling
+    rl.profile = profiling.new_profile('open', path)
+    if background and session.ui.is_gui:
+        _RMFBackgroundLoad(session, rl, path).start()
+        return [], ("Reading RMF file %s in the background; use "
+                    "'rmf cancel' to stop." % os.path.basename(path))
+    cprofile = profiling.start_cprofile()
+    try:
+        structures = rl.load(path, session)
+    finally:
+        profiling.finish(rl.profile, cprofile)
+    status = _get_open_status(rl, structures)
+    if session.ui.is_gui:
+        from chimerax.core.commands import run
+        run(session, 'tool show "RMF Viewer"', log=False)
+    return structures, status
+
+
+def _get_open_status(rl, structures):
+    """Get a status message after opening an RMF file"""
+    numframes = rl.frame_count
+    producer = rl.producer
+    status = ("Opened RMF file%s with %d frame%s."
+              % (" produced with %s," % producer if producer else "",
+                 numframes, "" if numframes == 1 else "s"))
+    skipped = structures[0]._skipped_rmf_resolutions
+    read = structures[0]._rmf_resolutions - skipped
+    if read:
+        status += (" Representation read at the following resolutions: %s."
+                   % ", ".join("%.1f" % i for i in sorted(read)))
+    if skipped:
+        status += (" Representation at the following resolutions was not "
+                   "read: %s." % ", ".join("%.1f" % i
+                                           for i in sorted(skipped)))
+    skipped = structures[0]._skipped_rmf_states
+    if skipped:
+        status += (" %d of %d states were not read: %s."
+                   % (len(skipped), rl.state_count,
+                      ", ".join("%d" % s[0] for s in skipped)))
+    if rl.trajectory is not None:
+        status += (" %d frame%s read into coordsets."
+                   % (rl.trajectory_frames_read,
+                      " was" if rl.trajectory_frames_read == 1
+                      else "s were"))
+    elif numframes > 1:
+        status += (" Only %s was read; to read additional "
+                   "frames, use the 'rmf readtraj' command."
+                   % ("frame %d" % rl.frame if rl.frame
+                      else "the first frame"))
+    if rl.static_topology:
+        status += _get_topology_report_status(rl)
+    return status
+
+
+def _get_topology_report_status(rl):
+    """Get a status message saying which topology fields were read from
+       static data, and which from the frame opened at"""
+    def describe(fields):
+        return ", ".join(f.replace('_', ' ') for f in fields)
+    report = rl.topology_report
+    static = [f for f, (nstatic, nframe) in report.items() if nframe == 0]
+    per_frame = [f for f, (nstatic, nframe) in report.items() if nframe > 0]
+    status = ""
+    if static:
+        status += " Topology read from static data: %s." % describe(static)
+    if per_frame:
+        status += (" Topology with no static data for some nodes, read from "
+                   "frame %d: %s." % (rl.frame, describe(per_frame)))
+    return status
+
+
+def _read_rmf_data(path, resolutions, states):
+    """Read the given RMF file, and return everything read as pure data
+       (as for _RMFLoader._get_cache_data()). No ChimeraX objects are
+       created, so this can be run in another process."""
+    rl = _RMFLoader(resolutions=resolutions, states=states)
+    info = _RMFFileInfo()
+    rl.read(path, info)
+    return rl._get_cache_data(info)
+
+
+def _get_topology_signature(data):
+    """Get a hash of the data read from an RMF file (as returned by
+       _read_rmf_data()) that excludes the atom coordinates, so that files
+       that differ only in coordinates have the same signature"""
+    h = hashlib.sha1()
+    for name in sorted(data):
+        if name in ('meta', 'atom_coord'):
+            continue
+        a = numpy.ascontiguousarray(data[name])
+        h.update(repr((name, a.dtype.str, a.shape)).encode('utf-8'))
+        h.update(a.tobytes())
+    meta = data['meta']
+    h.update(repr([meta[k] for k in ('states', 'non_atomic_states',
+                                     'residues', 'elements', 'colors',
+                                     'features', 'feature_atoms',
+                                     'chains')]).encode('utf-8'))
+    return h.hexdigest()
+
+
+class _RMFEnsembleModel(object):
+    """A model built by open_rmf_ensemble(), to which the coordinates of
+       other files with the same topology are added as coordinate sets"""
+    def __init__(self, model, atom_table):
+        self.model = model
+        # Indexes into the atom table of the atoms in each state
+        self.state_atoms = []
+        state_of_atom = numpy.array(
+            [atom_table.residues[r][0] for r in atom_table.residue_index],
+            dtype=object)
+        for key, name in atom_table.states.items():
+            if key is None:
+                state = model.get_unnamed_state()
+            else:
+                state = model._get_rmf_state(key, name)
+            self.state_atoms.append(
+                (state, numpy.nonzero(state_of_atom == key)[0]))
+        self.num_coordsets = 1
+
+    def add_coordset(self, data):
+        """Add the coordinates read from another file"""
+        coords = data['atom_coord']
+        self.num_coordsets += 1
+        for state, indices in self.state_atoms:
+            state.add_coordset(self.num_coordsets, coords[indices])
+
+
+def open_rmf_ensemble(session, paths, resolution=None, states=None,
+                      combine=False, processes=None):
+    """Read many RMF files at once, such as the best-scoring models from
+    an IMP sampling run.
+
+    The files are read in a pool of `processes` worker processes (by
+    default, one per CPU), except for any that are already in the RMF
+    cache, and ChimeraX models are then built from what was read.
+    `resolution` and `states` are as for open_rmf().
+
+    If `combine` is True, files with identical topology (differing only
+    in their coordinates) are added to a single model, with the
+    coordinates from each file as a separate coordinate set. Other
+    information, such as segments and provenance, is taken from the first
+    of these files only.
+
+    Returns the list of new models and a status message.
+    """
+    from .settings import get_settings
+    from .cache import get_cache
+    start = time.perf_counter()
+    if resolution is None:
+        resolution = get_settings(session).resolutions
+    resolutions = None if resolution in (None, 'all') else resolution
+
+    # Get what we can from the cache
+    cache = get_cache(session)
+    if cache.max_size <= 0:
+        cache = None
+    options = _RMFLoader(resolutions=resolutions,
+                         states=states)._get_cache_options()
+    data = [None] * len(paths)
+    keys = [None] * len(paths)
+    if cache is not None:
+        for i, path in enumerate(paths):
+            keys[i] = cache.get_key(path, options)
+            data[i] = cache.load(keys[i])
+    to_read = [i for i, d in enumerate(data) if d is None]
+
+    # Read everything else, in parallel if we can
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(to_read))
+    read_paths = [paths[i] for i in to_read]
+    args = ([resolutions] * len(to_read), [states] * len(to_read))
+    if processes > 1:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            read_data = list(executor.map(_read_rmf_data, read_paths, *args))
+    else:
+        read_data = list(map(_read_rmf_data, read_paths, *args))
+    for i, d in zip(to_read, read_data):
+        data[i] = d
+        if cache is not None:
+            cache.save(keys[i], d)
+
+    # Build models in the main thread
+    models = []
+    ensembles = {}
+    for path, d in zip(paths, data):
+        if combine:
+            signature = _get_topology_signature(d)
+            ensemble = ensembles.get(signature)
+            if ensemble is not None:
+                ensemble.add_coordset(d)
+                continue
+        m = _RMFModel(session, path)
+        rl = _RMFLoader(resolutions=resolutions, states=states)
+        rl.read_data(path, m, d)
+        for _ in rl.build(m):
+            pass
+        models.append(m)
+        if combine:
+            ensembles[signature] = _RMFEnsembleModel(m, rl.atom_table)
+    elapsed = time.perf_counter() - start
+    status = ("Opened %d RMF file%s as %d model%s in %.2f s "
+              "(%.1f files per second)."
+              % (len(paths), "" if len(paths) == 1 else "s", len(models),
+                 "" if len(models) == 1 else "s", elapsed,
+                 len(paths) / elapsed if elapsed > 0. else 0.))
+    if to_read:
+        status += (" %d file%s read using %d process%s."
+                   % (len(to_read), "" if len(to_read) == 1 else "s were",
+                      max(processes, 1), "" if processes <= 1 else "es"))
+    return models, status
+
+
+class _RMFState(AtomicStructure):
+    """Representation of structure corresponding to a single RMF state"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._features = None
+        # Assume the structure is atomic until we encounter coordinates without
+        # atomic information
+        self._atomic = True
+        # The _RMFTrajectoryStream, if the trajectory is read on demand
+        self._rmf_stream = None
+
+    def delete(self):
+        if self._rmf_stream is not None:
+            self._rmf_stream.close()
+        super().delete()
+
+    def take_snapshot(self, session, flags):
+        data = {'version': 1,
+                'atomic structure state':
+                    AtomicStructure.take_snapshot(self, session, flags)}
+        return data
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFState(session, auto_style=False, log_info=False)
+        s.set_state_from_snapshot(session, data)
+        return s
+
+    def set_state_from_snapshot(self, session, data):
+        AtomicStructure.set_state_from_snapshot(
+            self, session, data['atomic structure state'])
+
+    def _add_pseudobond(self, atoms):
+        f = self._get_features()
+        b = f.new_pseudobond(*atoms)
+        b.halfbond = False
+        return b
+
+    def _add_pseudobonds(self, atoms1, atoms2):
+        """Add a pseudobond between each pair of atoms in the given Atoms
+           collections, and return them as a Pseudobonds collection"""
+        f = self._get_features()
+        b = f.new_pseudobonds(atoms1, atoms2)
+        b.halfbonds = False
+        return b
+
+    def _get_features(self):
+        """Get the pseudobond group used to display RMF features"""
+        if self._features is None:
+            self._features = self.pseudobond_group("Features")
+        return self._features
+
+    def apply_auto_styling(self, *args, **kwargs):
+        # Only apply auto styling for truly atomic structures
+        if self._atomic:
+            super().apply_auto_styling(*args, **kwargs)
+
+
+class _RMFDrawing(Structure):
+    """Representation of RMF geometry"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._drawing = AtomicShapeDrawing('geometry')
+        self.add_drawing(self._drawing)
+
+    def take_snapshot(self, session, flags):
+        data = {'version': 1,
+                'drawing': self._drawing,
+                'structure state':
+                    Structure.take_snapshot(self, session, flags)}
+        return data
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFDrawing(session)
+        s.set_state_from_snapshot(session, data)
+        return s
+
+    def set_state_from_snapshot(self, session, data):
+        Structure.set_state_from_snapshot(self, session,
+                                          data['structure state'])
+        self._drawing = data['drawing']
+        self.add_drawing(self._drawing)
+
+
+# Entry in maps from RMF node index to atom for nodes that have no atom
+_NO_ATOM = -1
+
+
+def _get_file_stamp(path):
+    """Get the (modification time, size) of the given file, used to tell
+       if it has changed, or None if it does not exist (e.g. if it was
+       read from memory)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class _RMFFileHandle(object):
+    """An RMF file opened read-only, plus the decorator factories needed
+       to read its trajectory and the results of any searches of its
+       hierarchy, so that these need not be set up again for each read"""
+    def __init__(self, RMF, rmf_file, stamp):
+        self.rmf_file = rmf_file
+        #: The file's _get_file_stamp() when it was opened
+        self.stamp = stamp
+        self.statef = RMF.StateConstFactory(rmf_file)
+        self.particlef = RMF.ParticleConstFactory(rmf_file)
+        self.ballf = RMF.BallConstFactory(rmf_file)
+        self.iparticlef = RMF.IntermediateParticleConstFactory(rmf_file)
+        self.represf = RMF.RepresentationConstFactory(rmf_file)
+        self.altf = RMF.AlternativesConstFactory(rmf_file)
+        #: Results of searches of the file (such as the RMF node for each
+        #: state), keyed by what was searched for
+        self.found = {}
+        #: time.monotonic() when the handle was last returned to its pool,
+        #: or None if it has not been used yet
+        self.last_used = None
+
+    def close(self):
+        self.rmf_file.close()
+
+
+class _RMFHandlePool(object):
+    """Open handles of the RMF file an _RMFModel was read from, kept so
+       that successive reads of its trajectory need not open and search
+       the file again. Handles are closed once unused for `timeout`
+       seconds, are discarded if the file changes on disk, and are all
+       closed when the model is."""
+
+    #: Time, in seconds, after which an unused handle is closed
+    timeout = 60.
+
+    def __init__(self, model):
+        self._model = weakref.ref(model)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+        # The file's stamp when a handle was last requested
+        self._stamp = None
+
+    def __len__(self):
+        return len(self._idle)
+
+    def acquire(self, RMF):
+        """Get an _RMFFileHandle for the model's RMF file, reusing an idle
+           one if the file has not changed since it was opened. Give it
+           back with release() when done."""
+        model = self._model()
+        stamp = _get_file_stamp(model.rmf_filename)
+        if self._stamp is not None and stamp != self._stamp:
+            self._file_changed(model)
+        self._stamp = stamp
+        with self._lock:
+            stale = [h for h in self._idle if h.stamp != stamp]
+            self._idle = [h for h in self._idle if h.stamp == stamp]
+            handle = self._idle.pop() if self._idle else None
+        for h in stale:
+            h.close()
+        if handle is None:
+            handle = _RMFFileHandle(RMF, model._open_rmf_file(RMF), stamp)
+        return handle
+
+    def release(self, handle):
+        """Put a handle (from acquire(), or one newly opened for the
+           model's file) in the pool for reuse"""
+        handle.last_used = time.monotonic()
+        with self._lock:
+            if not self._closed:
+                self._idle.append(handle)
+                if self._timer is None:
+                    self._start_timer(self.timeout)
+                return
+        handle.close()
+
+    def close(self):
+        """Close all handles in the pool"""
+        with self._lock:
+            self._closed = True
+            handles, self._idle = self._idle, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for h in handles:
+            h.close()
+
+    def _file_changed(self, model):
+        """Forget anything learned from the old contents of the file"""
+        model._rmf_static_states.clear()
+        if _is_compressed(model.rmf_filename):
+            model._rmf_buffer = None
+
+    def _start_timer(self, delay):
+        self._timer = threading.Timer(delay, self._close_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _close_idle(self):
+        """Close handles that have not been used for `timeout` seconds"""
+        now = time.monotonic()
+        with self._lock:
+            self._timer = None
+            expired = [h for h in self._idle
+                       if now - h.last_used >= self.timeout]
+            self._idle = [h for h in self._idle
+                          if now - h.last_used < self.timeout]
+            if self._idle:
+                self._start_timer(min(h.last_used for h in self._idle)
+                                  + self.timeout - now)
+        for h in expired:
+            h.close()
+
+
+class _RMFFileInfo(object):
+    """Information about an RMF file as a whole that is filled in when it
+       is read. This is part of each _RMFModel, but is also used alone to
+       read files in other processes, where no ChimeraX models exist."""
+    def __init__(self):
+        self._rmf_resolutions = set()
+        # Resolutions that were not read from the file
+        self._skipped_rmf_resolutions = set()
+        # (resolution, RMF node index, parent RMF node index) for each part
+        # of the hierarchy that was not read from the file
+        self._skipped_rmf_nodes = []
+        # (state index, name, RMF node index, parent RMF node index) for
+        # each RMF State node that was not read from the file
+        self._skipped_rmf_states = []
+        # Map from RMF node index to state index (the position of the
+        # state among all State nodes in the file, as used to choose
+        # states to read) for each RMF State node that was read
+        self._rmf_state_indexes = {}
+        # The resolutions requested when the file was opened
+        # (None for all, 'coarsest', or a list of resolutions)
+        self._rmf_read_resolutions = None
+        # We always want to show nodes with no explicit resolution
+        self._selected_rmf_resolutions = set((None,))
+        self._rmf_chains = []
+        # Contents of the RMF file, if it was read from memory or
+        # decompressed, so that it need not be decompressed again
+        self._rmf_buffer = None
+        # The frame that coordinates were read from
+        self._rmf_frame = 0
+        # True if topology was read from static data (see
+        # _RMFLoader.static_topology)
+        self._rmf_static_topology = False
+
+    def _add_rmf_resolution(self, res, skipped=False):
+        self._rmf_resolutions.add(res)
+        if skipped:
+            self._skipped_rmf_resolutions.add(res)
+        else:
+            self._selected_rmf_resolutions.add(res)
+
+    def _add_skipped_rmf_node(self, res, rmf_index, parent_index):
+        """Record that the given RMF node, at the given resolution, was
+           not read. `parent_index` is the RMF index of the hierarchy node
+           it should be added to if it is read later."""
+        self._add_rmf_resolution(res, skipped=True)
+        self._skipped_rmf_nodes.append((res, rmf_index, parent_index))
+
+    def _add_skipped_rmf_state(self, istate, name, rmf_index, parent_index):
+        """Record that the given RMF State node (the istate'th state in
+           the file) was not read"""
+        self._skipped_rmf_states.append((istate, name, rmf_index,
+                                         parent_index))
+
+    def _add_rmf_chain(self, chain_id, hierarchy):
+        self._rmf_chains.append((chain_id, hierarchy))
+
+
+class _RMFModel(_RMFFileInfo, Model):
+    """Representation of the top level of an RMF model"""
+    def __init__(self, session, filename):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        self._unnamed_state = None
+        self._drawing = None
+        self._provenance = None
+        self._provenance_map = {}
+        # Map from RMF node index to _RMFState for each RMF State node
+        self._rmf_states = {}
+        # RMF node indexes of State nodes (or of the root node, for the
+        # unnamed state) under which no particle moves between frames;
+        # see _RMFTrajectoryLoader
+        self._rmf_static_states = set()
+        # Atoms read from the file, and the map from RMF node index to
+        # position in those Atoms; see get_rmf_atom_map()
+        self._rmf_atom_map = None
+        # Open handles of the RMF file, for reading the trajectory
+        self._rmf_handles = _RMFHandlePool(self)
+        _RMFFileInfo.__init__(self)
+        Model.__init__(self, name, session)
+
+    def take_snapshot(self, session, flags):
+        pm = {filename: model.id
+              for filename, model in self._provenance_map.items()
+              if not model.was_deleted}
+        data = {'version': 1,
+                'model state': Model.take_snapshot(self, session, flags),
+                'rmf_filename': self.rmf_filename,
+                'rmf_features': self.rmf_features,
+                'rmf_provenance': self.rmf_provenance,
+                'rmf_hierarchy': self.rmf_hierarchy,
+                'provenance_map': pm,
+                'rmf_resolutions': self._rmf_resolutions,
+                'selected_rmf_resolutions': self._selected_rmf_resolutions,
+                'skipped_rmf_resolutions': self._skipped_rmf_resolutions,
+                'skipped_rmf_nodes': self._skipped_rmf_nodes,
+                'rmf_states': {ind: state.id
+                               for ind, state in self._rmf_states.items()
+                               if not state.was_deleted},
+                'skipped_rmf_states': self._skipped_rmf_states,
+                'rmf_state_indexes': self._rmf_state_indexes,
+                'rmf_read_resolutions': self._rmf_read_resolutions,
+                'rmf_chains': self._rmf_chains,
+                'rmf_static_states': self._rmf_static_states,
+                'rmf_frame': self._rmf_frame,
+                'rmf_static_topology': self._rmf_static_topology}
+        return data
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFModel(session, '')
+        s.set_state_from_snapshot(session, data)
+        # Map session data back to ChimeraX objects only after all models have
+        # been loaded (and not later, since they refer to model IDs and atom
+        # indices which could be changed by the user after session-load)
+        session.triggers.add_handler(
+            'end restore session',
+            lambda trigger, session, model=s:
+            _restore_chimera_obj(session, model))
+        return s
+
+    def set_state_from_snapshot(self, session, data):
+        Model.set_state_from_snapshot(self, session, data['model state'])
+        self.rmf_filename = data['rmf_filename']
+        self.rmf_features = data['rmf_features']
+        self.rmf_provenance = data['rmf_provenance']
+        self.rmf_hierarchy = data['rmf_hierarchy']
+        self._provenance_map = data['provenance_map']
+        self._rmf_resolutions = data['rmf_resolutions']
+        self._selected_rmf_resolutions = data['selected_rmf_resolutions']
+        self._skipped_rmf_resolutions = data.get('skipped_rmf_resolutions',
+                                                 set())
+        self._skipped_rmf_nodes = data.get('skipped_rmf_nodes', [])
+        self._rmf_states = data.get('rmf_states', {})
+        self._skipped_rmf_states = data.get('skipped_rmf_states', [])
+        self._rmf_state_indexes = data.get('rmf_state_indexes', {})
+        self._rmf_read_resolutions = data.get('rmf_read_resolutions')
+        self._rmf_chains = data['rmf_chains']
+        self._rmf_static_states = data.get('rmf_static_states', set())
+        self._rmf_frame = data.get('rmf_frame', 0)
+        self._rmf_static_topology = data.get('rmf_static_topology', False)
+
+    def delete(self):
+        self._rmf_handles.close()
+        Model.delete(self)
+
+    def _open_rmf_file(self, RMF):
+        """Open the RMF file this model was read from, read-only. A
+           compressed file is decompressed only once, and its contents
+           are kept for later reads (such as of the trajectory)."""
+        if self._rmf_buffer is None and _is_compressed(self.rmf_filename):
+            self._rmf_buffer = _read_rmf_buffer(self.rmf_filename)
+        return _open_rmf_handle(RMF, self.rmf_filename, self._rmf_buffer)
+
+    def _load_skipped_rmf_resolution(self, res):
+        """Read all parts of the hierarchy at the given resolution that
+           were not read when the file was opened. Return the number of
+           new atoms."""
+        rl = _RMFLoader()
+        return rl.load_skipped_resolution(self, res)
+
+    def _load_skipped_rmf_state(self, istate):
+        """Read the istate'th state, if it was not read when the file
+           was opened. Return the number of new atoms."""
+        rl = _RMFLoader()
+        return rl.load_skipped_state(self, istate)
+
+    def get_drawing(self):
+        if self._drawing is None:
+            self._drawing = _RMFDrawing(self.session, name="Geometry")
+            self.add([self._drawing])
+        return self._drawing
+
+    def _has_provenance(self, name):
+        """Return True iff provenance from the given name has been read"""
+        return name in self._provenance_map
+
+    def _update_provenance_map(self):
+        """Make sure that provenance mapping is up to date, by deleting
+           references to models that have been closed since the map was
+           last modified."""
+        to_delete = [name for name, model
+                     in self._provenance_map.items() if model.was_deleted]
+        for name in to_delete:
+            del self._provenance_map[name]
+
+    def _add_provenance(self, name, p):
+        """Add a Model containing provenance information keyed by the given
+           name (usually a filename)"""
+        if self._provenance is None or self._provenance.was_deleted:
+            self._provenance = Model('Provenance', self.session)
+            self.add([self._provenance])
+        self._provenance_map[name] = p
+        self._provenance.add([p])
+        return self._provenance
+
+    def _add_state(self, name):
+        """Create and return a new _RMFState"""
+        s = _RMFState(self.session, name=name)
+        self.add([s])
+        return s
+
+    def _get_rmf_state(self, rmf_index, name):
+        """Get the _RMFState for the RMF State node with the given index,
+           creating it if necessary"""
+        s = self._rmf_states.get(rmf_index)
+        if s is None or s.was_deleted:
+            s = self._add_state(name)
+            self._rmf_states[rmf_index] = s
+        return s
+
+    def get_rmf_atom_map(self):
+        """Get the atoms read from the RMF file, as an (Atoms, index) pair.
+           `index` is a NumPy int32 array that maps each RMF node index to
+           the position of that node's atom in Atoms, or -1 if the node
+           has no atom. The map is built from the hierarchy when first
+           needed."""
+        if self._rmf_atom_map is None:
+            h = self.rmf_hierarchy._hierarchy
+            nodes, atoms = [], []
+            for hnode, obj in h.get_node_objects():
+                if isinstance(obj, Atom):
+                    nodes.append(hnode)
+                    atoms.append(obj)
+            rmf_index = h.rmf_index[numpy.array(nodes, dtype=numpy.intp)]
+            index = numpy.full(int(h.rmf_index.max()) + 1 if len(h) else 0,
+                               _NO_ATOM, dtype=numpy.int32)
+            index[rmf_index] = numpy.arange(len(atoms), dtype=numpy.int32)
+            self._rmf_atom_map = (Atoms(atoms), index)
+        return self._rmf_atom_map
+
+    def get_unnamed_state(self):
+        """Get the 'unnamed' state, used for structure that isn't the
+           child of an RMF State node."""
+        if self._unnamed_state is None:
+            self._unnamed_state = self._add_state('Unnamed state')
+        return self._unnamed_state
+
+    def add_cylinders(self, starts, ends, names):
+        """Add a cylinder between each pair of points in the (N,3) arrays
+           `starts` and `ends`, each with the given name"""
+        vertices, normals, triangles = _get_cylinders(1.0, starts, ends)
+        color = numpy.array([255, 255, 255, 255])
+        # Shapes are added all at once, so the drawing builds a single
+        # mesh, but each cylinder can still be picked by name
+        drawing = self.get_drawing()
+        drawing._drawing.add_shapes([
+            AtomicShapeInfo(v, n, triangles, color, None, name)
+            for v, n, name in zip(vertices, normals, names)])
+
+
+def _get_z_rotations(axes):
+    """Get the rotation matrices that map the z axis onto each of the unit
+       vectors in the (N,3) array `axes`, as an (N,3,3) array"""
+    x, y, z = axes[:, 0], axes[:, 1], axes[:, 2]
+    # Rodrigues' formula, for rotation about z x axis; the axis is
+    # undefined for vectors antiparallel to z, which are handled below
+    antiparallel = z < -1. + 1e-9
+    f = 1. / numpy.where(antiparallel, 1., 1. + z)
+    rot = numpy.empty((len(axes), 3, 3))
+    rot[:, 0, 0] = 1. - x * x * f
+    rot[:, 0, 1] = rot[:, 1, 0] = -x * y * f
+    rot[:, 0, 2] = x
+    rot[:, 1, 1] = 1. - y * y * f
+    rot[:, 1, 2] = y
+    rot[:, 2, 0] = -x
+    rot[:, 2, 1] = -y
+    rot[:, 2, 2] = z
+    rot[antiparallel] = numpy.diag([1., -1., -1.])
+    return rot
+
+
+def _get_cylinders(radius, starts, ends):
+    """Get the geometry of a cylinder of the given radius between each pair
+       of points in the (N,3) arrays `starts` and `ends`. Every cylinder
+       is a transformed copy of a single template cylinder, so return
+       (N,V,3) arrays of vertices and normals, plus the triangles shared
+       by every cylinder."""
+    # todo: don't rely on chimerax.bild (not public API)
+    from chimerax.bild.bild import get_cylinder
+    # Template cylinder of unit height along z, centered at the origin
+    vertices, normals, triangles = get_cylinder(
+        radius, numpy.array([0., 0., -0.5]), numpy.array([0., 0., 0.5]))
+    axes = ends - starts
+    lengths = numpy.linalg.norm(axes, axis=1)
+    rot = _get_z_rotations(axes / lengths[:, numpy.newaxis])
+    scale = numpy.ones((len(lengths), 1, 3))
+    scale[:, 0, 2] = lengths
+    centers = (starts + ends) * 0.5
+    all_vertices = (numpy.einsum('nij,nvj->nvi', rot,
+                                 vertices[numpy.newaxis, :, :] * scale)
+                    + centers[:, numpy.newaxis, :])
+    all_normals = numpy.einsum('nij,vj->nvi', rot, normals)
+    return (all_vertices.astype(numpy.float32),
+            all_normals.astype(numpy.float32), triangles)
+
+
+def _hierarchy_column(name, doc):
+    """Make a property for the used part of an _RMFHierarchy column"""
+    attr = '_' + name
+    return property(lambda self: getattr(self, attr)[:self._size], doc=doc)
+
+
+class _RMFHierarchy(State):
+    """Compact storage of an RMF hierarchy.
+
+       Each node is a row in a set of NumPy arrays, identified by its index.
+       Names are stored as indexes into the `names` string table, and
+       ChimeraX objects (atoms or bonds) as indexes into the `objects` list
+       (-1 if the node has none). Children are always added after all
+       existing nodes, so siblings are in index order.
+
+       _RMFHierarchyNode objects are views of single nodes, and are created
+       only on demand (see node())."""
+
+    _columns = (('parent', numpy.int32), ('first_child', numpy.int32),
+                ('next_sibling', numpy.int32), ('last_child', numpy.int32),
+                ('rmf_index', numpy.int32), ('resolution', numpy.float64),
+                ('name', numpy.int32), ('obj', numpy.int32))
+
+    def __init__(self, capacity=16):
+        self._size = 0
+        for name, dtype in self._columns:
+            setattr(self, '_' + name, numpy.empty(capacity, dtype))
+        #: Table of node names
+        self.names = []
+        self._name_ids = {}
+        #: ChimeraX objects referenced by nodes
+        self.objects = []
+        # Objects from a restored session, to be mapped to ChimeraX objects
+        # once all models have been restored
+        self._saved_objects = None
+        # Existing views of nodes, so that each node has at most one
+        self._views = weakref.WeakValueDictionary()
+        # Resolutions shown (None for all), and the shown children of each
+        # node, calculated when needed
+        self._resolutions = None
+        self._filtered = None
+
+    parent = _hierarchy_column('parent', "Index of each node's parent, or -1")
+    first_child = _hierarchy_column(
+        'first_child', "Index of each node's first child, or -1")
+    next_sibling = _hierarchy_column(
+        'next_sibling', "Index of each node's next sibling, or -1")
+    rmf_index = _hierarchy_column('rmf_index', "RMF index of each node")
+    resolution = _hierarchy_column(
+        'resolution', "Resolution of each node, or NaN")
+    name = _hierarchy_column('name', "Index of each node's name in `names`")
+    obj = _hierarchy_column(
+        'obj', "Index of each node's object in `objects`, or -1")
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, n):
+        """Make sure there is room for n more nodes"""
+        capacity = len(self._parent)
+        if self._size + n <= capacity:
+            return
+        capacity = max(capacity * 2, self._size + n)
+        for name, dtype in self._columns:
+            old = getattr(self, '_' + name)
+            new = numpy.empty(capacity, dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, '_' + name, new)
+
+    def _intern(self, name):
+        """Get the index of the given name in the names table"""
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def add_node(self, name, rmf_index, parent=-1):
+        """Add a new node, as the last child of `parent` (or as a new root
+           if `parent` is -1), and return its index"""
+        self._reserve(1)
+        i = self._size
+        self._size += 1
+        self._parent[i] = parent
+        self._first_child[i] = self._next_sibling[i] = -1
+        self._last_child[i] = -1
+        self._rmf_index[i] = rmf_index
+        self._resolution[i] = numpy.nan
+        self._name[i] = self._intern(name)
+        self._obj[i] = -1
+        if parent >= 0:
+            self._append_child(parent, i)
+        self._filtered = None
+        return i
+
+    def _append_child(self, parent, child):
+        """Link the given node in as the last child of `parent`"""
+        last = self._last_child[parent]
+        if last < 0:
+            self._first_child[parent] = child
+        else:
+            self._next_sibling[last] = child
+        self._last_child[parent] = child
+
+    @classmethod
+    def _from_columns(cls, names, name, parent, rmf_index, resolution,
+                      obj=None, objects=None):
+        """Make a new hierarchy from arrays of data for every node, for
+           example as read from a cache or a session"""
+        h = cls(capacity=max(len(parent), 1))
+        h._size = n = len(parent)
+        h.names = list(names)
+        h._name_ids = {name: i for i, name in enumerate(h.names)}
+        h._name[:n] = name
+        h._parent[:n] = parent
+        h._rmf_index[:n] = rmf_index
+        h._resolution[:n] = resolution
+        if obj is None:
+            h._obj[:n] = -1
+        else:
+            h._obj[:n] = obj
+            h.objects = list(objects)
+        h._link_children()
+        return h
+
+    def _link_children(self):
+        """Fill in the first child, next sibling and last child of every
+           node from their parents"""
+        parent = self.parent
+        for col in (self.first_child, self.next_sibling,
+                    self._last_child[:self._size]):
+            col[:] = -1
+        # All children, grouped by parent, in index order
+        children = numpy.nonzero(parent >= 0)[0]
+        children = children[numpy.argsort(parent[children], kind='stable')]
+        if len(children) == 0:
+            return
+        parents = parent[children]
+        same = parents[1:] == parents[:-1]
+        self.next_sibling[children[:-1][same]] = children[1:][same]
+        first = numpy.concatenate(([True], ~same))
+        last = numpy.concatenate((~same, [True]))
+        self.first_child[parents[first]] = children[first]
+        self._last_child[parents[last]] = children[last]
+
+    def node(self, index):
+        """Get the _RMFHierarchyNode for the node with the given index"""
+        n = self._views.get(index)
+        if n is None:
+            n = _RMFHierarchyNode._make_view(self, index)
+            self._views[index] = n
+        return n
+
+    def get_children(self, index):
+        """Get the indexes of all children of the given node"""
+        children = []
+        nxt = self._next_sibling
+        c = int(self._first_child[index])
+        while c >= 0:
+            children.append(c)
+            c = int(nxt[c])
+        return children
+
+    def get_name(self, index):
+        return self.names[self._name[index]]
+
+    def get_resolution(self, index):
+        res = self._resolution[index]
+        return None if numpy.isnan(res) else float(res)
+
+    def set_resolution(self, index, resolution):
+        self._resolution[index] = (numpy.nan if resolution is None
+                                   else resolution)
+        self._filtered = None
+
+    def get_object(self, index):
+        """Get the ChimeraX object for the given node, or None"""
+        obj = self._obj[index]
+        return None if obj < 0 else self.objects[obj]
+
+    def set_object(self, index, obj):
+        """Set the ChimeraX object for the given node"""
+        if obj is None:
+            self._obj[index] = -1
+        elif self._obj[index] >= 0:
+            self.objects[self._obj[index]] = obj
+        else:
+            self._obj[index] = len(self.objects)
+            self.objects.append(obj)
+
+    def set_objects(self, indices, objs):
+        """Set the ChimeraX objects for many nodes at once"""
+        indices = numpy.asarray(indices, dtype=numpy.int32)
+        self._obj[indices] = numpy.arange(
+            len(self.objects), len(self.objects) + len(indices),
+            dtype=numpy.int32)
+        self.objects.extend(objs)
+
+    def get_node_objects(self):
+        """Get (node index, ChimeraX object) for every node that has one"""
+        obj = self.obj
+        objects = self.objects
+        return [(i, objects[obj[i]])
+                for i in numpy.nonzero(obj >= 0)[0].tolist()]
+
+    def get_subtree(self, index):
+        """Get the indexes of the given node and all nodes under it, in
+           pre-order"""
+        nodes = []
+        stack = [index]
+        while stack:
+            i = stack.pop()
+            nodes.append(i)
+            stack.extend(reversed(self.get_children(i)))
+        return nodes
+
+    def graft(self, parent, child):
+        """Move the given _RMFHierarchyNode, which is in a different
+           hierarchy, and everything under it, to be the last child of the
+           given node"""
+        other = child._hierarchy
+        if other is self:
+            raise ValueError("Node is already in this hierarchy")
+        old = numpy.array(other.get_subtree(child._index), dtype=numpy.int32)
+        offset = self._size
+        new_index = numpy.full(len(other), -1, dtype=numpy.int32)
+        new_index[old] = numpy.arange(offset, offset + len(old),
+                                      dtype=numpy.int32)
+        self._reserve(len(old))
+        n = self._size = offset + len(old)
+        new_parent = other.parent[old]
+        new_parent[0] = parent
+        new_parent[1:] = new_index[new_parent[1:]]
+        self._parent[offset:n] = new_parent
+        self._rmf_index[offset:n] = other.rmf_index[old]
+        self._resolution[offset:n] = other.resolution[old]
+        self._name[offset:n] = [self._intern(other.names[i])
+                                for i in other.name[old].tolist()]
+        self._obj[offset:n] = -1
+        self._first_child[offset:n] = self._next_sibling[offset:n] = -1
+        self._last_child[offset:n] = -1
+        # Nodes are in pre-order, so each is added after its siblings
+        for i, o in zip(old.tolist(), range(offset, n)):
+            self.set_object(o, other.get_object(i))
+            self._append_child(self._parent[o], o)
+        self._filtered = None
+        # Existing views of the moved nodes now refer to this hierarchy
+        for i, view in list(other._views.items()):
+            if new_index[i] >= 0:
+                del other._views[i]
+                view._hierarchy = self
+                view._index = int(new_index[i])
+                self._views[view._index] = view
+
+    def set_resolution_filter(self, resolutions):
+        """Show only nodes at the given resolutions (a set, which may
+           include None for nodes with no resolution) in the filtered
+           hierarchy, or show all nodes if `resolutions` is None"""
+        self._resolutions = resolutions
+        self._filtered = None
+
+    def _get_filtered(self):
+        """Get the children of each node that are shown, as a (start,
+           children, row) tuple. The shown children of node i are
+           children[start[i]:start[i+1]], and row[i] is the position of
+           node i among its parent's shown children (or -1)."""
+        if self._filtered is not None:
+            return self._filtered
+        n = self._size
+        parent = self.parent
+        shown = parent >= 0
+        if self._resolutions is not None:
+            res = self.resolution
+            visible = numpy.isin(res, [r for r in self._resolutions
+                                       if r is not None])
+            if None in self._resolutions:
+                visible |= numpy.isnan(res)
+            shown &= visible
+        children = numpy.nonzero(shown)[0]
+        children = children[numpy.argsort(parent[children], kind='stable')]
+        start = numpy.zeros(n + 1, dtype=numpy.intp)
+        numpy.cumsum(numpy.bincount(parent[children], minlength=n),
+                     out=start[1:])
+        row = numpy.full(n, -1, dtype=numpy.intp)
+        row[children] = (numpy.arange(len(children))
+                         - start[parent[children]])
+        self._filtered = (start, children, row)
+        return self._filtered
+
+    def get_filtered_children(self, index):
+        """Get the indexes of the shown children of the given node"""
+        start, children, row = self._get_filtered()
+        return children[start[index]:start[index + 1]].tolist()
+
+    def get_filtered_child_count(self, index):
+        start, children, row = self._get_filtered()
+        return int(start[index + 1] - start[index])
+
+    def get_filtered_child(self, index, row):
+        start, children, rows = self._get_filtered()
+        return int(children[start[index] + row])
+
+    def get_filtered_row(self, index):
+        """Get the position of the given node among its parent's shown
+           children, or -1 if it is not shown"""
+        start, children, row = self._get_filtered()
+        return int(row[index])
+
+    def take_snapshot(self, session, flags):
+        data = {'version': 1,
+                'names': self.names,
+                'name': self.name.copy(),
+                'parent': self.parent.copy(),
+                'rmf_index': self.rmf_index.copy(),
+                'resolution': self.resolution.copy(),
+                'obj': self.obj.copy(),
+                'objects': _save_snapshot_chimera_objs(self.objects)}
+        return data
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFHierarchy._from_columns(
+            data['names'], data['name'], data['parent'], data['rmf_index'],
+            data['resolution'], data['obj'], [None] * data['objects']['count'])
+        s._saved_objects = data['objects']
+        return s
+
+
+class _RMFHierarchyNode(State):
+    """Represent a single RMF node.
+       Note that features (restraints) are stored outside of this hierarchy,
+       as _RMFFeature objects, as are provenance nodes.
+
+       This is a lightweight view of one node in an _RMFHierarchy; use
+       _RMFHierarchy.node() to get one. Creating a node from an RMF node
+       makes a new hierarchy containing only that node."""
+
+    __slots__ = ['_hierarchy', '_index']
+
+    def __init__(self, rmf_node):
+        h = _RMFHierarchy(capacity=1)
+        self._hierarchy = h
+        self._index = h.add_node(rmf_node.get_name(), rmf_node.get_index())
+        h._views[self._index] = self
+
+    @classmethod
+    def _make_view(cls, hierarchy, index):
+        n = cls.__new__(cls)
+        n._hierarchy = hierarchy
+        n._index = index
+        return n
+
+    name = property(lambda self: self._hierarchy.get_name(self._index))
+    rmf_index = property(
+        lambda self: int(self._hierarchy._rmf_index[self._index]))
+
+    def _get_resolution(self):
+        return self._hierarchy.get_resolution(self._index)
+
+    def _set_resolution(self, resolution):
+        self._hierarchy.set_resolution(self._index, resolution)
+
+    resolution = property(_get_resolution, _set_resolution)
+
+    def _get_chimera_obj(self):
+        return self._hierarchy.get_object(self._index)
+
+    def _set_chimera_obj(self, obj):
+        self._hierarchy.set_object(self._index, obj)
+
+    chimera_obj = property(_get_chimera_obj, _set_chimera_obj)
+
+    def _get_children(self):
+        h = self._hierarchy
+        return [h.node(i) for i in h.get_children(self._index)]
+
+    children = property(_get_children)
+
+    def _get_filtered_children(self):
+        h = self._hierarchy
+        return [h.node(i) for i in h.get_filtered_children(self._index)]
+
+    _filtered_children = property(_get_filtered_children)
+
+    def _get_parent(self):
+        # As for a weak reference, call the result to get the parent
+        parent = int(self._hierarchy._parent[self._index])
+        if parent >= 0:
+            return functools.partial(self._hierarchy.node, parent)
+
+    parent = property(_get_parent)
+
+    def take_snapshot(self, session, flags):
+        data = {'version': 2,
+                'hierarchy': self._hierarchy,
+                'index': self._index}
+        return data
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        if data['version'] >= 2:
+            return data['hierarchy'].node(data['index'])
+        # Sessions from older versions store every node separately
+        s = _RMFHierarchyNode(_MockRMFNode(data))
+        s.resolution = data['resolution']
+        s.chimera_obj = data['chimera_obj']
+        s.add_children(data['children'])
+        return s
+
+    def add_children(self, children):
+        for child in children:
+            self.add_child(child)
+
+    def add_child(self, child):
+        self._hierarchy.graft(self._index, child)
+
+
+def _save_snapshot_chimera_obj(obj):
+    """Snapshot a Chimera object. We can't store these directly in the session
+       (and rely on ChimeraX's own snapshot code) since this would result
+       in a circular reference (since they refer to the model, which also
+       holds the top-level rmf_hierarchy or rmf_features list)"""
+    if obj is None:
+        return None
+    if isinstance(obj, Atoms):
+        data = {'type': 'Atoms',
+                'indices': obj.coord_indices}
+        if obj.single_structure:
+            data['single_structure'] = (
+                obj.structures[0].id if len(obj.structures) > 0 else None)
+        else:
+            data['structures'] = [s.id for s in obj.structures]
+        return data
+    elif isinstance(obj, Atom):
+        data = {'type': 'Atom',
+                'index': obj.coord_index,
+                'structure': obj.structure.id}
+        return data
+    elif isinstance(obj, Bond):
+        s = obj.atoms[0].structure
+        data = {'type': 'Bond',
+                'index': s.bonds.index(obj),
+                'structure': s.id}
+        return data
+    elif isinstance(obj, Pseudobond):
+        s = obj.atoms[0].structure
+        data = {'type': 'Pseudobond',
+                'structure': s.id,
+                'index': s._features.pseudobonds.index(obj)}
+        return data
+    raise TypeError("Don't know how to snapshot %s" % str(obj))
+
+
+def _load_snapshot_chimera_obj(session, data, model_by_id):
+    """Map data from _save_snapshot_chimera_obj back to a ChimeraX object"""
+    if data is None:
+        return None
+    elif data['type'] == 'Atoms':
+        if 'single_structure' in data:
+            if data['single_structure'] is None:
+                return Atoms()
+            m = model_by_id[data['single_structure']]
+            atoms = [m.atoms[x] for x in data['indices']]
+        else:
+            atoms = []
+            for s, ind in zip(data['structures'], data['indices']):
+                atoms.append(model_by_id[s].atoms[ind])
+        obj = Atoms(atoms)
+        return obj
+    elif data['type'] == 'Atom':
+        return model_by_id[data['structure']].atoms[data['index']]
+    elif data['type'] == 'Bond':
+        return model_by_id[data['structure']].bonds[data['index']]
+    elif data['type'] == 'Pseudobond':
+        f = model_by_id[data['structure']]._get_features()
+        obj = f.pseudobonds[data['index']]
+        return obj
+    raise TypeError("Don't know how to load snapshot %s" % str(data))
+
+
+def _save_snapshot_chimera_objs(objs):
+    """Snapshot a list of Chimera objects (some of which may be None).
+       Atoms, which are usually the majority, are stored compactly as
+       arrays of indices for each structure; other objects are stored
+       as for _save_snapshot_chimera_obj."""
+    atoms = {}
+    other = []
+    for i, obj in enumerate(objs):
+        if isinstance(obj, Atom):
+            atoms.setdefault(obj.structure, []).append((i, obj.coord_index))
+        elif obj is not None:
+            other.append((i, _save_snapshot_chimera_obj(obj)))
+    return {'count': len(objs),
+            'atoms': [(s.id, numpy.array(a, dtype=numpy.int64).reshape(-1, 2))
+                      for s, a in atoms.items()],
+            'other': other}
+
+
+def _load_snapshot_chimera_objs(session, data, objs, model_by_id):
+    """Fill in the list `objs` with the Chimera objects saved by
+       _save_snapshot_chimera_objs"""
+    for structure, indices in data['atoms']:
+        atoms = model_by_id[structure].atoms
+        for i, index in indices.tolist():
+            objs[i] = atoms[index]
+    for i, d in data['other']:
+        objs[i] = _load_snapshot_chimera_obj(session, d, model_by_id)
+
+
+def _restore_hierarchy_chimera_obj(session, hierarchy, model_by_id):
+    """Replace session data in an _RMFHierarchy with actual objects"""
+    if hierarchy._saved_objects is not None:
+        _load_snapshot_chimera_objs(session, hierarchy._saved_objects,
+                                    hierarchy.objects, model_by_id)
+        hierarchy._saved_objects = None
+    # Hierarchies from older sessions store each object's session data
+    objs = hierarchy.objects
+    for i, obj in enumerate(objs):
+        if isinstance(obj, dict):
+            objs[i] = _load_snapshot_chimera_obj(session, obj, model_by_id)
+
+
+def _restore_nodes_chimera_obj(session, nodes, model_by_id):
+    """Replace chimera_obj session data with actual objects for all listed
+       nodes"""
+    def visit(node, context):
+        node.chimera_obj = _load_snapshot_chimera_obj(
+            session, node.chimera_obj, model_by_id)
+        return [(child, None) for child in node.children]
+    _walk_tree([(n, None) for n in nodes], visit)
+
+
+def _restore_chimera_obj(session, model):
+    """Replace chimera_obj session data with actual objects for the given
+       RMF model"""
+    model_by_id = {m.id: m for m in session.models.list()}
+
+    model._provenance_map = {
+        filename: model_by_id[mid]
+        for filename, mid in model._provenance_map.items()}
+    model._rmf_states = {ind: model_by_id[mid]
+                         for ind, mid in model._rmf_states.items()
+                         if mid in model_by_id}
+    _restore_nodes_chimera_obj(session, model.rmf_features, model_by_id)
+    _restore_hierarchy_chimera_obj(session, model.rmf_hierarchy._hierarchy,
+                                   model_by_id)
+
+    # Only need to call this once per model
+    from chimerax.core.triggerset import DEREGISTER
+    return DEREGISTER
+
+
+class _RMFFeature(State):
+    """Represent a single feature in an RMF file."""
+
+    __slots__ = ['name', 'rmf_index', '_chimera_obj', '_atoms',
+                 '_atom_indices', 'children', 'parent']
+
+    def __init__(self, rmf_node):
+        self.name = rmf_node.get_name()
+        self.rmf_index = rmf_node.get_index()
+        self.children = []
+        self.chimera_obj = None
+        self.parent = None
+
+    def _get_chimera_obj(self):
+        if self._atom_indices is not None:
+            return self._atoms.filter(self._atom_indices)
+        return self._chimera_obj
+
+    def _set_chimera_obj(self, obj):
+        self._chimera_obj = obj
+        self._atoms = self._atom_indices = None
+
+    chimera_obj = property(_get_chimera_obj, _set_chimera_obj)
+
+    def _set_atom_indices(self, atoms, indices):
+        """Set this feature's ChimeraX object to the atoms at the given
+           indices in an Atoms collection (usually shared with other
+           features). The Atoms for the feature itself are only made on
+           demand."""
+        self._chimera_obj = None
+        self._atoms, self._atom_indices = atoms, indices
+
+    def take_snapshot(self, session, flags):
+        data = {'version': 1,
+                'name': self.name,
+                'rmf_index': self.rmf_index,
+                'chimera_obj': _save_snapshot_chimera_obj(self.chimera_obj),
+                'children': self.children}
+        return data
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFFeature(_MockRMFNode(data))
+        for child in data['children']:
+            s.add_child(child)
+        s.chimera_obj = data['chimera_obj']
+        return s
+
+    def add_child(self, child):
+        self.children.append(child)
+        # avoid circular reference
+        child.parent = weakref.ref(self)
+
+
+class _RMFProvenance(State):
+    """Represent some provenance of the RMF file."""
+
+    _snapshot_keys = []
+
+    def __init__(self, rmf_node):
+        self._name = rmf_node.get_name()
+        self.rmf_index = rmf_node.get_index()
+        self.chimera_obj = None
+        self.previous = None
+        self.next = None
+        self.hierarchy_node = None
+
+    def set_previous(self, previous):
+        """Add another _RMFProvenance node that represents the previous state
+           of the system"""
+        self.previous = previous
+        previous.next = weakref.proxy(self)
+
+    def load(self, session, model):
+        """Override to load file(s) referenced by this object into the
+           given session and model."""
+        pass
+
+    def take_snapshot(self, session, flags):
+        data = {'version': 1,
+                'name': self._name,
+                'rmf_index': self.rmf_index,
+                'previous': self.previous,
+                'hierarchy_node': self.hierarchy_node}
+        for k in self._snapshot_keys:
+            data[k] = getattr(self, k)
+        return data
+
+    def set_state_from_snapshot(self, data):
+        self.hierarchy_node = data['hierarchy_node']
+        if data['previous']:
+            self.set_previous(data['previous'])
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFProvenance(_MockRMFNode(data))
+        s.set_state_from_snapshot(data)
+        return s
+
+    # Displayed name of this provenance (defaults to the name of the RMF node)
+    name = property(lambda self: self._name)
+
+
+def _atomic_model_reader(filename):
+    """Get a ChimeraX function to read the given atomic model (PDB, mmCIF)"""
+    if filename.endswith('.cif'):
+        from chimerax.mmcif import open_mmcif
+        return open_mmcif
+    elif filename.endswith('.pdb'):
+        from chimerax.pdb import open_pdb
+        return open_pdb
+
+
+def _prune_chains(model, chains):
+    """Delete all but the given chains from the model"""
+    atoms_to_del = [atoms for _, cid, atoms in model.atoms.by_chain
+                    if cid not in chains]
+    for atoms in atoms_to_del:
+        atoms.delete()
+
+
+class _RMFStructureProvenance(_RMFProvenance):
+    """Represent a structure file (PDB, mmCIF) used as input for an RMF"""
+
+    _snapshot_keys = ['chain', 'residue_offset', 'filename', 'allchains']
+
+    def __init__(self, rmf_node, prov, provenance_chains):
+        super().__init__(rmf_node)
+        #: The chain ID used in the given file
+        self.chain = prov.get_chain()
+        #: Value to add to RMF residue numbers to get residue numbers
+        #: in the file (usually zero)
+        self.residue_offset = prov.get_residue_offset()
+        #: Full path to PDB/mmCIF file
+        self.filename = prov.get_filename()
+        # Keep track of *all* chains we're interested in in this structure
+        # (across all provenance nodes in the RMF file)
+        self.allchains = provenance_chains.setdefault(self.filename, set())
+        self.allchains.add(self.chain)
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        class MockStructureProvenance:
+            def __init__(self, data):
+                self.data = data
+
+            def get_chain(self):
+                return self.data['chain']
+
+            def get_residue_offset(self):
+                return self.data['residue_offset']
+
+            def get_filename(self):
+                return self.data['filename']
+        s = _RMFStructureProvenance(_MockRMFNode(data),
+                                    MockStructureProvenance(data), {})
+        s.set_state_from_snapshot(data)
+        return s
+
+    def set_state_from_snapshot(self, data):
+        _RMFProvenance.set_state_from_snapshot(self, data)
+        self.allchains = data['allchains']
+
+    def load(self, session, model):
+        # Note that we load all chains referenced by the RMF file, as this is
+        # more efficient than creating a separate model for each chain.
+        if model._has_provenance(self.filename):
+            return
+        if not os.path.exists(self.filename):
+            session.logger.warning("Not reading %s; does not exist"
+                                   % self.filename)
+        else:
+            open_model = _atomic_model_reader(self.filename)
+            if open_model:
+                with open(self.filename) as fh:
+                    models, msg = open_model(
+                        session, fh, os.path.basename(self.filename),
+                        auto_style=False, log_info=False)
+                    _prune_chains(models[0], self.allchains)
+                model._add_provenance(self.filename, models[0])
+            else:
+                session.logger.warning("Not reading %s; file format "
+                                       "not recognized" % self.filename)
+
+    def _get_name(self):
+        return ("Chain %s from %s"
+                % (self.chain, os.path.basename(self.filename)))
+    name = property(_get_name)
+
+
+class _RMFSampleProvenance(_RMFProvenance):
+    """Information about how an RMF model was sampled"""
+
+    _snapshot_keys = ['frames', 'iterations', 'method', 'replicas']
+
+    def __init__(self, rmf_node, prov):
+        super().__init__(rmf_node)
+        #: Number of frames generated in the sampling
+        self.frames = prov.get_frames()
+        #: Number of scoring function iterations per frame
+        self.iterations = prov.get_iterations()
+        #: Sampling method used (e.g. Monte Carlo)
+        self.method = prov.get_method()
+        #: Number of replicas used in replica exchange sampling
+        self.replicas = prov.get_replicas()
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        class MockSampleProvenance:
+            def __init__(self, data):
+                self.data = data
+
+            def get_frames(self):
+                return self.data['frames']
+
+            def get_iterations(self):
+                return self.data['iterations']
+
+            def get_method(self):
+                return self.data['method']
+
+            def get_replicas(self):
+                return self.data['replicas']
+        s = _RMFSampleProvenance(
+            _MockRMFNode(data), MockSampleProvenance(data))
+        s.set_state_from_snapshot(data)
+        return s
+
+    def _get_name(self):
+        return ("Sampling using %s making %d frames"
+                % (self.method, self.frames))
+    name = property(_get_name)
+
+
+class _RMFScriptProvenance(_RMFProvenance):
+    """Information about the script used to build an RMF model"""
+
+    _snapshot_keys = ['filename']
+
+    def __init__(self, rmf_node, prov):
+        super().__init__(rmf_node)
+        #: Full path to the script
+        self.filename = prov.get_filename()
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        class MockScriptProvenance:
+            def __init__(self, data):
+                self.data = data
+
+            def get_filename(self):
+                return self.data['filename']
+        s = _RMFScriptProvenance(
+            _MockRMFNode(data), MockScriptProvenance(data))
+        s.set_state_from_snapshot(data)
+        return s
+
+    def _get_name(self):
+        return ("Using script %s" % self.filename)
+    name = property(_get_name)
+
+
+class _RMFSoftwareProvenance(_RMFProvenance):
+    """Information about the software used to build an RMF model"""
+
+    _snapshot_keys = ['location', 'software_name', 'version']
+
+    def __init__(self, rmf_node, prov):
+        super().__init__(rmf_node)
+        #: URL to obtain the software
+        self.location = prov.get_location()
+        #: Name of the software package
+        self.software_name = prov.get_name()
+        #: Version of the software used
+        self.version = prov.get_version()
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        class MockSoftwareProvenance:
+            def __init__(self, data):
+                self.data = data
+
+            def get_location(self):
+                return self.data['location']
+
+            def get_name(self):
+                return self.data['software_name']
+
+            def get_version(self):
+                return self.data['version']
+        s = _RMFSoftwareProvenance(_MockRMFNode(data),
+                                   MockSoftwareProvenance(data))
+        s.set_state_from_snapshot(data)
+        return s
+
+    def _get_name(self):
+        return ("Using software %s version %s from %s" %
+                (self.software_name, self.version, self.location))
+    name = property(_get_name)
+
+
+class _RMFEMRestraintGMMProvenance(_RMFProvenance):
+    """Information about an electron microscopy restraint read from GMMs"""
+
+    _snapshot_keys = ['filename']
+
+    def __init__(self, rmf_node, filename):
+        super().__init__(rmf_node)
+        self.filename = filename
+        # The original MRC file (if known)
+        mrc = self._parse_gmm(rmf_node, filename)
+        if mrc:
+            self.set_previous(mrc)
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFEMRestraintGMMProvenance(_MockRMFNode(data), data['filename'])
+        s.set_state_from_snapshot(data)
+        return s
+
+    def _parse_gmm(self, rmf_node, filename):
+        """Extract metadata from the GMM file (to find the original MRC file)
+           if available"""
+        if not os.path.exists(filename):
+            return
+        with open(filename) as fh:
+            for line in fh:
+                if line.startswith('# data_fn: '):
+                    relpath = line[11:].rstrip('\r\n')
+                    fname = os.path.join(os.path.dirname(filename), relpath)
+                    return _RMFEMRestraintMRCProvenance(rmf_node, fname)
+
+    def load(self, session, model):
+        if self.previous:
+            self.previous.load(session, model)
+
+    def _get_name(self):
+        return ("Gaussian Mixture Model from %s"
+                % os.path.basename(self.filename))
+    name = property(_get_name)
+
+
+class _RMFEMRestraintMRCProvenance(_RMFProvenance):
+    """Information about an electron microscopy restraint read from MRC"""
+
+    _snapshot_keys = ['filename']
+
+    def __init__(self, rmf_node, filename):
+        super().__init__(rmf_node)
+        self.filename = filename
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFEMRestraintMRCProvenance(_MockRMFNode(data), data['filename'])
+        s.set_state_from_snapshot(data)
+        return s
+
+    def load(self, session, model):
+        if not model._has_provenance(self.filename):
+            from chimerax.map.volume import open_map
+            from chimerax.map_data import UnknownFileType
+            try:
+                maps, msg = open_map(session, self.filename)
+            except UnknownFileType:
+                return
+            v = maps[0]
+            v.set_display_style('image')
+            v.show()
+            model._add_provenance(self.filename, v)
+
+    def _get_name(self):
+        return "EM map from %s" % os.path.basename(self.filename)
+    name = property(_get_name)
+
+
+class _RMFXLMSRestraintProvenance(_RMFProvenance):
+    """Information about an XL-MS restraint"""
+
+    _snapshot_keys = ['filename']
+
+    def __init__(self, rmf_node, filename):
+        super().__init__(rmf_node)
+        self.filename = filename
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFXLMSRestraintProvenance(_MockRMFNode(data), data['filename'])
+        s.set_state_from_snapshot(data)
+        return s
+
+    def _get_name(self):
+        return "XL-MS data from %s" % os.path.basename(self.filename)
+    name = property(_get_name)
+
+
+class _RMFSAXSRestraintProvenance(_RMFProvenance):
+    """Information about a SAXS restraint"""
+
+    _snapshot_keys = ['filename']
+
+    def __init__(self, rmf_node, filename):
+        super().__init__(rmf_node)
+        self.filename = filename
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFSAXSRestraintProvenance(_MockRMFNode(data), data['filename'])
+        s.set_state_from_snapshot(data)
+        return s
+
+    def _get_name(self):
+        return "SAXS profile from %s" % os.path.basename(self.filename)
+    name = property(_get_name)
+
+
+class _RMFEM2DRestraintProvenance(_RMFProvenance):
+    """Information about a 2D EM restraint"""
+
+    _snapshot_keys = ['filename', 'pixel_size']
+
+    def __init__(self, rmf_node, filename, pixel_size):
+        super().__init__(rmf_node)
+        self.filename = filename
+        self.pixel_size = pixel_size
+
+    @staticmethod
+    def restore_snapshot(session, data):
+        s = _RMFEM2DRestraintProvenance(
+            _MockRMFNode(data), data['filename'], data['pixel_size'])
+        s.set_state_from_snapshot(data)
+        return s
+
+    def load(self, session, model):
+        if not model._has_provenance(self.filename):
+            from chimerax.map.volume import open_map
+            from chimerax.map_data import UnknownFileType
+            try:
+                maps, msg = open_map(session, self.filename)
+            except UnknownFileType:
+                return
+            v = maps[0]
+            v.data.set_step((self.pixel_size, self.pixel_size, v.data.step[2]))
+            # todo: set orientation
+            v.set_display_style('image')
+            v.show()
+            model._add_provenance(self.filename, v)
+
+    def _get_name(self):
+        return "EM class average from %s" % os.path.basename(self.filename)
+    name = property(_get_name)
+
+
+class _RMFDecoratorSignatures(object):
+    """Determine which RMF decorators each node has.
+       Each check with a factory's get_is() method is a call into RMF,
+       but most decorators can only be present on nodes of a given type.
+       Nodes of the same type thus share a dispatch plan, which lists only
+       the factories worth checking for that type. A node's signature -
+       its type plus the set of decorators it has - is cached by node
+       index, and identical signatures are shared between nodes."""
+    def __init__(self, factories, plans):
+        #: Map from name to RMF *ConstFactory object
+        self.factories = factories
+        # Map from node type to list of (factory name, prerequisite) pairs;
+        # a factory with a prerequisite is only checked if the node
+        # also has the prerequisite decorator
+        self._plans = plans
+        # Nodes of any other type are checked against every factory
+        self._default_plan = [(name, None) for name in factories]
+        self._signatures = {}
+        self._shared = {}
+        #: Names of the factories whose decorators get_static() checks
+        self.static_names = frozenset()
+        self._static = {}
+        #: Number of get_is() and get_is_static() calls made so far
+        self.probe_count = 0
+        #: If set, an _RMFProfile in which to record time spent probing
+        self.profile = None
+
+    def get(self, node):
+        """Get the type of the given node, and a frozenset of the names
+           of the factories whose decorators it has"""
+        index = node.get_index()
+        sig = self._signatures.get(index)
+        if sig is None:
+            if self.profile is None:
+                sig = self._get_signature(node)
+            else:
+                start, probes = time.perf_counter_ns(), self.probe_count
+                sig = self._get_signature(node)
+                self.profile.add('decorator probes',
+                                 time.perf_counter_ns() - start,
+                                 self.probe_count - probes)
+            sig = self._signatures[index] = self._shared.setdefault(sig, sig)
+        return sig
+
+    def get_static(self, node):
+        """Get a frozenset of the names of the factories in
+           `static_names` whose decorators the given node has with only
+           static data (i.e. get_is_static() is True), so that their
+           get_static_*() accessors can be used"""
+        index = node.get_index()
+        static = self._static.get(index)
+        if static is None:
+            node_type, decorators = self.get(node)
+            if self.profile is not None:
+                start, probes = time.perf_counter_ns(), self.probe_count
+            names = []
+            for name in decorators & self.static_names:
+                self.probe_count += 1
+                if self.factories[name].get_is_static(node):
+                    names.append(name)
+            if self.profile is not None:
+                self.profile.add('decorator probes',
+                                 time.perf_counter_ns() - start,
+                                 self.probe_count - probes)
+            static = frozenset(names)
+            static = self._static[index] = self._shared.setdefault(static,
+                                                                   static)
+        return static
+
+    def _get_signature(self, node):
+        node_type = node.get_type()
+        decorators = set()
+        for name, prereq in self._plans.get(node_type, self._default_plan):
+            if prereq is None or prereq in decorators:
+                self.probe_count += 1
+                if self.factories[name].get_is(node):
+                    decorators.add(name)
+        return node_type, frozenset(decorators)
+
+
+class _RMFAtomTable(object):
+    """Properties of the atoms read from an RMF file.
+       Rather than creating each ChimeraX atom as soon as it is encountered
+       in the RMF hierarchy, atom properties are accumulated here and all
+       atoms are then created at once by create_atoms()."""
+    def __init__(self):
+        # Map from key to name for each state that atoms are placed in,
+        # in the order the states were first encountered. The key is the
+        # RMF node index of the State node, or None for the unnamed state.
+        self.states = {}
+        # Keys of states that contain non-atomic (coarse-grained) particles
+        self.non_atomic_states = set()
+        # Each residue is (state, type, chain_id, number, rmf_name, copy,
+        # resolution)
+        self.residues = []
+        # ChimeraX residues created so far, by index
+        self._chimera_residues = {}
+        self.residue_index = []
+        self.names = []
+        self.elements = []
+        self.coords = []
+        self.radii = []
+        self.masses = []
+        # Map from atom index to RGBA color (0-255), for colored atoms only
+        self.colors = {}
+        # Map from _RMFReferenceFrame to the indexes of atoms whose
+        # coordinates are still local to that reference frame
+        self._local_coords = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_state(self, key, name):
+        """Note that the given state is needed"""
+        self.states.setdefault(key, name)
+
+    def add_residue(self, state, restype, chain_id, resnum, rmf_name, copy,
+                    resolution):
+        """Add a new residue and return its index"""
+        self.residues.append((state, restype, chain_id, resnum, rmf_name,
+                              copy, resolution))
+        return len(self.residues) - 1
+
+    def add_atom(self, residue, name, element, coord, radius, mass,
+                 refframe=None):
+        """Add a new atom in the given residue and return its index.
+           If `refframe` is given, `coord` is in that _RMFReferenceFrame,
+           and is transformed to global coordinates (together with all
+           other atoms in the same frame) by transform_coordinates()."""
+        ind = len(self.names)
+        self.residue_index.append(residue)
+        self.names.append(name)
+        self.elements.append(element)
+        self.coords.append(coord)
+        self.radii.append(radius)
+        self.masses.append(mass)
+        if refframe is not None:
+            self._local_coords.setdefault(refframe, []).append(ind)
+        return ind
+
+    def transform_coordinates(self):
+        """Convert the coordinates of all atoms added in a reference frame
+           to global coordinates, one reference frame at a time"""
+        coords = self.coords
+        for refframe, indices in self._local_coords.items():
+            local = numpy.array([coords[i] for i in indices],
+                                dtype=numpy.float64)
+            for i, c in zip(indices,
+                            refframe.get_global_coordinates(local).tolist()):
+                coords[i] = c
+        self._local_coords.clear()
+
+    def set_color(self, atom, rgb):
+        """Set the color of the given atom from an RMF (0-1) RGB color"""
+        # RMF colors are 0-1 and has no alpha; ChimeraX uses 0-255
+        self.colors[atom] = [x * 255. for x in rgb] + [255]
+
+    def _create_residue(self, residue, state):
+        (key, restype, chain_id, resnum, rmf_name, copy,
+         resolution) = self.residues[residue]
+        r = state.new_residue(restype, chain_id, resnum)
+        if rmf_name is not None:
+            r.rmf_name = rmf_name
+        if copy is not None:
+            r.copy = copy
+        if resolution is not None:
+            r.resolution = resolution
+        return r
+
+    def create_atoms(self, vectorized=True, start=0, stop=None, states=None):
+        """Create ChimeraX residues and atoms for the atoms in the table
+           from `start` up to (but not including) `stop`, or the end of the
+           table. Return a list of the new Atom objects, in the same order as
+           the table. If `states` is given, it maps the state stored with
+           each residue to the ChimeraX structure to add it to. If
+           `vectorized` is True, atom properties are set using ChimeraX's
+           vectorized Atoms setters; otherwise, they are set one atom at a
+           time."""
+        if stop is None:
+            stop = len(self.names)
+        self.transform_coordinates()
+        atoms = []
+        for name, element, residue in zip(self.names[start:stop],
+                                          self.elements[start:stop],
+                                          self.residue_index[start:stop]):
+            state = self.residues[residue][0]
+            if states is not None:
+                state = states[state]
+            r = self._chimera_residues.get(residue)
+            if r is None:
+                r = self._chimera_residues[residue] = self._create_residue(
+                    residue, state)
+            atom = state.new_atom(name, element)
+            r.add_atom(atom)
+            atoms.append(atom)
+        if not atoms:
+            return atoms
+        colored = [i for i in range(start, stop) if i in self.colors]
+        if vectorized:
+            all_atoms = Atoms(atoms)
+            all_atoms.coords = numpy.array(self.coords[start:stop],
+                                           dtype=numpy.float64)
+            all_atoms.radii = numpy.array(self.radii[start:stop],
+                                          dtype=numpy.float32)
+            all_atoms.draw_modes = numpy.full(len(atoms), Atom.SPHERE_STYLE,
+                                              dtype=numpy.uint8)
+            all_atoms.masses = numpy.array(self.masses[start:stop],
+                                           dtype=numpy.float64)
+            if colored:
+                Atoms([atoms[i - start] for i in colored]).colors = \
+                    numpy.array([self.colors[i] for i in colored],
+                                dtype=numpy.uint8)
+        else:
+            for i, atom in enumerate(atoms, start):
+                atom.coord = self.coords[i]
+                atom.radius = self.radii[i]
+                atom.draw_mode = atom.SPHERE_STYLE
+                color = self.colors.get(i)
+                if color is not None:
+                    atom.color = color
+                atom.mass = self.masses[i]
+        return atoms
+
+
+def _quaternion_to_matrix(q):
+    """Get the rotation matrix for the given quaternion"""
+    a, b, c, d = numpy.asarray(q, dtype=numpy.float64) / numpy.linalg.norm(q)
+    return numpy.array(
+        [[a * a + b * b - c * c - d * d, 2. * (b * c - a * d),
+          2. * (b * d + a * c)],
+         [2. * (b * c + a * d), a * a - b * b + c * c - d * d,
+          2. * (c * d - a * b)],
+         [2. * (b * d - a * c), 2. * (c * d + a * b),
+          a * a - b * b - c * c + d * d]])
+
+
+class _RMFReferenceFrame(object):
+    """The transformation from coordinates in an RMF reference frame to
+       global coordinates. This is equivalent to RMF.CoordinateTransformer,
+       but transforms many coordinates at once."""
+    __slots__ = ['rotation', 'translation']
+
+    def __init__(self, base, rf):
+        """Make the reference frame for the given RMF ReferenceFrame
+           decorator, nested in the `base` _RMFReferenceFrame (or None)"""
+        rotation = _quaternion_to_matrix(rf.get_rotation())
+        translation = numpy.array(rf.get_translation(), dtype=numpy.float64)
+        if base is None:
+            self.rotation, self.translation = rotation, translation
+        else:
+            self.rotation = base.rotation.dot(rotation)
+            self.translation = (base.rotation.dot(translation)
+                                + base.translation)
+
+    def get_global_coordinates(self, coords):
+        """Transform an (N,3) array of local coordinates to global"""
+        return coords.dot(self.rotation.T) + self.translation
+
+
+class _RMFHierarchyShared(object):
+    """Information shared by every _RMFHierarchyInfo of an RMF file"""
+    __slots__ = ['top_level', 'atom_table', 'resnum_for_chain']
+
+    def __init__(self, top_level, atom_table):
+        self.top_level = top_level
+        self.atom_table = atom_table
+        self.resnum_for_chain = {}
+
+    def add_existing_residues(self, residues):
+        """Make sure that residue numbers made up for new residues follow
+           those of the given, already created, residues in each chain"""
+        resnum_for_chain = self.resnum_for_chain
+        for r in residues:
+            if r.number > resnum_for_chain.get(r.chain_id, 0):
+                resnum_for_chain[r.chain_id] = r.number
+
+
+class _RMFStructureContext(object):
+    """The state, reference frame, chain, copy and resolution in effect
+       at some point in the RMF hierarchy. These are set only by a few
+       nodes, so one context is shared by all nodes under such a node."""
+    __slots__ = ['state', 'refframe', 'chain', 'copy', 'resolution']
+
+    def __init__(self, state=None, refframe=None, chain=None, copy=None,
+                 resolution=None):
+        self.state, self.refframe, self.chain = state, refframe, chain
+        self.copy, self.resolution = copy, resolution
+
+
+# Decorators that change the _RMFStructureContext
+_STRUCTURE_DECORATORS = frozenset(('statef', 'refframef', 'chainf', 'copyf',
+                                   'resolutionf'))
+
+# Decorators that change the _RMFHierarchyInfo
+_INFO_DECORATORS = _STRUCTURE_DECORATORS | frozenset(('fragmentf',
+                                                      'residuef'))
+
+
+class _RMFHierarchyInfo(object):
+    """Track structural information encountered through the RMF hierarchy.
+       Objects are never modified once their node has been handled (other
+       than to cache the residue); a node that changes the information
+       gets a new object, which shares everything that did not change
+       with its parent's."""
+
+    __slots__ = ['_shared', '_context', '_resnum', '_restype', '_residue']
+
+    def __init__(self, top_level, atom_table):
+        self._shared = _RMFHierarchyShared(top_level, atom_table)
+        self._context = _RMFStructureContext()
+        self._resnum = self._restype = self._residue = None
+
+    top_level = property(lambda self: self._shared.top_level)
+    atom_table = property(lambda self: self._shared.atom_table)
+    _state = property(lambda self: self._context.state)
+    _chain = property(lambda self: self._context.chain)
+    _resolution = property(lambda self: self._context.resolution)
+
+    def _derive(self, context):
+        """Get a new object for a child node, with the given context"""
+        rhi = _RMFHierarchyInfo.__new__(_RMFHierarchyInfo)
+        rhi._shared = self._shared
+        rhi._context = context
+        rhi._resnum, rhi._restype = self._resnum, self._restype
+        rhi._residue = self._residue
+        return rhi
+
+    def _derive_context(self, node, hnode, decorators, loader):
+        """Get a new _RMFStructureContext for the given node"""
+        old = self._context
+        c = _RMFStructureContext(old.state, old.refframe, old.chain,
+                                 old.copy, old.resolution)
+        shared = self._shared
+        if 'statef' in decorators:
+            c.state = node.get_index()
+            shared.atom_table.add_state(c.state, node.get_name())
+        if 'refframef' in decorators:
+            c.refframe = _RMFReferenceFrame(c.refframe,
+                                            loader.refframef.get(node))
+        if 'chainf' in decorators:
+            # Keep the chain's node (for its name) and chain ID
+            c.chain = (node, loader._get_topology(
+                'chainf', node, loader.chainf.get(node), 'chain_id'))
+            if not loader.replay:
+                shared.top_level._add_rmf_chain(c.chain[1],
+                                                loader.hierarchy.node(hnode))
+        if 'copyf' in decorators:
+            c.copy = loader.copyf.get(node).get_copy_index()
+        if 'resolutionf' in decorators:
+            n = loader.resolutionf.get(node)
+            c.resolution = n.get_explicit_resolution()
+            if not loader.replay:
+                shared.top_level._add_rmf_resolution(c.resolution)
+        return c
+
+    def handle_node(self, node, hnode, loader):
+        """Extract structural information from the given RMF node (the
+           node with index `hnode` in the loader's hierarchy).
+           Return the _RMFHierarchyInfo object containing this information.
+           This may be the current object, or a new one."""
+        node_type, decorators = loader.signatures.get(node)
+        if decorators.isdisjoint(_INFO_DECORATORS):
+            return self
+        if loader.profile is not None:
+            start = time.perf_counter_ns()
+        if decorators.isdisjoint(_STRUCTURE_DECORATORS):
+            rhi = self._derive(self._context)
+        else:
+            rhi = self._derive(self._derive_context(node, hnode, decorators,
+                                                    loader))
+        if 'fragmentf' in decorators:
+            f = loader.fragmentf.get(node)
+            resinds = f.get_residue_indexes()
+            rhi._residue = None  # clear residue cache
+            rhi._resnum = resinds[len(resinds) // 2]
+            rhi._restype = 'UNK'  # Guess type
+        if 'residuef' in decorators:
+            r = loader.residuef.get(node)
+            rhi._residue = None  # clear residue cache
+            rhi._resnum = loader._get_topology('residuef', node, r,
+                                               'residue_index')
+            rhi._restype = loader._get_topology('residuef', node, r,
+                                                'residue_type')
+        if loader.profile is not None:
+            loader.profile.add('hierarchy info copies',
+                               time.perf_counter_ns() - start, 1)
+        return rhi
+
+    def get_state(self):
+        """Get the key of the current state in the atom table"""
+        state = self._context.state
+        if state is None:
+            # If we're not under a State node, use the unnamed state
+            self._shared.atom_table.add_state(None, 'Unnamed state')
+        return state
+
+    def get_residue(self):
+        """Get the index of the current residue in the atom table"""
+        if self._residue is None:  # Use cached residue if available
+            state = self.get_state()
+            c = self._context
+            if c.chain is None:
+                chain_id = 'X'
+            else:
+                chain_id = c.chain[1]
+            if self._resnum is None:
+                # If RMF provides no residue info, make it up
+                resnum_for_chain = self._shared.resnum_for_chain
+                resnum = resnum_for_chain.setdefault(chain_id, 0) + 1
+                restype = 'UNK'
+                resnum_for_chain[chain_id] = resnum
+            else:
+                resnum, restype = self._resnum, self._restype
+            rmf_name = c.chain[0].get_name() if c.chain else None
+            self._residue = self._shared.atom_table.add_residue(
+                state, restype, chain_id, resnum, rmf_name, c.copy,
+                c.resolution)
+        return self._residue
+
+    def new_atom(self, p, mass, radius, name=None, element='C'):
+        """Add a new atom for the given Particle (and Atom, if applicable)
+           node, with the given mass and radius, to the atom table, and
+           return its index. The ChimeraX Atom itself is not created until
+           _RMFAtomTable.create_atoms() is called."""
+        if name is None:
+            name = 'C'
+            self._shared.atom_table.non_atomic_states.add(self.get_state())
+        # Coordinates in a reference frame are transformed later, in bulk
+        return self._shared.atom_table.add_atom(
+            self.get_residue(), name, element, p.get_coordinates(),
+            radius, mass, self._context.refframe)
+
+    def new_bond(self, a1, a2):
+        state = a1.structure
+        return state.new_bond(a1, a2)
+
+
+class _RMFLoadCancelled(Exception):
+    """Raised when reading an RMF file is cancelled"""
+    pass
+
+
+class _RMFBackgroundLoad(object):
+    """Read an RMF file in a background thread, so as not to block the
+       user interface. Once it has been read, ChimeraX models are built
+       in the main thread, one chunk at each new graphics frame, and then
+       added to the session."""
+
+    #: All loads currently in progress
+    active = []
+
+    def __init__(self, session, loader, path):
+        self.session, self.loader, self.path = session, loader, path
+        self.name = os.path.basename(path)
+        # Models can only safely be created in the main thread
+        self.top_level = _RMFModel(session, path)
+        self.error = self._build = None
+        self._read_done = False
+
+    def start(self):
+        _RMFBackgroundLoad.active.append(self)
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+        self.session.triggers.add_handler('new frame', self._new_frame)
+
+    def cancel(self):
+        """Stop reading the file. No models will be added."""
+        self.loader.cancelled = True
+
+    def _read(self):
+        try:
+            self.loader.read(self.path, self.top_level)
+        except Exception as e:
+            # Report the error later, in the main thread
+            self.error = e
+        self._read_done = True
+
+    def _new_frame(self, trigger_name, data):
+        from chimerax.core.triggerset import DEREGISTER
+        logger = self.session.logger
+        if not self._read_done:
+            # Wait for the thread to finish, or notice it was cancelled
+            if not self.loader.cancelled:
+                logger.status("Reading %s: %d%%" % (
+                    self.name, 100 * self.loader.nodes_read
+                    // max(self.loader.nodes_total, 1)))
+            return
+        if self.loader.cancelled:
+            self._finish()
+            self.top_level.delete()
+            logger.status("Reading %s was cancelled" % self.name)
+            return DEREGISTER
+        if self.error is None:
+            if self._build is None:
+                self._build = self.loader.build(self.top_level)
+            try:
+                fraction = next(self._build)
+                logger.status("Building %s: %d%%"
+                              % (self.name, 100 * fraction))
+                return
+            except StopIteration:
+                pass
+            except Exception as e:
+                self.error = e
+        if self.error is None:
+            try:
+                self.loader.read_trajectory(self.top_level)
+            except Exception as e:
+                self.error = e
+        self._finish()
+        from . import profiling
+        profiling.finish(self.loader.profile)
+        if self.error is not None:
+            self.top_level.delete()
+            logger.error("Could not read %s: %s" % (self.name, self.error))
+            return DEREGISTER
+        self.session.models.add([self.top_level])
+        logger.status("")
+        logger.info(_get_open_status(self.loader, [self.top_level]))
+        if self.session.ui.is_gui:
+            from chimerax.core.commands import run
+            run(self.session, 'tool show "RMF Viewer"', log=False)
+        return DEREGISTER
+
+    def _finish(self):
+        _RMFBackgroundLoad.active.remove(self)
+
+
+class _RMFLoader(object):
+    """Load information from an RMF file"""
+
+    _feature_provenance_class = {
+        'IMP.isd.GaussianEMRestraint': _RMFEMRestraintGMMProvenance,
+        'IMP.pmi.CrossLinkingMassSpectrometryRestraint':
+            _RMFXLMSRestraintProvenance,
+        'IMP.saxs.Restraint': _RMFSAXSRestraintProvenance,
+    }
+
+    def __init__(self, vectorized=True, resolutions=None, states=None):
+        #: If True, set atom properties using ChimeraX's vectorized
+        #: Atoms setters once all atoms have been created; otherwise,
+        #: set each property of each atom individually
+        self.vectorized = vectorized
+        #: Resolutions of representation to read, None to read all, or
+        #: 'coarsest' to read only the lowest resolution of each set of
+        #: alternatives. Nodes with an explicit resolution that is not
+        #: read, and everything under them, are skipped.
+        if resolutions is None or resolutions == 'coarsest':
+            self.resolutions = resolutions
+        else:
+            self.resolutions = frozenset(float(r) for r in resolutions)
+        # Map from RMF node index to the resolution to read for each
+        # node that is one of a set of alternatives ('coarsest' mode only)
+        self._coarsest = {}
+        #: Resolutions to read in 'coarsest' mode in addition to the
+        #: coarsest alternative
+        self.extra_resolutions = frozenset()
+        #: Indexes of the states to read, or None to read all. Other State
+        #: nodes, and everything under them, are skipped.
+        self.states = (None if states is None
+                       else frozenset(int(s) for s in states))
+        #: Number of State nodes encountered so far
+        self.state_count = 0
+        #: If True, we are revisiting nodes that were already read, so
+        #: should not add their chains or resolutions to the model again
+        self.replay = False
+        # (Atoms, index) map (see _RMFModel.get_rmf_atom_map) for atoms
+        # that were created by a previous load of the same file
+        self._existing_atoms = None
+        #: Maximum number of atoms to create in each step of build()
+        self.chunk_size = 50000
+        #: Set to True (e.g. from another thread) to abandon read()
+        self.cancelled = False
+        #: Number of nodes in the file, and number read so far
+        self.nodes_total = self.nodes_read = 0
+        #: If set, an _RMFCache used to reopen unchanged files without
+        #: reading them again
+        self.cache = None
+        #: Number of frames in the file, and the software that made it
+        self.frame_count = 0
+        self.producer = None
+        #: If set, an _RMFProfile in which to record each phase of loading
+        self.profile = None
+        #: The _RMFHierarchy that nodes are added to
+        self.hierarchy = None
+        #: Contents of the RMF file, as bytes, if it has been read into
+        #: memory; otherwise, the file is read by name (and decompressed
+        #: into this buffer, if compressed)
+        self.buffer = None
+        #: The frame to read coordinates from
+        self.frame = 0
+        #: If set, a (first, last, step) tuple of trajectory frames to
+        #: read into coordsets once the file has been loaded (see
+        #: read_trajectory()), and the number of frames so read
+        self.trajectory = None
+        self.trajectory_frames_read = 0
+        # The _RMFFileHandle opened by read(), kept so that the
+        # trajectory can be read without opening the file again
+        self._rmf_handle = None
+        #: If True, read topology (masses, radii, elements, residues and
+        #: chain IDs) from the static data of each node with the
+        #: get_static_*() accessors; the value in `frame` is only used for
+        #: nodes that have no static data for a decorator. If False, read
+        #: everything as it is in `frame`.
+        self.static_topology = False
+        #: Map from each topology field read with `static_topology` to
+        #: a [static, per-frame] list of the number of times it was read
+        #: from static data, and from `frame` because there was none
+        self.topology_report = {}
+
+    def _open(self, path):
+        """Open the given RMF file at `frame`, and set up the
+           decorator factories and keys needed to read it.
+           Return the file handle."""
+        if sys.platform == 'darwin':
+            from .mac import RMF
+        elif sys.platform == 'linux':
+            from .linux import RMF
+        else:
+            from .windows import RMF
+
+        self.GAUSSIAN_PARTICLE = RMF.GAUSSIAN_PARTICLE
+        self.PARTICLE = RMF.PARTICLE
+        self.PROVENANCE = RMF.PROVENANCE
+        self.NodeID = RMF.NodeID
+        self._RMF = RMF
+
+        if self.buffer is None and _is_compressed(path):
+            self.buffer = _read_rmf_buffer(path)
+        r = _open_rmf_handle(RMF, path, self.buffer)
+        self.particlef = RMF.ParticleConstFactory(r)
+        self.iparticlef = RMF.IntermediateParticleConstFactory(r)
+        self.gparticlef = RMF.GaussianParticleConstFactory(r)
+        self.ballf = RMF.BallConstFactory(r)
+        self.strucprovf = RMF.StructureProvenanceConstFactory(r)
+        self.sampleprovf = RMF.SampleProvenanceConstFactory(r)
+        self.scriptprovf = RMF.ScriptProvenanceConstFactory(r)
+        self.softwareprovf = RMF.SoftwareProvenanceConstFactory(r)
+        self.coloredf = RMF.ColoredConstFactory(r)
+        self.chainf = RMF.ChainConstFactory(r)
+        self.fragmentf = RMF.FragmentConstFactory(r)
+        self.residuef = RMF.ResidueConstFactory(r)
+        self.refframef = RMF.ReferenceFrameConstFactory(r)
+        self.statef = RMF.StateConstFactory(r)
+        self.bondf = RMF.BondConstFactory(r)
+        self.represf = RMF.RepresentationConstFactory(r)
+        self.altf = RMF.AlternativesConstFactory(r)
+        self.copyf = RMF.CopyConstFactory(r)
+        self.resolutionf = RMF.ExplicitResolutionConstFactory(r)
+        self.atomf = RMF.AtomConstFactory(r)
+        self.segmentf = RMF.SegmentConstFactory(r)
+        self.signatures = self._get_decorator_signatures(RMF)
+        self.signatures.profile = self.profile
+        self.atom_table = _RMFAtomTable()
+        # Map from RMF node index to index in the atom table (or _NO_ATOM)
+        self.rmf_index_to_atom = numpy.full(r.get_number_of_nodes(), _NO_ATOM,
+                                            dtype=numpy.int32)
+        # Objects (or hierarchy node indexes) that refer to atoms, which
+        # can only be filled in once the atoms have been created
+        self._atom_nodes = []
+        self._bond_nodes = []
+        self._feature_atoms = []
+        self._segments = []
+
+        imp_restraint_cat = r.get_category("IMP restraint")
+        keys = dict((r.get_name(k), k)
+                    for k in r.get_keys(imp_restraint_cat))
+        self.rsr_typek = keys.get('type')
+        self.rsr_pixelsizek = keys.get('pixel size')
+
+        imp_restraint_fn_cat = r.get_category("IMP restraint files")
+        keys = dict((r.get_name(k), k)
+                    for k in r.get_keys(imp_restraint_fn_cat))
+        self.rsr_filenamek = keys.get('filename')
+        self.rsr_imagefilesk = keys.get('image files')
+
+        numframes = r.get_number_of_frames()
+        if self.frame != 0 and not 0 <= self.frame < numframes:
+            raise ValueError("Cannot read frame %d; %s has %d frame%s"
+                             % (self.frame, os.path.basename(path), numframes,
+                                "" if numframes == 1 else "s"))
+        r.set_current_frame(RMF.FrameID(self.frame))
+        return r
+
+    def load(self, path, session):
+        top_level = _RMFModel(session, path)
+        self.read(path, top_level)
+        for _ in self.build(top_level):
+            pass
+        self.read_trajectory(top_level)
+        return [top_level]
+
+    def read(self, path, top_level):
+        """Read the RMF file into the given new _RMFModel. Its hierarchy,
+           features and provenance are filled in, but atoms and other
+           geometry are only stored in the loader. No ChimeraX objects are
+           created, so this can be run in a background thread; call build()
+           afterwards to create them. If a cache is in use, the file is only
+           read if it is not already in the cache."""
+        self._start_read(path, top_level)
+        if self.cache is not None:
+            start = time.perf_counter_ns()
+            key = self.cache.get_key(path, self._get_cache_options())
+            data = self.cache.load(key)
+            if data is not None:
+                self._set_cache_data(data, top_level)
+                self._record('cache load', start, len(self.atom_table))
+                return
+            self._record('cache lookup', start)
+        start = time.perf_counter_ns()
+        r = self._open(path)
+        top_level._rmf_buffer = self.buffer
+        if self.trajectory is not None:
+            self._rmf_handle = _RMFFileHandle(self._RMF, r,
+                                              _get_file_stamp(path))
+        self._record('open file', start)
+        start = time.perf_counter_ns()
+        self.nodes_total = r.get_number_of_nodes()
+        self.frame_count = r.get_number_of_frames()
+        self.producer = r.get_producer()
+        rhi = _RMFHierarchyInfo(top_level, self.atom_table)
+        self.hierarchy = _RMFHierarchy()
+        # The set of chain IDs to read from each named input structure file
+        _provenance_chains = {}
+        root, = self._handle_node(r.get_root_node(), rhi,
+                                  top_level.rmf_features,
+                                  top_level.rmf_provenance,
+                                  os.path.dirname(path), _provenance_chains,
+                                  None)
+        top_level.rmf_hierarchy = self.hierarchy.node(root)
+        self._record('read hierarchy', start, self.nodes_read)
+        start = time.perf_counter_ns()
+        self.atom_table.transform_coordinates()
+        self._record('transform coordinates', start)
+        if self.cache is not None:
+            start = time.perf_counter_ns()
+            self.cache.save(key, self._get_cache_data(top_level))
+            self._record('cache save', start)
+
+    def read_data(self, path, top_level, data):
+        """Fill in the given new _RMFModel from data previously read from
+           the RMF file at `path` (as returned by _get_cache_data()), as
+           if read() had been called. Call build() afterwards to create
+           ChimeraX objects."""
+        self._start_read(path, top_level)
+        self._set_cache_data(data, top_level)
+
+    def _start_read(self, path, top_level):
+        """Set up the given new _RMFModel (or _RMFFileInfo) for reading"""
+        if self.resolutions is None or self.resolutions == 'coarsest':
+            top_level._rmf_read_resolutions = self.resolutions
+        else:
+            top_level._rmf_read_resolutions = sorted(self.resolutions)
+        top_level.rmf_filename = os.path.abspath(path)
+        top_level._rmf_frame = self.frame
+        top_level._rmf_static_topology = self.static_topology
+        top_level.rmf_features = []
+        top_level.rmf_provenance = []
+
+    def _record(self, phase, start, objects=0):
+        """Record the time since `start` (from time.perf_counter_ns())
+           for the given phase, if profiling"""
+        if self.profile is not None:
+            self.profile.add(phase, time.perf_counter_ns() - start, objects)
+
+    def _get_cache_options(self):
+        """Get the options that affect what read() reads from a file"""
+        res = self.resolutions
+        if res is not None and res != 'coarsest':
+            res = sorted(res)
+        options = (res, None if self.states is None
+                   else sorted(self.states), self.frame)
+        if self.static_topology:
+            # Only add this when set, so that existing keys do not change
+            options += ('static topology',)
+        return options
+
+    def _get_cache_data(self, top_level):
+        """Get everything read from the RMF file by read(), as a dict of
+           NumPy arrays (plus other data in the 'meta' entry) suitable for
+           storing in an _RMFCache"""
+        def get_preorder(roots):
+            def visit(node, parent):
+                pos[id(node)] = len(nodes)
+                nodes.append(node)
+                parents.append(parent)
+                return [(child, pos[id(node)]) for child in node.children]
+            nodes = []
+            parents = []
+            _walk_tree([(root, -1) for root in roots], visit)
+            return nodes, numpy.array(parents, dtype=numpy.int64)
+
+        def get_node_index(hnode):
+            return -1 if hnode is None else hnode._index
+
+        def get_provenance(prov):
+            # Get (class name, snapshot) for a provenance object and each of
+            # its previous states
+            chain = []
+            while prov is not None:
+                data = prov.take_snapshot(None, None)
+                data['previous'] = None
+                data['hierarchy_node'] = get_node_index(
+                    data['hierarchy_node'])
+                chain.append((type(prov).__name__, data))
+                prov = prov.previous
+            return chain
+
+        pos = {}
+        h = self.hierarchy
+        features, feature_parents = get_preorder(top_level.rmf_features)
+        at = self.atom_table
+        meta = {
+            'frame_count': self.frame_count,
+            'producer': self.producer,
+            'state_count': self.state_count,
+            'features': [(f.name, f.rmf_index) for f in features],
+            'feature_atoms': [(pos[id(f)], indices)
+                              for f, indices, rhi in self._feature_atoms],
+            'segments': [([tuple(c) for c in coords], name)
+                         for coords, name, rhi in self._segments],
+            'provenance': [get_provenance(p)
+                           for p in top_level.rmf_provenance],
+            'chains': [(chain_id, get_node_index(hnode))
+                       for chain_id, hnode in top_level._rmf_chains],
+            'resolutions': top_level._rmf_resolutions,
+            'skipped_resolutions': top_level._skipped_rmf_resolutions,
+            'selected_resolutions': top_level._selected_rmf_resolutions,
+            'skipped_nodes': top_level._skipped_rmf_nodes,
+            'skipped_states': top_level._skipped_rmf_states,
+            'state_indexes': top_level._rmf_state_indexes,
+            'states': at.states,
+            'non_atomic_states': at.non_atomic_states,
+            'residues': at.residues,
+            'elements': at.elements,
+            'colors': at.colors,
+            'topology_report': self.topology_report}
+        return {
+            'meta': meta,
+            'node_names': numpy.array(h.names, dtype=str),
+            'node_name': h.name,
+            'node_rmf_index': h.rmf_index,
+            'node_resolution': h.resolution,
+            'node_parent': h.parent,
+            'feature_parent': feature_parents,
+            'atom_name': numpy.array(at.names, dtype=str),
+            'atom_residue': numpy.array(at.residue_index, dtype=numpy.int64),
+            'atom_coord': numpy.array(at.coords,
+                                      dtype=numpy.float64).reshape(-1, 3),
+            'atom_radius': numpy.array(at.radii, dtype=numpy.float64),
+            'atom_mass': numpy.array(at.masses, dtype=numpy.float64),
+            'atom_node': numpy.array(self._atom_nodes,
+                                     dtype=numpy.int64).reshape(-1, 2),
+            'rmf_index_to_atom': self.rmf_index_to_atom,
+            'bond_node': numpy.array(
+                [(hnode, b[0], b[1]) for hnode, b, rhi in self._bond_nodes],
+                dtype=numpy.int64).reshape(-1, 3)}
+
+    def _set_cache_data(self, data, top_level):
+        """Fill in the loader and the given _RMFModel from data previously
+           returned by _get_cache_data(), as if read() had been called"""
+        def make_features(names, indices, parents, roots):
+            nodes = []
+            for name, index, parent in zip(names, indices, parents):
+                node = _RMFFeature(_MockRMFNode({'name': str(name),
+                                                 'rmf_index': int(index)}))
+                if parent < 0:
+                    roots.append(node)
+                else:
+                    nodes[parent].add_child(node)
+                nodes.append(node)
+            return nodes
+
+        def get_node(index):
+            return None if index < 0 else h.node(index)
+
+        def make_provenance(chain):
+            prov = None
+            for clsname, d in reversed(chain):
+                d['previous'] = prov
+                d['hierarchy_node'] = get_node(d['hierarchy_node'])
+                prov = globals()[clsname].restore_snapshot(None, d)
+            return prov
+
+        meta = data['meta']
+        self.frame_count = meta['frame_count']
+        self.producer = meta['producer']
+        self.state_count = meta['state_count']
+        self.topology_report = meta.get('topology_report', {})
+        h = self.hierarchy = _RMFHierarchy._from_columns(
+            data['node_names'].tolist(), data['node_name'],
+            data['node_parent'], data['node_rmf_index'],
+            data['node_resolution'])
+        top_level.rmf_hierarchy = h.node(0)
+        features = make_features(
+            [f[0] for f in meta['features']],
+            [f[1] for f in meta['features']], data['feature_parent'],
+            top_level.rmf_features)
+        top_level.rmf_provenance.extend(make_provenance(chain)
+                                        for chain in meta['provenance'])
+        top_level._rmf_chains = [(chain_id, get_node(p))
+                                 for chain_id, p in meta['chains']]
+        top_level._rmf_resolutions = meta['resolutions']
+        top_level._skipped_rmf_resolutions = meta['skipped_resolutions']
+        top_level._selected_rmf_resolutions = meta['selected_resolutions']
+        top_level._skipped_rmf_nodes = meta['skipped_nodes']
+        top_level._skipped_rmf_states = meta['skipped_states']
+        top_level._rmf_state_indexes = meta['state_indexes']
+
+        at = self.atom_table = _RMFAtomTable()
+        at.states = meta['states']
+        at.non_atomic_states = meta['non_atomic_states']
+        at.residues = meta['residues']
+        at.elements = meta['elements']
+        at.colors = meta['colors']
+        at.names = data['atom_name'].tolist()
+        at.residue_index = data['atom_residue'].tolist()
+        at.coords = data['atom_coord']
+        at.radii = data['atom_radius']
+        at.masses = data['atom_mass'].tolist()
+        self.rmf_index_to_atom = data['rmf_index_to_atom']
+        self._atom_nodes = [tuple(x) for x in data['atom_node'].tolist()]
+        # Atoms, bonds, features and segments are not associated with any
+        # particular part of the hierarchy once read
+        rhi = _RMFHierarchyInfo(top_level, at)
+        self._bond_nodes = [(hnode, (b0, b1), rhi)
+                            for hnode, b0, b1 in data['bond_node'].tolist()]
+        self._feature_atoms = [(features[f], indices, rhi)
+                               for f, indices in meta['feature_atoms']]
+        self._segments = [(coords, name, rhi)
+                          for coords, name in meta['segments']]
+
+    def build(self, top_level):
+        """Create ChimeraX states and atoms for everything read by read(),
+           and then the bonds, features, geometry and hierarchy nodes that
+           refer to them. This is a generator which creates at most
+           `chunk_size` atoms at each step, and yields the fraction of
+           all atoms created so far."""
+        def get_atoms(indices):
+            """Get the ChimeraX Atom (or None) for each RMF node index"""
+            indices = numpy.asarray(indices, dtype=numpy.intp)
+            pos = self.rmf_index_to_atom[indices]
+            found = [None if p == _NO_ATOM else atoms[p]
+                     for p in pos.tolist()]
+            if self._existing_atoms is not None:
+                old_atoms, old_index = self._existing_atoms
+                missing = numpy.nonzero((pos == _NO_ATOM)
+                                        & (indices < len(old_index)))[0]
+                old_pos = old_index[indices[missing]]
+                for i, p in zip(missing.tolist(), old_pos.tolist()):
+                    if p != _NO_ATOM:
+                        found[i] = old_atoms[p]
+            return found
+        start = time.perf_counter_ns()
+        states = {}
+        for key, name in self.atom_table.states.items():
+            if key is None:
+                states[key] = top_level.get_unnamed_state()
+            else:
+                states[key] = top_level._get_rmf_state(key, name)
+        for key in self.atom_table.non_atomic_states:
+            states[key]._atomic = False
+        self._record('create states', start, len(states))
+        natoms = len(self.atom_table)
+        atoms = []
+        while len(atoms) < natoms:
+            start = time.perf_counter_ns()
+            chunk = self.atom_table.create_atoms(
+                self.vectorized, len(atoms), len(atoms) + self.chunk_size,
+                states)
+            atoms.extend(chunk)
+            self._record('create atoms', start, len(chunk))
+            yield len(atoms) / natoms
+        start = time.perf_counter_ns()
+        if self._atom_nodes:
+            hnodes, atom_indices = zip(*self._atom_nodes)
+            self.hierarchy.set_objects(hnodes,
+                                       [atoms[a] for a in atom_indices])
+        self._record('map atoms to hierarchy', start, len(self._atom_nodes))
+        start = time.perf_counter_ns()
+        bond_atoms = get_atoms([b for hnode, bond, rhi in self._bond_nodes
+                                for b in bond])
+        for (hnode, bond, rhi), atom0, atom1 in zip(
+                self._bond_nodes, bond_atoms[::2], bond_atoms[1::2]):
+            if atom0 is not None and atom1 is not None:
+                self.hierarchy.set_object(hnode, rhi.new_bond(atom0, atom1))
+        self._record('create bonds', start, len(self._bond_nodes))
+        start = time.perf_counter_ns()
+        self._add_features(get_atoms)
+        self._record('create features', start, len(self._feature_atoms))
+        start = time.perf_counter_ns()
+        self._add_segments(top_level)
+        self._record('create segments', start, len(self._segments))
+        # The model's atom map must be rebuilt to include the new atoms
+        top_level._rmf_atom_map = None
+        # Streamed frames of the states do not include the new atoms
+        for state in states.values():
+            if state._rmf_stream is not None:
+                state._rmf_stream.atoms_changed()
+
+    def read_trajectory(self, top_level):
+        """Read the requested trajectory frames, if any (see `trajectory`),
+           into coordsets of every state of the given _RMFModel. This must
+           be called after build(). The file handle opened by read() is
+           put in the model's pool of handles, so the file is not opened
+           again unless it was read from the cache."""
+        if self.trajectory is None:
+            return
+        from .cmd import _RMFTrajectoryLoader
+        first, last, step = self.trajectory
+        t = _RMFTrajectoryLoader()
+        t.profile = self.profile
+        states = list(top_level._rmf_states.values())
+        if top_level._unnamed_state is not None:
+            states.append(top_level._unnamed_state)
+        if self._rmf_handle is not None:
+            top_level._rmf_handles.release(self._rmf_handle)
+            self._rmf_handle = None
+        self.trajectory_frames_read = t.load_states(states, first, last,
+                                                    step)
+        if self.frame != 0:
+            # Coordset 1, which holds the frame the file was opened at, may
+            # now have been replaced with frame 0, so show that frame's own
+            # coordset instead, reading it if it was not in the trajectory
+            coordset_id = self.frame + 1
+            for state in states:
+                if coordset_id not in state.coordset_ids:
+                    state.add_coordset(coordset_id,
+                                       t.read_frame(state, self.frame))
+                state.active_coordset_id = coordset_id
+
+    def _add_features(self, get_atoms):
+        """Set the ChimeraX object for each feature read. Features that act
+           on two atoms get a pseudobond, all made at once for each state;
+           others get the list of atoms they act on."""
+        # Map from state to the features, first atoms and second atoms of
+        # all pseudobonds in that state
+        pairs = {}
+        multi_features = []
+        multi_atoms = []
+        multi_counts = []
+        all_atoms = get_atoms([i for feature, indices, rhi
+                               in self._feature_atoms for i in indices])
+        end = 0
+        for feature, indices, rhi in self._feature_atoms:
+            start, end = end, end + len(indices)
+            feature_atoms = [a for a in all_atoms[start:end] if a is not None]
+            if len(feature_atoms) == 2:
+                state = feature_atoms[0].structure
+                p = pairs.get(state)
+                if p is None:
+                    p = pairs[state] = ([], [], [])
+                p[0].append(feature)
+                p[1].append(feature_atoms[0])
+                p[2].append(feature_atoms[1])
+            else:
+                multi_features.append(feature)
+                multi_atoms.extend(feature_atoms)
+                multi_counts.append(len(feature_atoms))
+        for state, (features, atoms1, atoms2) in pairs.items():
+            pbonds = state._add_pseudobonds(Atoms(atoms1), Atoms(atoms2))
+            for feature, pbond in zip(features, pbonds):
+                feature.chimera_obj = pbond
+        if multi_features:
+            # All features share a single Atoms collection
+            all_atoms = Atoms(multi_atoms)
+            ends = numpy.cumsum(multi_counts)
+            for feature, end, count in zip(multi_features, ends.tolist(),
+                                           multi_counts):
+                feature._set_atom_indices(
+                    all_atoms, numpy.arange(end - count, end,
+                                            dtype=numpy.int32))
+
+    def _add_segments(self, top_level):
+        """Add a cylinder to the model for each segment read"""
+        # Only segments with two points are drawn
+        segments = [(coords, name) for coords, name, rhi in self._segments
+                    if len(coords) == 2]
+        if not segments:
+            return
+        ends = numpy.array([coords for coords, name in segments],
+                           dtype=numpy.float64)
+        # Skip zero-length lines
+        keep = numpy.linalg.norm(ends[:, 1] - ends[:, 0], axis=1) >= 1e-6
+        if keep.any():
+            top_level.add_cylinders(
+                ends[keep, 0], ends[keep, 1],
+                [name for (coords, name), k in zip(segments, keep) if k])
+
+    def load_skipped_resolution(self, model, resolution):
+        """Read the parts of the hierarchy at the given resolution that were
+           skipped when the given _RMFModel was loaded.
+           Return the number of new atoms."""
+        records = [(index, parent_index)
+                   for res, index, parent_index in model._skipped_rmf_nodes
+                   if res == resolution]
+        if not records:
+            return 0
+        skipped_nodes = model._skipped_rmf_nodes
+        model._skipped_rmf_nodes = [rec for rec in skipped_nodes
+                                    if rec[0] != resolution]
+        model._skipped_rmf_resolutions.discard(resolution)
+        self.resolutions = frozenset(
+            [res for res in model._selected_rmf_resolutions
+             if res is not None] + [resolution])
+        try:
+            return self._load_skipped_nodes(model, records)
+        except Exception:
+            # Keep the records, so that reading can be tried again
+            model._skipped_rmf_nodes = skipped_nodes
+            model._skipped_rmf_resolutions.add(resolution)
+            raise
+
+    def load_skipped_state(self, model, istate):
+        """Read the istate'th state, if it was skipped when the given
+           _RMFModel was loaded. Return the number of new atoms."""
+        records = [(index, parent_index)
+                   for i, name, index, parent_index
+                   in model._skipped_rmf_states if i == istate]
+        if not records:
+            return 0
+        skipped_states = model._skipped_rmf_states
+        model._skipped_rmf_states = [rec for rec in skipped_states
+                                     if rec[0] != istate]
+        # The states are revisited out of order, so count them here
+        model._rmf_state_indexes.update((index, istate)
+                                        for index, parent_index in records)
+        # Read the same resolutions as for the rest of the model, plus any
+        # that were read on demand since
+        selected = frozenset(res for res in model._selected_rmf_resolutions
+                             if res is not None)
+        if model._rmf_read_resolutions == 'coarsest':
+            self.resolutions = 'coarsest'
+            self.extra_resolutions = selected
+        elif model._rmf_read_resolutions is not None:
+            self.resolutions = selected
+        try:
+            return self._load_skipped_nodes(model, records)
+        except Exception:
+            # Keep the records, so that reading can be tried again
+            model._skipped_rmf_states = skipped_states
+            for index, parent_index in records:
+                del model._rmf_state_indexes[index]
+            raise
+
+    def _load_skipped_nodes(self, model, records):
+        """Read the given (RMF node index, parent RMF node index) nodes,
+           and everything under them, that were skipped when the given
+           _RMFModel was loaded. New atoms are added to the model's existing
+           states (or new states), and new hierarchy nodes to the existing
+           hierarchy. Return the number of new atoms."""
+        self.buffer = model._rmf_buffer
+        self.frame = model._rmf_frame
+        self.static_topology = model._rmf_static_topology
+        r = self._open(model.rmf_filename)
+        model._rmf_buffer = self.buffer
+        h = self.hierarchy = model.rmf_hierarchy._hierarchy
+        hnodes = dict(zip(h.rmf_index.tolist(), range(len(h))))
+        self._existing_atoms = model.get_rmf_atom_map()
+
+        top_rhi = _RMFHierarchyInfo(model, self.atom_table)
+        for state in model.child_models():
+            if isinstance(state, _RMFState):
+                top_rhi._shared.add_existing_residues(state.residues)
+        rhi_cache = {}
+        rmf_dir = os.path.dirname(model.rmf_filename)
+        for index, parent_index in records:
+            parent = hnodes.get(parent_index)
+            if parent is None:
+                continue
+            rhi = self._get_hierarchy_info(r, parent, top_rhi, rhi_cache)
+            self._handle_node(r.get_node(self.NodeID(index)), rhi,
+                              model.rmf_features, model.rmf_provenance,
+                              rmf_dir, {}, parent, parent_hnode=parent,
+                              read_alternatives=False)
+        for _ in self.build(model):
+            pass
+        return len(self.atom_table)
+
+    def _get_hierarchy_info(self, r, hnode, top_rhi, cache):
+        """Get the _RMFHierarchyInfo for an already-read hierarchy node,
+           by revisiting each node on the path to it from the root"""
+        h = self.hierarchy
+        path = []
+        while hnode >= 0 and int(h.rmf_index[hnode]) not in cache:
+            path.append(hnode)
+            hnode = int(h.parent[hnode])
+        rhi = top_rhi if hnode < 0 else cache[int(h.rmf_index[hnode])]
+        self.replay = True
+        try:
+            for hnode in reversed(path):
+                rmf_index = int(h.rmf_index[hnode])
+                rhi = rhi.handle_node(r.get_node(self.NodeID(rmf_index)),
+                                      hnode, self)
+                cache[rmf_index] = rhi
+        finally:
+            self.replay = False
+        return rhi
+
+    def _get_decorator_signatures(self, RMF):
+        provenance = ['strucprovf', 'sampleprovf', 'scriptprovf',
+                      'softwareprovf']
+        hierarchy = ['statef', 'refframef', 'chainf', 'copyf', 'resolutionf',
+                     'fragmentf', 'residuef', 'iparticlef', 'altf']
+        particle = ['particlef', 'atomf', 'coloredf']
+        # Decorators are only checked for the node types RMF allows them
+        # on; particle and color information is only needed for atoms
+        plans = {
+            RMF.REPRESENTATION: ([(name, None) for name in hierarchy]
+                                 + [(name, 'iparticlef')
+                                    for name in particle]),
+            RMF.ORGANIZATIONAL: [('refframef', None)],
+            RMF.GEOMETRY: [('ballf', None), ('coloredf', 'ballf'),
+                           ('segmentf', None)],
+            RMF.FEATURE: [('represf', None)],
+            RMF.BOND: [('bondf', None)],
+            RMF.PROVENANCE: [(name, None) for name in provenance]}
+        names = (hierarchy + particle + provenance
+                 + ['ballf', 'segmentf', 'represf', 'bondf'])
+        signatures = _RMFDecoratorSignatures(
+            dict((name, getattr(self, name)) for name in names), plans)
+        if self.static_topology:
+            # Decorators that topology is read from
+            signatures.static_names = frozenset(
+                ['particlef', 'iparticlef', 'ballf', 'atomf', 'residuef',
+                 'chainf'])
+        return signatures
+
+    def _get_probe_count(self):
+        return self.signatures.probe_count
+
+    #: Number of calls made into RMF to check for node decorators
+    probe_count = property(_get_probe_count)
+
+    def _get_topology(self, name, node, decorator, field):
+        """Get a topology field (such as 'mass') of the given node's
+           decorator from the factory `name`. If `static_topology` is set
+           and the node has only static data for the decorator, its
+           get_static_*() accessor is used; otherwise, the value is read
+           from the current frame."""
+        if not self.static_topology:
+            return getattr(decorator, 'get_' + field)()
+        static = name in self.signatures.get_static(node)
+        if not self.replay:
+            self.topology_report.setdefault(field, [0, 0])[
+                0 if static else 1] += 1
+        return getattr(decorator, ('get_static_' if static else 'get_')
+                       + field)()
+
+    def _add_atom(self, node, p, pname, mass, rhi, decorators):
+        radius = self._get_topology(pname, node, p, 'radius')
+        if 'atomf' in decorators:
+            ap = self.atomf.get(node)
+            name = node.get_name()
+            # ChimeraX names must not exceed 4 characters, so strip RMF/IMP
+            # HET: prefix if present
+            if name.startswith('HET:'):
+                name = name[4:].strip()
+            atom = rhi.new_atom(
+                p, mass, radius, name=name,
+                element=self._get_topology('atomf', node, ap, 'element'))
+        else:
+            atom = rhi.new_atom(p, mass, radius)
+        self.rmf_index_to_atom[node.get_index()] = atom
+        if 'coloredf' in decorators:
+            c = self.coloredf.get(node)
+            self.atom_table.set_color(atom, c.get_rgb_color())
+        return atom
+
+    def _handle_provenance(self, node, provenance_chains, parent_node):
+        def visit(node, next_prov):
+            prov = self._make_provenance(node, provenance_chains)
+            prov.hierarchy_node = hierarchy_node
+            if next_prov is None:
+                top.append(prov)
+            else:
+                next_prov.set_previous(prov)
+            # Provenance nodes *should* only have at most one "child"
+            return [(child, prov) for child in node.get_children()]
+        start = time.perf_counter_ns()
+        hierarchy_node = (None if parent_node is None
+                          else self.hierarchy.node(parent_node))
+        top = []
+        _walk_tree([(node, None)], visit)
+        self._record('read provenance', start, 1)
+        return top[0]
+
+    def _make_provenance(self, node, provenance_chains):
+        node_type, decorators = self.signatures.get(node)
+        if 'strucprovf' in decorators:
+            return _RMFStructureProvenance(node, self.strucprovf.get(node),
+                                           provenance_chains)
+        elif 'sampleprovf' in decorators:
+            return _RMFSampleProvenance(node, self.sampleprovf.get(node))
+        elif 'scriptprovf' in decorators:
+            return _RMFScriptProvenance(node, self.scriptprovf.get(node))
+        elif 'softwareprovf' in decorators:
+            return _RMFSoftwareProvenance(node, self.softwareprovf.get(node))
+        else:
+            return _RMFProvenance(node)
+
+    def _handle_feature_provenance(self, node, rmf_dir):
+        def get_node_filename(node):
+            fname = node.get_value(self.rsr_filenamek)
+            if fname:
+                # path is relative to that of the RMF file
+                return os.path.join(rmf_dir, fname)
+        # noop if these keys aren't in the file at all
+        if self.rsr_typek is None:
+            return
+        rsrtype = node.get_value(self.rsr_typek)
+        if self.rsr_filenamek:
+            cls = self._feature_provenance_class.get(rsrtype)
+            if cls:
+                fname = get_node_filename(node)
+                if fname:
+                    return cls(node, fname)
+        if rsrtype == 'IMP.em2d.PCAFitRestraint':
+            return self._make_em2d_provenance(node, rmf_dir)
+
+    def _make_em2d_provenance(self, node, rmf_dir):
+        if not self.rsr_imagefilesk or not self.rsr_pixelsizek:
+            return
+        pixel_size = node.get_value(self.rsr_pixelsizek)
+        images = node.get_value(self.rsr_imagefilesk)
+        if images and pixel_size:
+            return [_RMFEM2DRestraintProvenance(
+                node, os.path.join(rmf_dir, fname), pixel_size)
+                for fname in images]
+
+    def _handle_feature(self, node, parent_rhi, rmf_dir, provenance):
+        def visit(node, parent):
+            feature = _RMFFeature(node)
+            self._add_feature(feature, self.represf.get(node), parent_rhi)
+            # Extract provenance from restraint if present
+            if self.profile is None:
+                p = self._handle_feature_provenance(node, rmf_dir)
+            else:
+                start = time.perf_counter_ns()
+                p = self._handle_feature_provenance(node, rmf_dir)
+                self._record('read feature provenance', start,
+                             len(p) if isinstance(p, list) else int(bool(p)))
+            if p:
+                if isinstance(p, list):
+                    provenance.extend(p)
+                else:
+                    provenance.append(p)
+            if parent is None:
+                top.append(feature)
+            else:
+                parent.add_child(feature)
+            return [(child, feature) for child in node.get_children()
+                    if 'represf' in self.signatures.get(child)[1]]
+        top = []
+        _walk_tree([(node, None)], visit)
+        return top[0]
+
+    def _handle_node(self, node, parent_rhi, features, provenance, rmf_dir,
+                     provenance_chains, parent_node, parent_hnode=None,
+                     read_alternatives=True):
+        """Handle the given RMF node and everything under it. Return a list
+           of the indexes of the new nodes in the hierarchy for the node,
+           plus those for any alternatives to it. If `parent_hnode` (the
+           index of an existing node) is given, the new nodes are instead
+           added as its children. If `read_alternatives` is False,
+           alternatives to the given node are not read."""
+        def get_children(node, decorators, rhi, hnode, context):
+            parent_rhi, parent_hnode, parent_node, read_alternatives = context
+            if rhi is None:
+                # Node was skipped, so don't read its children
+                children = []
+            else:
+                child_context = (rhi, hnode, hnode, True)
+                children = [(child, child_context)
+                            for child in node.get_children()]
+            # Handle any alternatives (usually different resolutions)
+            # Alternatives replace the current node - they are not children
+            # of it - so use parent_rhi, not rhi. They are walked after
+            # the node's children, so are added to the parent after this
+            # node.
+            if 'altf' in decorators and read_alternatives:
+                alt_context = (parent_rhi, parent_hnode,
+                               parent_node if hnode is None else hnode, True)
+                children.extend((alt, alt_context)
+                                for alt in self._get_alternatives(node))
+            return children
+
+        def visit(node, context):
+            if self.cancelled:
+                raise _RMFLoadCancelled()
+            self.nodes_read += 1
+            parent_rhi, parent_hnode, parent_node, read_alternatives = context
+            node_type, decorators = self.signatures.get(node)
+            # Features are handled outside of the regular hierarchy
+            if 'represf' in decorators:
+                features.append(self._handle_feature(node, parent_rhi,
+                                                     rmf_dir, provenance))
+                return
+
+            # Provenance is handled outside of the regular hierarchy
+            if node_type == self.PROVENANCE:
+                provenance.append(self._handle_provenance(
+                    node, provenance_chains, parent_node))
+                return
+
+            if 'statef' in decorators and self._skip_state(node, parent_rhi,
+                                                           parent_hnode):
+                return
+
+            if (self.resolutions == 'coarsest' and 'altf' in decorators
+                    and read_alternatives):
+                self._set_coarsest_alternative(node)
+            res = self._get_skipped_resolution(node, decorators)
+            if res is not None:
+                # Record the node so that it can be read later if requested
+                parent_rhi.top_level._add_skipped_rmf_node(
+                    res, node.get_index(),
+                    None if parent_hnode is None
+                    else int(hierarchy.rmf_index[parent_hnode]))
+                # Still read any alternatives, which may be at resolutions
+                # we do want
+                return get_children(node, decorators, None, None, context)
+
+            if parent_hnode is None:
+                hnode = hierarchy.add_node(node.get_name(), node.get_index())
+                rmf_nodes.append(hnode)
+            else:
+                hnode = hierarchy.add_node(node.get_name(), node.get_index(),
+                                           parent_hnode)
+            # Get hierarchy-related info from this node (e.g. chain, state)
+            rhi = parent_rhi.handle_node(node, hnode, self)
+            if rhi._resolution is not None:
+                hierarchy.set_resolution(hnode, rhi._resolution)
+            self._handle_node_geometry(node, decorators, hnode, rhi)
+            return get_children(node, decorators, rhi, hnode, context)
+
+        hierarchy = self.hierarchy
+        rmf_nodes = []
+        _walk_tree([(node, (parent_rhi, parent_hnode, parent_node,
+                            read_alternatives))], visit)
+        return rmf_nodes
+
+    def _get_alternatives(self, node):
+        """Get all alternatives to the given node, excluding the node
+           itself"""
+        alt = self.altf.get(node)
+        # The node itself should be the first alternative, so ignore that
+        return (list(alt.get_alternatives(self.PARTICLE))[1:]
+                + list(alt.get_alternatives(self.GAUSSIAN_PARTICLE)))
+
+    def _set_coarsest_alternative(self, node):
+        """Mark only the lowest resolution (i.e. the largest explicit
+           resolution) of the given node and its alternatives for reading"""
+        nodes = [node] + self._get_alternatives(node)
+        resolutions = [self.resolutionf.get(n).get_explicit_resolution()
+                       for n in nodes
+                       if 'resolutionf' in self.signatures.get(n)[1]]
+        if resolutions:
+            coarsest = max(resolutions)
+            for n in nodes:
+                self._coarsest[n.get_index()] = coarsest
+
+    def _skip_state(self, node, rhi, parent_hnode):
+        """Return True iff the node is a State we don't want to read.
+           Skipped states are recorded in the model."""
+        istate = self.state_count
+        self.state_count += 1
+        if self.states is None or istate in self.states:
+            rhi.top_level._rmf_state_indexes.setdefault(node.get_index(),
+                                                        istate)
+            return False
+        rhi.top_level._add_skipped_rmf_state(
+            istate, node.get_name(), node.get_index(),
+            None if parent_hnode is None
+            else int(self.hierarchy.rmf_index[parent_hnode]))
+        return True
+
+    def _get_skipped_resolution(self, node, decorators):
+        """If the node is at a resolution we don't want to read, return
+           that resolution; otherwise, return None"""
+        if self.resolutions is None or 'resolutionf' not in decorators:
+            return None
+        res = self.resolutionf.get(node).get_explicit_resolution()
+        if self.resolutions == 'coarsest':
+            if (res == self._coarsest.get(node.get_index(), res)
+                    or res in self.extra_resolutions):
+                return None
+        elif res in self.resolutions:
+            return None
+        return res
+
+    def _handle_node_geometry(self, node, decorators, hnode, rhi):
+        """Add any atoms, bonds, or other geometry for the given node"""
+        if 'iparticlef' in decorators:
+            # todo: special handling for Gaussians; right now we assume that
+            # every Gaussian is also a Particle, as 1) this is the case for
+            # IMP-generated structures and 2) particlef.get_is() returns True
+            # for Gaussians anyway (since it appears to only check for mass)
+            ip = self.iparticlef.get(node)
+            mass = 0.
+            if 'particlef' in decorators:
+                mass = self._get_topology('particlef', node,
+                                          self.particlef.get(node), 'mass')
+            atom = self._add_atom(node, ip, 'iparticlef', mass, rhi,
+                                  decorators)
+            self._atom_nodes.append((hnode, atom))
+        elif 'ballf' in decorators:
+            # balls have no mass
+            atom = self._add_atom(node, self.ballf.get(node), 'ballf', 0.,
+                                  rhi, decorators)
+            self._atom_nodes.append((hnode, atom))
+        if 'bondf' in decorators:
+            self._add_bond(hnode, self.bondf.get(node), rhi)
+        if 'segmentf' in decorators:
+            self._add_segment(self.segmentf.get(node), node.get_name(), rhi)
+
+    def _add_bond(self, node, bond, rhi):
+        # Bonds are created only once all atoms exist
+        self._bond_nodes.append(
+            (node, (bond.get_bonded_0().get_index(),
+                    bond.get_bonded_1().get_index()), rhi))
+
+    def _add_feature(self, feature, rmf_feature, rhi):
+        # Features are created only once all atoms exist
+        indices = [x.get_index() for x in rmf_feature.get_representation()]
+        self._feature_atoms.append((feature, indices, rhi))
+
+    def _add_segment(self, segment, name, rhi):
+        # Segments are drawn only once all atoms exist
+        self._segments.append((segment.get_coordinates_list(), name, rhi))
@@ -0,0 +1,151 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+"""Lightweight instrumentation of the phases of reading RMF files.
+
+   Profiling is off by default, in which case loaders have no profile and
+   each instrumented point costs only a check against None."""
+
+import json
+import os
+import time
+
+#: Environment variable naming a directory in which to write a cProfile
+#: dump and a JSON trace for every RMF file opened
+PROFILE_ENV = 'CHIMERAX_RMF_PROFILE'
+
+_enabled = False
+_last_profile = None
+
+
+class _RMFProfile(object):
+    """Wall time (in nanoseconds), number of calls and number of objects
+       handled, for each phase of an operation on an RMF file"""
+
+    def __init__(self, operation, filename):
+        self.operation = operation
+        self.filename = filename
+        # Map from phase name to [time, calls, objects], in the order
+        # the phases were first encountered
+        self.phases = {}
+        self._start = time.perf_counter_ns()
+        #: Total wall time of the operation, once finished
+        self.total_ns = None
+
+    def add(self, phase, ns, objects=0):
+        """Record a call to the given phase that took `ns` nanoseconds"""
+        p = self.phases.get(phase)
+        if p is None:
+            self.phases[phase] = [ns, 1, objects]
+        else:
+            p[0] += ns
+            p[1] += 1
+            p[2] += objects
+
+    def finish(self):
+        """Note that the operation is complete"""
+        self.total_ns = time.perf_counter_ns() - self._start
+
+    def get_json(self):
+        """Get the profile as a JSON-compatible dict"""
+        return {'operation': self.operation,
+                'filename': self.filename,
+                'total_ns': self.total_ns,
+                'phases': [{'name': name, 'ns': p[0], 'calls': p[1],
+                            'objects': p[2]}
+                           for name, p in self.phases.items()]}
+
+    def get_html(self):
+        """Get the profile as an HTML table"""
+        from chimerax.core.logger import html_table_params
+        body_template = """
+    <tr>
+      <td>%s</td>
+      <td>%.3f</td>
+      <td>%d</td>
+      <td>%d</td>
+    </tr>
+"""
+        body = "\n".join(body_template % (name, p[0] / 1e9, p[1], p[2])
+                         for name, p in self.phases.items())
+        title = "%s of %s" % (self.operation,
+                              os.path.basename(self.filename))
+        if self.total_ns is not None:
+            title += " (total %.3f s)" % (self.total_ns / 1e9)
+        return """
+<table %s>
+  <thead>
+    <tr>
+      <th colspan="4">%s</th>
+    </tr>
+    <tr>
+      <th>Phase</th>
+      <th>Time (s)</th>
+      <th>Calls</th>
+      <th>Objects</th>
+    </tr>
+  </thead>
+
+  <tbody>
+    %s
+  </tbody>
+</table>
+""" % (html_table_params, title, body)
+
+
+def set_enabled(enabled):
+    """Turn profiling of RMF operations on or off"""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    """Return True iff RMF operations should be profiled"""
+    return _enabled or bool(os.environ.get(PROFILE_ENV))
+
+
+def new_profile(operation, filename):
+    """Get a new _RMFProfile for the given operation on the given file,
+       or None if profiling is disabled"""
+    global _last_profile
+    if not is_enabled():
+        return None
+    _last_profile = _RMFProfile(operation, filename)
+    return _last_profile
+
+
+def get_last_profile():
+    """Get the most recently created _RMFProfile, or None"""
+    return _last_profile
+
+
+def start_cprofile():
+    """If the profiling environment variable is set, start and return
+       a cProfile.Profile; otherwise, return None"""
+    if os.environ.get(PROFILE_ENV):
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+        return prof
+
+
+def finish(profile, cprofile=None):
+    """Finish the given _RMFProfile (which may be None), and stop the given
+       cProfile.Profile (which may also be None). If the profiling
+       environment variable is set, write them to files in the directory
+       it names."""
+    if cprofile is not None:
+        cprofile.disable()
+    if profile is None:
+        return
+    profile.finish()
+    directory = os.environ.get(PROFILE_ENV)
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, "%s-%s-%d" % (
+        os.path.basename(profile.filename),
+        profile.operation.replace(' ', '_'), time.time_ns()))
+    with open(prefix + '.json', 'w') as fh:
+        json.dump(profile.get_json(), fh, indent=2)
+    if cprofile is not None:
+        cprofile.dump_stats(prefix + '.prof')
@@ -0,0 +1,30 @@
+# vim: set expandtab shiftwidth=4 softtabstop=4:
+
+from chimerax.core.settings import Settings
+
+
+class _RMFSettings(Settings):
+    AUTO_SAVE = {
+        # Resolutions of representation to read when opening RMF files,
+        # None to read all of them, or 'coarsest' to read only the lowest
+        # resolution of each set of alternative representations
+        'resolutions': 'coarsest',
+        # If True, read RMF files in a background thread when a GUI is
+        # available, rather than blocking until the file is read
+        'background': False,
+        # Maximum size, in megabytes, of the on-disk cache of RMF files
+        # (0 to disable caching). Caching writes to the user's cache
+        # directory, so must be turned on explicitly.
+        'cache_size': 0,
+    }
+
+
+_settings = None
+
+
+def get_settings(session):
+    """Get the RMF settings, reading them from disk on first use"""
+    global _settings
+    if _settings is None:
+        _settings = _RMFSettings(session, "RMF")
+    return _settings
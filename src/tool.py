@@ -6,6 +6,7 @@ from chimerax.atomic import Atoms, Bonds, Pseudobonds, Atom, Bond, Pseudobond
 from Qt.QtCore import QItemSelectionModel
 from Qt import QtWidgets
 from Qt.QtCore import QAbstractItemModel, QModelIndex, Qt
+from .io import _walk_tree
 
 
 class _RMFHierarchyModel(QAbstractItemModel):
@@ -14,16 +15,21 @@ class _RMFHierarchyModel(QAbstractItemModel):
         super().__init__()
         self.rmf_hierarchy = rmf_hierarchy
         self._resolutions = resolutions
+        # Qt does not keep a reference to the objects used for indices,
+        # so keep any nodes we give it alive here
+        self._nodes = {}
         if self.rmf_hierarchy:
+            self._hierarchy = self.rmf_hierarchy._hierarchy
             self._filter_resolution(self.rmf_hierarchy)
 
     def _filter_resolution(self, node):
-        node._filtered_children = [c for c in node.children
-                                   if c.resolution in self._resolutions]
-        # children not _filtered_children so parent-child relationships
-        # are correct at all levels
-        for c in node.children:
-            self._filter_resolution(c)
+        node._hierarchy.set_resolution_filter(self._resolutions)
+
+    def _get_node(self, index):
+        node = self._nodes.get(index)
+        if node is None:
+            node = self._nodes[index] = self._hierarchy.node(index)
+        return node
 
     def set_resolution_filter(self, resolution, shown):
         """Filter nodes; show those at given `resolution` only iff
@@ -39,17 +45,14 @@ class _RMFHierarchyModel(QAbstractItemModel):
 
     def index_for_node(self, rmf_node):
         """Return the index for a given node in the hierarchy"""
-        parent = rmf_node.parent
-        if parent is None:
+        if rmf_node.parent is None:
             return self.index(0, 0, QModelIndex())
         else:
-            parent = parent()
-            try:
-                row = parent._filtered_children.index(rmf_node)
-            except ValueError:
+            row = self._hierarchy.get_filtered_row(rmf_node._index)
+            if row < 0:
                 # The node is not in the (filtered) hierarchy
                 return QModelIndex()
-            return self.createIndex(row, 0, rmf_node)
+            return self.createIndex(row, 0, self._get_node(rmf_node._index))
 
     def columnCount(self, parent):
         # We always have just a single column (the node's name)
@@ -63,7 +66,8 @@ class _RMFHierarchyModel(QAbstractItemModel):
             return 0 if self.rmf_hierarchy is None else 1
         else:
             parent_item = parent.internalPointer()
-            return len(parent_item._filtered_children)
+            return self._hierarchy.get_filtered_child_count(
+                parent_item._index)
 
     def index(self, row, column, parent):
         if not self.hasIndex(row, column, parent):
@@ -77,30 +81,28 @@ class _RMFHierarchyModel(QAbstractItemModel):
                 return self.createIndex(row, column, self.rmf_hierarchy)
         else:
             parent_item = parent.internalPointer()
-            return self.createIndex(row, column,
-                                    parent_item._filtered_children[row])
+            child = self._hierarchy.get_filtered_child(parent_item._index,
+                                                       row)
+            return self.createIndex(row, column, self._get_node(child))
 
     def parent(self, index):
         """Get the parent of the given index (as another index)"""
         if not index.isValid():
             return QModelIndex()
-        child_item = index.internalPointer()
-        parent_item = child_item.parent
-        if parent_item is None:
+        h = self._hierarchy
+        parent = int(h.parent[index.internalPointer()._index])
+        if parent < 0:
             # hidden top level node doesn't have an index
             return QModelIndex()
+        elif h.parent[parent] < 0:
+            # top of the RMF hierarchy is always the 0th row of the
+            # hidden top level node
+            row = 0
         else:
-            parent_item = parent_item()
-            if parent_item.parent is None:
-                # top of the RMF hierarchy is always the 0th row of the
-                # hidden top level node
-                row = 0
-            else:
-                # otherwise, look up the parent in the grandparent's list of
-                # children to determine its row
-                row = parent_item.parent()._filtered_children.index(
-                    parent_item)
-            return self.createIndex(row, 0, parent_item)
+            # otherwise, look up the parent in the grandparent's list of
+            # children to determine its row
+            row = h.get_filtered_row(parent)
+        return self.createIndex(row, 0, self._get_node(parent))
 
     def data(self, index, role):
         if not index.isValid() or role != Qt.DisplayRole:
@@ -327,11 +329,29 @@ class RMFViewer(ToolInstance):
             cb.setChecked(res in m._selected_rmf_resolutions)
             cb.clicked.connect(
                 lambda *, cb=cb, tree=tree, resolution=res:
-                self._resolution_button_clicked(cb, tree, resolution))
+                self._resolution_button_clicked(cb, tree, resolution, m))
             label_and_res.addWidget(cb)
 
         layout.addLayout(label_and_res)
 
+        skipped_states = getattr(m, '_skipped_rmf_states', None)
+        if skipped_states:
+            states = QtWidgets.QHBoxLayout()
+            states.setContentsMargins(0, 0, 0, 0)
+            states.setSpacing(0)
+            label = QtWidgets.QLabel("Unread states")
+            states.addWidget(label)
+            state_list = QtWidgets.QComboBox()
+            state_list.addItems("%d: %s" % (s[0], s[1])
+                                for s in skipped_states)
+            states.addWidget(state_list, stretch=1)
+            read_button = QtWidgets.QPushButton("Read")
+            read_button.clicked.connect(
+                lambda *, state_list=state_list, m=m, button=read_button:
+                self._read_state_button_clicked(state_list, m, button))
+            states.addWidget(read_button)
+            layout.addLayout(states)
+
         tree.setAnimated(False)
         tree.setIndentation(20)
         tree.setSelectionMode(QtWidgets.QTreeView.ExtendedSelection)
@@ -415,18 +435,18 @@ class RMFViewer(ToolInstance):
 
     def _get_selected_chimera_objects(self, tree):
         def _get_node_objects(node, objs):
-            o = node.chimera_obj
+            o = h.get_object(node)
             if o and not o.deleted:
                 objs.append(o)
-            for child in node._filtered_children:
-                _get_node_objects(child, objs)
+            return [(child, objs) for child in h.get_filtered_children(node)]
         objs = []
         inds = tree.selectedIndexes()
-        for ind in inds:
-            _get_node_objects(ind.internalPointer(), objs)
+        roots = [ind.internalPointer() for ind in inds]
         # If empty selection, use the root instead
         if not inds:
-            _get_node_objects(tree.model().rmf_hierarchy, objs)
+            roots = [tree.model().rmf_hierarchy]
+        h = roots[0]._hierarchy
+        _walk_tree([(root._index, objs) for root in roots], _get_node_objects)
         objects = Objects()
         objects.add_atoms(Atoms(x for x in objs if isinstance(x, Atom)))
         objects.add_bonds(Bonds(x for x in objs if isinstance(x, Bond)))
@@ -434,12 +454,13 @@ class RMFViewer(ToolInstance):
 
     def _get_selected_features(self, tree):
         def get_child_chimera_obj(feat):
-            for child in feat.children:
-                o = child.chimera_obj
-                if o:
-                    yield o
-                for obj in get_child_chimera_obj(child):
-                    yield obj
+            def visit(feat, context):
+                if feat.chimera_obj:
+                    objs.append(feat.chimera_obj)
+                return [(child, None) for child in feat.children]
+            objs = []
+            _walk_tree([(child, None) for child in feat.children], visit)
+            return objs
 
         def get_selection():
             for f in tree.selectedIndexes():
@@ -478,25 +499,27 @@ class RMFViewer(ToolInstance):
         view(self.session, self._get_selected_chimera_objects(tree))
 
     def _show_only_button_clicked(self, tree):
-        def show_only(node, show_roots, under_root=False, show=True):
+        def show_only(node, context):
+            under_root, show = context
             if not under_root and show and node in show_roots:
                 under_root = True
-            o = node.chimera_obj
+            o = h.get_object(node)
             if o:
                 o.display = under_root and show
             if under_root:
-                to_show = frozenset(node._filtered_children)
-                for child in node.children:
-                    show_only(child, show_roots, under_root, child in to_show)
+                to_show = frozenset(h.get_filtered_children(node))
+                return [(child, (under_root, child in to_show))
+                        for child in h.get_children(node)]
             else:
-                for child in node.children:
-                    show_only(child, show_roots, under_root)
-        show_roots = frozenset(ind.internalPointer()
+                return [(child, (under_root, True))
+                        for child in h.get_children(node)]
+        show_roots = frozenset(ind.internalPointer()._index
                                for ind in tree.selectedIndexes())
         top = tree.model().rmf_hierarchy
+        h = top._hierarchy
         if not show_roots:
-            show_roots = frozenset([top])
-        show_only(top, show_roots)
+            show_roots = frozenset([top._index])
+        _walk_tree([(top._index, (False, True))], show_only)
 
     def _select_feature(self, tree):
         from chimerax.std_commands.select import select
@@ -521,11 +544,42 @@ class RMFViewer(ToolInstance):
         for obj in objs or tree.model().rmf_provenance:
             obj.load(self.session, m)
 
-    def _resolution_button_clicked(self, checkbox, tree, resolution):
+    def _read_state_button_clicked(self, state_list, m, read_button=None):
+        i = state_list.currentIndex()
+        if i < 0:
+            return
+        istate = m._skipped_rmf_states[i][0]
+        # Don't let the state be read again while it is being read
+        if read_button is not None:
+            read_button.setEnabled(False)
+        try:
+            # The new state will be added as a new model, which will
+            # trigger a rebuild of the UI
+            m._load_skipped_rmf_state(istate)
+        except Exception as e:
+            self.session.logger.error("Could not read state %d of %s: %s"
+                                      % (istate, m, e))
+            if read_button is not None:
+                read_button.setEnabled(True)
+
+    def _resolution_button_clicked(self, checkbox, tree, resolution,
+                                   m=None):
         model = tree.model()
         selmodel = tree.selectionModel()
         selected = [ind.internalPointer()
                     for ind in selmodel.selectedIndexes()]
+        if (checkbox.isChecked() and m is not None
+                and resolution in getattr(m, '_skipped_rmf_resolutions', ())):
+            # This resolution was not read when the file was opened,
+            # so read it now
+            try:
+                m._load_skipped_rmf_resolution(resolution)
+            except Exception as e:
+                self.session.logger.error(
+                    "Could not read resolution %.1f of %s: %s"
+                    % (resolution, m, e))
+                checkbox.setChecked(False)
+                return
         model.set_resolution_filter(resolution, checkbox.isChecked())
         mode = QItemSelectionModel.ClearAndSelect
         for s in selected:
@@ -79,6 +79,13 @@ class _Signal:
 class QPushButton:
     def __init__(self, txt):
         self.clicked = _Signal()
+        self._enabled = True
+
+    def setEnabled(self, enabled):
+        self._enabled = enabled
+
+    def isEnabled(self):
+        return self._enabled
 
     def click(self):
         self.clicked._call()
@@ -87,18 +94,29 @@ class QPushButton:
 class QComboBox:
     def __init__(self):
         self.currentIndexChanged = _Signal()
+        self._items = []
+        self._current_index = -1
 
     def currentIndex(self):
-        return -1
+        return self._current_index
 
     def setCurrentIndex(self, ind):
-        pass
+        self._current_index = ind
 
     def clear(self):
-        pass
+        self._items = []
+        self._current_index = -1
 
     def addItems(self, items):
-        pass
+        self._items.extend(items)
+        if self._current_index < 0 and self._items:
+            self._current_index = 0
+
+    def count(self):
+        return len(self._items)
+
+    def itemText(self, i):
+        return self._items[i]
 
 
 class QStackedWidget:
@@ -0,0 +1,6 @@
+import atexit
+import shutil
+import tempfile
+
+user_cache_dir = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, user_cache_dir, ignore_errors=True)
@@ -4,6 +4,7 @@ import weakref
 class Pseudobond(object):
     def __init__(self, atom1, atom2):
         self.atoms = (atom1, atom2)
+        self.halfbond = True
 
 
 class PseudobondGroup(object):
@@ -15,6 +16,10 @@ class PseudobondGroup(object):
         self.pseudobonds.append(p)
         return p
 
+    def new_pseudobonds(self, atoms1, atoms2):
+        return Pseudobonds([self.new_pseudobond(a1, a2)
+                            for a1, a2 in zip(atoms1, atoms2)])
+
 
 class Bond(object):
     def __init__(self, atom1, atom2):
@@ -44,8 +49,8 @@ class Atom(object):
 
 
 class Residue(object):
-    def __init__(self, name, chain_id):
-        pass
+    def __init__(self, name, chain_id, number):
+        self.name, self.chain_id, self.number = name, chain_id, number
 
     def add_atom(self, atom):
         atom.structure.atoms.append(atom)
@@ -68,6 +73,8 @@ class Structure(object):
         self.id = (1, 1)
         self.id_string = '1.1'
         self.coordset_ids = [1]
+        self.coordsets = {}
+        self._active_coordset_id = 1
 
     def take_snapshot(self, session, flags):
         return {'mock snapshot': None}
@@ -81,9 +88,33 @@ class Structure(object):
     def set_state_from_snapshot(self, session, data):
         pass
 
+    def delete(self):
+        self.was_deleted = True
+
     def add_coordset(self, id, coord):
         if id not in self.coordset_ids:
             self.coordset_ids.append(id)
+        self.coordsets[id] = [tuple(c) for c in coord]
+        # Replacing the active coordset moves the atoms
+        if id == self._active_coordset_id:
+            self._set_atom_coords(id)
+
+    def _set_atom_coords(self, id):
+        for a, c in zip(self.atoms, self.coordsets[id]):
+            a.coord = c
+
+    def _get_active_coordset_id(self):
+        return self._active_coordset_id
+
+    def _set_active_coordset_id(self, id):
+        if id not in self.coordset_ids:
+            raise IndexError("No coordset %d" % id)
+        self._active_coordset_id = id
+        if id in self.coordsets:
+            self._set_atom_coords(id)
+
+    active_coordset_id = property(_get_active_coordset_id,
+                                  _set_active_coordset_id)
 
     def apply_auto_styling(self, set_lighting=False, style=None):
         pass
@@ -93,7 +124,7 @@ class Structure(object):
 
     def new_residue(self, residue_name, chain_id, pos, insert=None,
                     *, precedes=None):
-        r = Residue(residue_name, chain_id)
+        r = Residue(residue_name, chain_id, pos)
         self.residues.append(r)
         return r
 
@@ -123,11 +154,69 @@ class AtomicShapeDrawing(object):
     def add_shape(self, vertices, normals, triangles, color, description=None):
         self._shapes.append((vertices, normals, triangles, color, description))
 
+    def add_shapes(self, shape_info):
+        for s in shape_info:
+            self.add_shape(s.vertices, s.normals, s.triangles, s.color,
+                           description=s.description)
+
+
+class AtomicShapeInfo(object):
+    def __init__(self, vertices, normals, triangles, color, atoms,
+                 description):
+        self.vertices = vertices
+        self.normals = normals
+        self.triangles = triangles
+        self.color = color
+        self.atoms = atoms
+        self.description = description
+
+
+def _atoms_property(attr):
+    """Make a mock vectorized property that sets the given Atom attribute"""
+    def getter(self):
+        return [getattr(a, attr) for a in self._atom_pointers]
+
+    def setter(self, values):
+        if not hasattr(values, '__len__'):
+            values = [values] * len(self._atom_pointers)
+        for a, v in zip(self._atom_pointers, values):
+            setattr(a, attr, v)
+    return property(getter, setter)
+
 
 class Atoms:
     def __init__(self, atom_pointers=[]):
         self._atom_pointers = list(atom_pointers)
 
+    def __len__(self):
+        return len(self._atom_pointers)
+
+    def __iter__(self):
+        return iter(self._atom_pointers)
+
+    def __getitem__(self, i):
+        # As for ChimeraX Collection, only an int or a slice
+        if isinstance(i, slice):
+            return Atoms(self._atom_pointers[i])
+        elif isinstance(i, int):
+            return self._atom_pointers[i]
+        raise TypeError("Atoms can only be indexed by int or slice")
+
+    def filter(self, mask_or_indices):
+        is_mask = getattr(mask_or_indices, 'dtype', None) == bool
+        mask_or_indices = list(mask_or_indices)
+        if is_mask or (mask_or_indices
+                       and isinstance(mask_or_indices[0], bool)):
+            return Atoms([a for a, m in zip(self._atom_pointers,
+                                            mask_or_indices) if m])
+        return Atoms([self._atom_pointers[i] for i in mask_or_indices])
+
+    coords = _atoms_property('coord')
+    radii = _atoms_property('radius')
+    colors = _atoms_property('color')
+    draw_modes = _atoms_property('draw_mode')
+    masses = _atoms_property('mass')
+
     @property
     def coord_indices(self):
         return [a.coord_index for a in self._atom_pointers]
@@ -150,3 +239,15 @@ class Bonds:
 class Pseudobonds:
     def __init__(self, pseudobond_pointers=None):
         self._pseudobond_pointers = list(pseudobond_pointers)
+
+    def __len__(self):
+        return len(self._pseudobond_pointers)
+
+    def __iter__(self):
+        return iter(self._pseudobond_pointers)
+
+    def _set_halfbonds(self, value):
+        for p in self._pseudobond_pointers:
+            p.halfbond = value
+
+    halfbonds = property(None, _set_halfbonds)
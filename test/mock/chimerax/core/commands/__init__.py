@@ -19,3 +19,30 @@ def register(name, cmd_desc=(), function=None, *, logger=None, registry=None):
 
 def run(session, text, *, log=True, downgrade_errors=False):
     pass
+
+
+class FloatArg:
+    pass
+
+
+class BoolArg:
+    pass
+
+
+class EnumOf:
+    def __init__(self, values, ids=None, abbreviations=None):
+        self.values = values
+
+
+class ListOf:
+    def __init__(self, annotation, min_size=0, max_size=None, name=None):
+        self.annotation = annotation
+
+
+class Or:
+    def __init__(self, *annotations, name=None):
+        self.annotations = annotations
+
+
+class StringArg:
+    pass
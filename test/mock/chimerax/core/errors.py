@@ -0,0 +1,2 @@
+class UserError(ValueError):
+    pass
@@ -0,0 +1,14 @@
+import copy
+
+
+class Settings:
+    AUTO_SAVE = {}
+    EXPLICIT_SAVE = {}
+
+    def __init__(self, session, tool_name, version="1"):
+        for d in (self.AUTO_SAVE, self.EXPLICIT_SAVE):
+            for key, value in d.items():
+                setattr(self, key, copy.copy(value))
+
+    def save(self, *args, **kwargs):
+        pass
@@ -11,5 +11,6 @@ class TriggerSet:
         self._tm[name].append(func)
 
     def activate_trigger(self, name, data, absent_okay=False):
-        for func in self._tm.get(name, []):
-            func(name, data)
+        for func in list(self._tm.get(name, [])):
+            if func(name, data) == DEREGISTER:
+                self._tm[name].remove(func)
@@ -0,0 +1,103 @@
+import os
+import utils
+import unittest
+import numpy
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+utils.set_search_paths(TOPDIR)
+
+import src.cache  # noqa: E402
+
+
+def make_file(fname, contents):
+    with open(fname, 'w') as fh:
+        fh.write(contents)
+
+
+class Tests(unittest.TestCase):
+    def test_get_key(self):
+        """Test _RMFCache.get_key()"""
+        with utils.temporary_directory() as tmpdir:
+            cache = src.cache._RMFCache(tmpdir, 1000)
+            fname = os.path.join(tmpdir, 'test.rmf')
+            make_file(fname, 'foo')
+            key = cache.get_key(fname, (None, None))
+            self.assertEqual(cache.get_key(fname, (None, None)), key)
+            # Key depends on the options used to read the file
+            self.assertNotEqual(cache.get_key(fname, ('coarsest', None)),
+                                key)
+            # Key depends on file contents and modification time
+            make_file(fname, 'bar')
+            os.utime(fname, ns=(0, 0))
+            key = cache.get_key(fname, (None, None))
+            make_file(fname, 'baz')
+            os.utime(fname, ns=(0, 0))
+            self.assertNotEqual(cache.get_key(fname, (None, None)), key)
+            os.utime(fname, ns=(0, 10))
+            self.assertNotEqual(cache.get_key(fname, (None, None)), key)
+
+    def test_save_load(self):
+        """Test _RMFCache save and load"""
+        with utils.temporary_directory() as tmpdir:
+            cache = src.cache._RMFCache(os.path.join(tmpdir, 'cache'), 10000)
+            self.assertIsNone(cache.load('foo'))
+            meta = {'x': {1, 2}, 'y': [(1, 'a', None)], 4: {None: 2.5}}
+            cache.save('foo', {'meta': meta,
+                               'coords': numpy.array([1., 2., 3.])})
+            data = cache.load('foo')
+            self.assertEqual(data['meta'], meta)
+            self.assertIsInstance(data['meta']['y'][0], tuple)
+            self.assertEqual(list(data['coords']), [1., 2., 3.])
+
+            # Metadata that cannot be stored as JSON is not cached
+            cache.save('bar', {'meta': object()})
+            self.assertIsNone(cache.load('bar'))
+
+            # Pickled data is never loaded
+            fname = os.path.join(tmpdir, 'cache', 'bar.npz')
+            numpy.savez(fname, meta=numpy.array([object()]))
+            self.assertIsNone(cache.load('bar'))
+            self.assertFalse(os.path.exists(fname))
+
+            # Corrupt files are treated as missing, and removed
+            fname = os.path.join(tmpdir, 'cache', 'bar.npz')
+            make_file(fname, 'garbage')
+            self.assertIsNone(cache.load('bar'))
+            self.assertFalse(os.path.exists(fname))
+
+    def test_evict(self):
+        """Test removal of least recently used files from the cache"""
+        def get_keys():
+            return sorted(os.path.splitext(f)[0]
+                          for f in os.listdir(tmpdir))
+        with utils.temporary_directory() as tmpdir:
+            cache = src.cache._RMFCache(tmpdir, 100000)
+            data = {'meta': None, 'coords': numpy.zeros(1000)}
+            cache.save('foo', data)
+            cache.save('bar', data)
+            os.utime(os.path.join(tmpdir, 'foo.npz'), (0, 0))
+            os.utime(os.path.join(tmpdir, 'bar.npz'), (10, 10))
+            # Loading marks foo as recently used
+            cache.load('foo')
+            cache.max_size = 10000
+            cache.evict()
+            self.assertEqual(get_keys(), ['foo'])
+            # Files too large to fit are not kept
+            cache.max_size = 0
+            cache.save('baz', data)
+            self.assertEqual(get_keys(), [])
+
+    def test_clear(self):
+        """Test _RMFCache.clear()"""
+        with utils.temporary_directory() as tmpdir:
+            cache = src.cache._RMFCache(os.path.join(tmpdir, 'cache'), 10000)
+            # Nothing to do if the cache directory doesn't exist
+            self.assertEqual(cache.clear(), 0)
+            cache.save('foo', {'meta': None})
+            cache.save('bar', {'meta': None})
+            self.assertEqual(cache.clear(), 2)
+            self.assertEqual(os.listdir(os.path.join(tmpdir, 'cache')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,9 @@ utils.set_search_paths(TOPDIR)
 import src  # noqa: E402
 import src.cmd  # noqa: E402
 import src.io  # noqa: E402
+import src.settings  # noqa: E402
+import src.cache  # noqa: E402
+import src.profiling  # noqa: E402
 from utils import make_session  # noqa: E402
 
 INDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'input'))
@@ -18,10 +21,14 @@ RMF = utils.import_rmf_module()
 class MockLogger(object):
     def __init__(self):
         self.info_log = []
+        self.warning_log = []
 
     def info(self, msg, is_html=False):
         self.info_log.append((msg, is_html))
 
+    def warning(self, msg):
+        self.warning_log.append(msg)
+
 
 from chimerax.core.session import Session  # noqa: E402
 
@@ -58,8 +65,8 @@ def make_test_rmf_hierarchy():
     child2 = make_node("child2", 2)
     grandchild1 = make_node("grandchild1", 3)
     grandchild2 = make_node("grandchild2", 4)
-    root.children.extend((child1, child2))
-    child1.children.extend((grandchild1, grandchild2))
+    root.add_children((child1, child2))
+    child1.add_children((grandchild1, grandchild2))
     test_model = MockModel()
     test_model.rmf_hierarchy = root
     return test_model
@@ -81,6 +88,24 @@ class Tests(unittest.TestCase):
         ci = MockCommandInfo("rmf readtraj", "test synopsis")
         bundle_api.register_command(None, ci, None)
 
+        ci = MockCommandInfo("rmf settings", "test synopsis")
+        bundle_api.register_command(None, ci, None)
+
+        ci = MockCommandInfo("rmf cancel", "test synopsis")
+        bundle_api.register_command(None, ci, None)
+
+        ci = MockCommandInfo("rmf cache clear", "test synopsis")
+        bundle_api.register_command(None, ci, None)
+
+        ci = MockCommandInfo("rmf profile", "test synopsis")
+        bundle_api.register_command(None, ci, None)
+
+        ci = MockCommandInfo("rmf openensemble", "test synopsis")
+        bundle_api.register_command(None, ci, None)
+
+        ci = MockCommandInfo("rmf frame", "test synopsis")
+        bundle_api.register_command(None, ci, None)
+
         ci = MockCommandInfo("bad command", "test synopsis")
         self.assertRaises(ValueError, bundle_api.register_command,
                           None, ci, None)
@@ -111,6 +136,89 @@ class Tests(unittest.TestCase):
         log, is_html = mock_session.logger.info_log[-1]
         self.assertEqual(get_li_lines(log), ['root', 'child1', 'child2'])
 
+    def test_settings(self):
+        """Test settings command"""
+        mock_session = MockSession('test')
+        src.cmd.settings(mock_session)
+        self.assertEqual(
+            mock_session.logger.info_log[-1][0],
+            'Resolutions read by default from RMF files: coarsest\n'
+            'Read RMF files in the background: no\n'
+            'Maximum size of the RMF cache: disabled')
+        try:
+            src.cmd.settings(mock_session, resolution=[10, 1],
+                             cache_size=512)
+            self.assertEqual(
+                mock_session.logger.info_log[-1][0],
+                'Resolutions read by default from RMF files: 1.0, 10.0\n'
+                'Read RMF files in the background: no\n'
+                'Maximum size of the RMF cache: 512 MB')
+            self.assertEqual(
+                src.settings.get_settings(mock_session).resolutions,
+                [1., 10.])
+            src.cmd.settings(mock_session, resolution='all', background=True,
+                             cache_size=0)
+            self.assertEqual(
+                mock_session.logger.info_log[-1][0],
+                'Resolutions read by default from RMF files: all\n'
+                'Read RMF files in the background: yes\n'
+                'Maximum size of the RMF cache: disabled')
+            self.assertIsNone(
+                src.settings.get_settings(mock_session).resolutions)
+        finally:
+            src.cmd.settings(mock_session, resolution='coarsest',
+                             background=False, cache_size=0)
+        self.assertEqual(src.settings.get_settings(mock_session).resolutions,
+                         'coarsest')
+        self.assertFalse(src.settings.get_settings(mock_session).background)
+
+    def test_cancel_none(self):
+        """Test cancel command with nothing to cancel"""
+        mock_session = MockSession('test')
+        src.cmd.cancel(mock_session)
+        self.assertEqual(mock_session.logger.warning_log,
+                         ['No RMF files are being read'])
+
+    def test_profile(self):
+        """Test profile command"""
+        mock_session = MockSession('test')
+        src.profiling._last_profile = None
+        src.cmd.profile(mock_session)
+        self.assertIn('No RMF profile has been recorded',
+                      mock_session.logger.warning_log[-1])
+        try:
+            src.cmd.profile(mock_session, True)
+            self.assertEqual(mock_session.logger.info_log[-1][0],
+                             'Profiling of RMF file reads enabled')
+            p = src.profiling.new_profile('open', 'test.rmf')
+            p.add('read hierarchy', 1000, 1)
+        finally:
+            src.cmd.profile(mock_session, False)
+        self.assertEqual(mock_session.logger.info_log[-1][0],
+                         'Profiling of RMF file reads disabled')
+        src.cmd.profile(mock_session)
+        msg, is_html = mock_session.logger.info_log[-1]
+        self.assertTrue(is_html)
+        self.assertIn('<td>read hierarchy</td>', msg)
+
+    def test_cache_clear(self):
+        """Test cache clear command"""
+        mock_session = MockSession('test')
+        settings = src.settings.get_settings(mock_session)
+        try:
+            settings.cache_size = 512
+            cache = src.cache.get_cache(mock_session)
+        finally:
+            settings.cache_size = 0
+        cache.clear()
+        cache.save('foo', {'meta': None})
+        src.cmd.cache_clear(mock_session)
+        self.assertEqual(mock_session.logger.info_log[-1][0],
+                         'Removed 1 file from the RMF cache')
+        src.cmd.cache_clear(mock_session)
+        self.assertEqual(mock_session.logger.info_log[-1][0],
+                         'Removed 0 files from the RMF cache')
+
     def test_chains_not_rmf(self):
         """Test chains command on a model that is not an RMF"""
         mock_session = MockSession('test')
@@ -175,12 +283,429 @@ class Tests(unittest.TestCase):
             state = structures[0].child_models()[0]
             # Just one frame to start with
             self.assertEqual(list(state.coordset_ids), [1])
-            # Test noop read of structure
-            src.cmd.readtraj(mock_session, structures[0])
+            # Reading the top-level model reads its only state
+            src.cmd.readtraj(mock_session, structures[0], last=1)
+            self.assertEqual(list(state.coordset_ids), [1, 2])
             src.cmd.readtraj(mock_session, state, last=1)
             # Two frames should have been read
             self.assertEqual(list(state.coordset_ids), [1, 2])
 
+    def test_read_static_traj(self):
+        """Test readtraj of particles that do not move"""
+        def make_rmf_file(fname, moving):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            p = pf.get(rn.add_child("p1", RMF.REPRESENTATION))
+            p.set_mass(1.)
+            p.set_radius(4.)
+            p.set_coordinates(RMF.Vector3(1., 2., 3.))
+            for i in range(1, 3):
+                r.add_frame("f%d" % i, RMF.FRAME)
+                if moving:
+                    p.set_coordinates(RMF.Vector3(1., 2., 3. + i))
+
+        def read_frames(state, last=None):
+            t = src.cmd._RMFTrajectoryLoader()
+            t.profile = src.profiling._RMFProfile('readtraj', fname)
+            t.load(state, 0, last, 1)
+            # Get the number of frames actually read from the file
+            return t.profile.phases['read frames'][2]
+
+        for moving in (True, False):
+            with utils.temporary_file(suffix='.rmf') as fname:
+                make_rmf_file(fname, moving)
+                mock_session = make_session()
+                mock_session.logger = MockLogger()
+                structures, status = src.io.open_rmf(mock_session, fname)
+                m = structures[0]
+                state = m.child_models()[0]
+                # Reading only some frames can't show that nothing moves
+                self.assertEqual(read_frames(state, last=1), 2)
+                self.assertEqual(m._rmf_static_states, set())
+                self.assertEqual(read_frames(state), 3)
+                self.assertEqual(list(state.coordset_ids), [1, 2, 3])
+                self.assertEqual(
+                    [state.coordsets[i][0][2] for i in (1, 2, 3)],
+                    [3., 4., 5.] if moving else [3., 3., 3.])
+                if moving:
+                    self.assertEqual(m._rmf_static_states, set())
+                else:
+                    self.assertEqual(len(m._rmf_static_states), 1)
+                # Once known to be static, only one frame need be read
+                self.assertEqual(read_frames(state), 3 if moving else 1)
+                self.assertEqual(
+                    [state.coordsets[i][0][2] for i in (1, 2, 3)],
+                    [3., 4., 5.] if moving else [3., 3., 3.])
+
+    def test_read_traj_handle_pool(self):
+        """Test reuse of RMF file handles by readtraj"""
+        def make_rmf_file(fname, nframes):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            p = pf.get(rn.add_child("p1", RMF.REPRESENTATION))
+            p.set_mass(1.)
+            p.set_radius(4.)
+            p.set_coordinates(RMF.Vector3(1., 2., 3.))
+            for i in range(1, nframes):
+                r.add_frame("f%d" % i, RMF.FRAME)
+                p.set_coordinates(RMF.Vector3(1., 2., 3. + i))
+
+        def read_frames(state, first=0, last=None):
+            t = src.cmd._RMFTrajectoryLoader()
+            t.profile = src.profiling._RMFProfile('readtraj', fname)
+            t.load(state, first, last, 1)
+            return t.profile.phases.get('open file', (0, 0, 0))[1]
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname, 3)
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m = structures[0]
+            state = m.child_models()[0]
+            pool = m._rmf_handles
+            self.assertEqual(len(pool), 0)
+            # Reading in chunks should open the file only once
+            self.assertEqual(read_frames(state, last=0), 1)
+            self.assertEqual(len(pool), 1)
+            handle, = pool._idle
+            self.assertEqual(read_frames(state, first=1), 0)
+            self.assertEqual(pool._idle, [handle])
+            self.assertEqual(list(state.coordset_ids), [1, 2, 3])
+
+            # A changed file should be opened again
+            make_rmf_file(fname, 4)
+            st = os.stat(fname)
+            os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            m._rmf_static_states.add(0)
+            self.assertEqual(read_frames(state), 1)
+            self.assertEqual(m._rmf_static_states, set())
+            self.assertEqual(len(pool), 1)
+            self.assertIsNot(pool._idle[0], handle)
+            self.assertEqual(list(state.coordset_ids), [1, 2, 3, 4])
+
+            # Idle handles should be closed after the timeout
+            pool._idle[0].last_used -= pool.timeout
+            pool._close_idle()
+            self.assertEqual(len(pool), 0)
+
+            # All handles should be closed with the model
+            read_frames(state)
+            self.assertEqual(len(pool), 1)
+            m.delete()
+            self.assertEqual(len(pool), 0)
+            self.assertIsNone(pool._timer)
+
+    def test_read_traj_stream(self):
+        """Test readtraj and frame commands with a streamed trajectory"""
+        with utils.temporary_file(suffix='.rmf') as fname:
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            p = pf.get(rn.add_child("p1", RMF.REPRESENTATION))
+            p.set_mass(1.)
+            p.set_radius(4.)
+            p.set_coordinates(RMF.Vector3(1., 2., 3.))
+            for i in range(1, 6):
+                r.add_frame("f%d" % i, RMF.FRAME)
+                p.set_coordinates(RMF.Vector3(1., 2., 3. + i))
+            del r, rn, pf, p
+
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            state = structures[0].child_models()[0]
+            src.cmd.readtraj(mock_session, state, 1, None, 2, stream=True)
+            # No frames should have been read into coordsets
+            self.assertEqual(list(state.coordset_ids), [1])
+            self.assertEqual(mock_session.logger.info_log[-1][0],
+                             "3 frames will be read on demand; use "
+                             "'rmf frame #1.1' to view")
+            stream = state._rmf_stream
+            self.assertEqual(stream.cache.max_size, 1024 * 1024 * 1024)
+            # Keep only two frames in memory
+            stream.cache.max_size = 2 * 3 * 8
+            for i in (1, 3, 5, 1):
+                src.cmd.frame(mock_session, state, i)
+                self.assertEqual(state.atoms.coords[0][2], 3. + i)
+                self.assertLessEqual(stream.cache.size,
+                                     stream.cache.max_size)
+            # Frame 1 was read again, as it was dropped from the cache
+            self.assertEqual(sorted(stream.cache._frames.keys()), [1, 5])
+            src.cmd.frame(mock_session, state, 5)
+            self.assertEqual(list(stream.cache._frames.keys()), [1, 5])
+            src.cmd.frame(mock_session, state)
+            self.assertEqual(mock_session.logger.info_log[-1][0],
+                             "Showing frame 5 of frames 1-5 (step 2); "
+                             "2 frames (0.0 MB) in memory")
+            src.cmd.frame(mock_session, state, 2)
+            self.assertEqual(mock_session.logger.warning_log[-1],
+                             "Frame 2 is not in the trajectory")
+
+            # Without readtraj, the whole trajectory is streamed
+            structures, status = src.io.open_rmf(mock_session, fname)
+            state = structures[0].child_models()[0]
+            src.cmd.frame(mock_session, state, 4)
+            self.assertEqual(state.atoms.coords[0][2], 7.)
+            self.assertEqual(state._rmf_stream.frames, range(0, 6))
+            self.assertRaises(ValueError,
+                              state._rmf_stream.loader.read_frame, state, 6)
+
+    def test_read_traj_prefetch(self):
+        """Test reading ahead of frames of a streamed trajectory"""
+        with utils.temporary_file(suffix='.rmf') as fname:
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            p = pf.get(rn.add_child("p1", RMF.REPRESENTATION))
+            p.set_mass(1.)
+            p.set_radius(4.)
+            p.set_coordinates(RMF.Vector3(1., 2., 3.))
+            for i in range(1, 10):
+                r.add_frame("f%d" % i, RMF.FRAME)
+                p.set_coordinates(RMF.Vector3(1., 2., 3. + i))
+            del r, rn, pf, p
+
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            state = structures[0].child_models()[0]
+            src.cmd.readtraj(mock_session, state, stream=True, prefetch=2,
+                             prefetch_buffer=3)
+            stream = state._rmf_stream
+            src.cmd.frame(mock_session, state, 4)
+            prefetcher = stream.prefetcher
+            prefetcher.wait()
+            self.assertEqual(sorted(f for f in prefetcher._slot_frame
+                                    if f is not None), [5, 6])
+            # The worker thread is given only plain data, not the state
+            reader = prefetcher._reader
+            self.assertEqual((reader.path, reader.buffer), (fname, None))
+            self.assertIsInstance(reader.node_index, int)
+            self.assertEqual(list(reader.order), [0])
+            # Prefetched frames need not be read by the main thread
+            stream.loader.profile = src.profiling._RMFProfile('readtraj',
+                                                              fname)
+            src.cmd.frame(mock_session, state, 5)
+            self.assertEqual(state.atoms.coords[0][2], 8.)
+            self.assertNotIn('read frames', stream.loader.profile.phases)
+            prefetcher.wait()
+            self.assertIn(7, prefetcher._slot_frame)
+            # Moving backwards should read the previous frames instead
+            src.cmd.frame(mock_session, state, 3)
+            prefetcher.wait()
+            self.assertIn(2, prefetcher._slot_frame)
+            self.assertIn(1, prefetcher._slot_frame)
+            # Frames already in the cache are not read ahead
+            self.assertNotIn(4, prefetcher._wanted)
+            src.cmd.frame(mock_session, state, 1)
+            self.assertEqual(state.atoms.coords[0][2], 4.)
+            # The worker thread should be stopped with the state
+            state.delete()
+            self.assertIsNone(stream.prefetcher)
+            self.assertFalse(prefetcher._thread.is_alive())
+
+    def test_read_traj_states(self):
+        """Test readtraj of several states at once"""
+        with utils.temporary_file(suffix='.rmf') as fname:
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            sf = RMF.StateFactory(r)
+            pf = RMF.ParticleFactory(r)
+            particles = []
+            for i in range(3):
+                s = rn.add_child("state%d" % i, RMF.REPRESENTATION)
+                sf.get(s).set_state_index(i)
+                p = pf.get(s.add_child("p1", RMF.REPRESENTATION))
+                p.set_mass(1.)
+                p.set_radius(4.)
+                p.set_coordinates(RMF.Vector3(i, 2., 3.))
+                particles.append(p)
+            for i in range(1, 4):
+                r.add_frame("f%d" % i, RMF.FRAME)
+                # The last state does not move
+                for j, p in enumerate(particles[:2]):
+                    p.set_coordinates(RMF.Vector3(j, 2., 3. + i))
+            del r, rn, sf, pf, s, p, particles
+
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m, = structures
+            states = m.child_models()
+            self.assertEqual(len(states), 3)
+
+            def read_frames(**kwargs):
+                src.profiling.set_enabled(True)
+                try:
+                    src.cmd.readtraj(mock_session, m, **kwargs)
+                finally:
+                    src.profiling.set_enabled(False)
+                # Get the number of frames actually read from the file
+                return src.profiling.get_last_profile().phases[
+                    'read frames'][2]
+
+            for i, s in enumerate(states):
+                s.id_string = '1.%d' % (i + 1)
+
+            # Each frame should be read only once for all selected states
+            self.assertEqual(read_frames(last=1, states=[0, 2]), 2)
+            self.assertEqual(
+                mock_session.logger.info_log[-1][0],
+                "Read 2 frames into coordsets of 2 states; use "
+                "'coordset slider #1.1 #1.3' to view")
+            self.assertEqual([list(s.coordset_ids) for s in states],
+                             [[1, 2], [1], [1, 2]])
+            self.assertEqual(read_frames(), 4)
+            for i, s in enumerate(states):
+                self.assertEqual(list(s.coordset_ids), [1, 2, 3, 4])
+                self.assertEqual([s.coordsets[j][0][2] for j in (1, 2, 3, 4)],
+                                 [3., 3., 3., 3.] if i == 2
+                                 else [3., 4., 5., 6.])
+            self.assertEqual(len(m._rmf_static_states), 1)
+            # Only moving states need be read again
+            self.assertEqual(read_frames(), 4)
+            self.assertEqual(read_frames(states=[2]), 1)
+
+            # Unknown states are an error
+            from chimerax.core.errors import UserError
+            self.assertRaises(UserError, src.cmd.readtraj, mock_session, m,
+                              states=[0, 7])
+
+            # States are chosen by their index in the file, as for open,
+            # not by their position in the model
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 states=[1, 2])
+            m, = structures
+            states = m.child_models()
+            self.assertRaises(UserError, src.cmd.readtraj, mock_session, m,
+                              states=[0])
+            src.cmd.readtraj(mock_session, m, states=[2])
+            self.assertEqual([list(s.coordset_ids) for s in states],
+                             [[1], [1, 2, 3, 4]])
+            # A state read later from the RMF Viewer can also be chosen
+            m._load_skipped_rmf_state(0)
+            state0 = m.child_models()[-1]
+            src.cmd.readtraj(mock_session, m, states=[0])
+            self.assertEqual(list(state0.coordset_ids), [1, 2, 3, 4])
+            self.assertEqual([state0.coordsets[j][0][2] for j in (1, 4)],
+                             [3., 6.])
+
+    def test_read_traj_processes(self):
+        """Test readtraj with frames split between worker processes"""
+        with utils.temporary_file(suffix='.rmf') as fname:
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            sf = RMF.StateFactory(r)
+            pf = RMF.ParticleFactory(r)
+            particles = []
+            for i in range(2):
+                s = rn.add_child("state%d" % i, RMF.REPRESENTATION)
+                sf.get(s).set_state_index(i)
+                for j in range(2):
+                    p = pf.get(s.add_child("p%d" % j, RMF.REPRESENTATION))
+                    p.set_mass(1.)
+                    p.set_radius(4.)
+                    p.set_coordinates(RMF.Vector3(i, j, 0.))
+                    particles.append(p)
+            for i in range(1, 5):
+                r.add_frame("f%d" % i, RMF.FRAME)
+                # The second state does not move
+                for j, p in enumerate(particles[:2]):
+                    p.set_coordinates(RMF.Vector3(0., j, i))
+            del r, rn, sf, pf, s, p, particles
+
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m, = structures
+            states = m.child_models()
+            for i, s in enumerate(states):
+                s.id_string = '1.%d' % (i + 1)
+            src.cmd.readtraj(mock_session, m, step=2, processes=2)
+            self.assertEqual(
+                mock_session.logger.info_log[-1][0],
+                "Read 3 frames into coordsets of 2 states; use "
+                "'coordset slider #1.1 #1.2' to view")
+            for s in states:
+                self.assertEqual(list(s.coordset_ids), [1, 3, 5])
+            self.assertEqual([states[0].coordsets[i] for i in (1, 3, 5)],
+                             [[(0., 0., z), (0., 1., z)]
+                              for z in (0., 2., 4.)])
+            for i in (1, 3, 5):
+                self.assertEqual(states[1].coordsets[i],
+                                 [(1., 0., 0.), (1., 1., 0.)])
+            # The whole trajectory should match reading in this process
+            src.cmd.readtraj(mock_session, m, processes=3)
+            parallel = [dict(s.coordsets) for s in states]
+            self.assertEqual(len(m._rmf_static_states), 1)
+            src.cmd.readtraj(mock_session, m)
+            self.assertEqual([dict(s.coordsets) for s in states], parallel)
+
+    def test_openensemble(self):
+        """Test openensemble command"""
+        def make_rmf_file(fname, x, nparticles=1):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            for i in range(nparticles):
+                p = pf.get(rn.add_child("p%d" % i, RMF.REPRESENTATION))
+                p.set_mass(1.)
+                p.set_radius(4.)
+                p.set_coordinates(RMF.Vector3(x, 2., i))
+
+        mock_session = make_session()
+        mock_session.logger = MockLogger()
+        with utils.temporary_directory() as tmpdir:
+            # Two files with the same topology, and one with another
+            make_rmf_file(os.path.join(tmpdir, 'a.rmf3'), 1.)
+            make_rmf_file(os.path.join(tmpdir, 'b.rmf3'), 2.)
+            make_rmf_file(os.path.join(tmpdir, 'c.rmf3'), 3., nparticles=2)
+            pattern = os.path.join(tmpdir, '*.rmf3')
+
+            models = src.cmd.openensemble(mock_session, pattern,
+                                          processes=1)
+            self.assertEqual([m.name for m in models], ['a', 'b', 'c'])
+            self.assertIn('Opened 3 RMF files as 3 models',
+                          mock_session.logger.info_log[-1][0])
+            self.assertIn('files per second',
+                          mock_session.logger.info_log[-1][0])
+
+            # Read from the cache, in a single process, or in parallel
+            settings = src.settings.get_settings(mock_session)
+            try:
+                for cache_size, processes in ((512, 1), (0, 1), (0, 2)):
+                    settings.cache_size = cache_size
+                    models = src.cmd.openensemble(
+                        mock_session, pattern, combine=True,
+                        processes=processes)
+                    self.assertEqual([m.name for m in models], ['a', 'c'])
+                    state, = models[0].child_models()
+                    self.assertEqual(list(state.coordset_ids), [1, 2])
+                    self.assertEqual([c[0] for c in state.coordsets[2]],
+                                     [2.])
+                    state, = models[1].child_models()
+                    self.assertEqual(len(state.atoms), 2)
+            finally:
+                settings.cache_size = 0
+            self.assertIn('3 files were read using 2 processes',
+                          mock_session.logger.info_log[-1][0])
+
+            models = src.cmd.openensemble(
+                mock_session, os.path.join(tmpdir, '*.garbage'))
+            self.assertEqual(models, [])
+            self.assertIn('No files match',
+                          mock_session.logger.warning_log[-1])
+
     def test_alternatives(self):
         """Test readtraj handling of RMF alternatives"""
         def make_rmf_file(fname):
@@ -235,6 +760,119 @@ class Tests(unittest.TestCase):
             # Two frames (f2, f4) should have been read
             self.assertEqual(list(state.coordset_ids), [1, 3, 5])
 
+    def test_read_skipped_states(self):
+        """Test readtraj of states when not all states were read"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            sf = RMF.StateFactory(r)
+            particles = []
+            for i, num in enumerate((1, 2)):
+                s = rn.add_child("s%d" % i, RMF.REPRESENTATION)
+                sf.get(s).set_state_index(i)
+                for j in range(num):
+                    p = pf.get(s.add_child("p%d" % j, RMF.REPRESENTATION))
+                    p.set_mass(1)
+                    p.set_radius(4)
+                    p.set_coordinates(RMF.Vector3(i, j, 0.))
+                    particles.append(p)
+            r.add_frame("f1", RMF.FRAME)
+            for p in particles:
+                x, y, z = p.get_coordinates()
+                p.set_coordinates(RMF.Vector3(x, y, 1.))
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 states=[1])
+            m = structures[0]
+            state1, = m.child_models()
+            src.cmd.readtraj(mock_session, state1)
+            self.assertEqual(state1.coordsets[2],
+                             [(1., 0., 1.), (1., 1., 1.)])
+            # Read the first state after the second; it should still map to
+            # the right RMF node
+            m._load_skipped_rmf_state(0)
+            state1b, state0 = m.child_models()
+            self.assertIs(state1b, state1)
+            src.cmd.readtraj(mock_session, state0)
+            self.assertEqual(state0.coordsets[2], [(0., 0., 1.)])
+
+    def test_read_skipped_resolutions(self):
+        """Test readtraj when not all resolutions were read"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            af = RMF.AlternativesFactory(r)
+            pf = RMF.ParticleFactory(r)
+            rf = RMF.ExplicitResolutionFactory(r)
+            particles = []
+
+            def add_node(parent, name, res, num):
+                if parent is None:
+                    n = r.add_node(name, RMF.REPRESENTATION)
+                else:
+                    n = parent.add_child(name, RMF.REPRESENTATION)
+                rf.get(n).set_explicit_resolution(res)
+                for i in range(num):
+                    p = pf.get(n.add_child("p%d" % i, RMF.REPRESENTATION))
+                    p.set_mass(1)
+                    p.set_radius(4)
+                    p.set_coordinates(RMF.Vector3(res, i, 0.))
+                    particles.append(p)
+                return n
+            n = add_node(rn, "res1", 1., 3)
+            af.get(n).add_alternative(add_node(None, "res10", 10., 2),
+                                      RMF.PARTICLE)
+            r.add_frame("f1", RMF.FRAME)
+            for p in particles:
+                x, y, z = p.get_coordinates()
+                p.set_coordinates(RMF.Vector3(x, y, 1.))
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            # Only the coarsest (res10) representation is read by default
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m = structures[0]
+            state, = m.child_models()
+            src.cmd.readtraj(mock_session, state)
+            self.assertEqual(state.coordsets[2],
+                             [(10., 0., 1.), (10., 1., 1.)])
+            m._load_skipped_rmf_resolution(1.)
+            src.cmd.readtraj(mock_session, state)
+            self.assertEqual(state.coordsets[2],
+                             [(10., 0., 1.), (10., 1., 1.), (1., 0., 1.),
+                              (1., 1., 1.), (1., 2., 1.)])
+
+            # Streamed frames should be read again with the new atoms
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m = structures[0]
+            state, = m.child_models()
+            src.cmd.readtraj(mock_session, state, stream=True, prefetch=1,
+                             prefetch_buffer=1)
+            stream = state._rmf_stream
+            src.cmd.frame(mock_session, state, 0)
+            prefetcher = stream.prefetcher
+            prefetcher.wait()
+            m._load_skipped_rmf_resolution(1.)
+            self.assertIsNone(stream.prefetcher)
+            self.assertFalse(prefetcher._thread.is_alive())
+            self.assertEqual(len(stream.cache), 0)
+            src.cmd.frame(mock_session, state, 1)
+            self.assertEqual(len(state.atoms.coords), 5)
+            self.assertEqual(stream.prefetcher._ring.shape, (1, 5, 3))
+            src.cmd.frame(mock_session, state, 0)
+            self.assertEqual([tuple(c) for c in state.atoms.coords],
+                             [(10., 0., 0.), (10., 1., 0.), (1., 0., 0.),
+                              (1., 1., 0.), (1., 2., 0.)])
+
     def test_nest_refframe(self):
         """Test readtraj handling of nested reference frames"""
         def make_rmf_file(fname):
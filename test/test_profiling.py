@@ -0,0 +1,71 @@
+import os
+import json
+import utils
+import unittest
+from unittest import mock
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+utils.set_search_paths(TOPDIR)
+
+import src.profiling  # noqa: E402
+
+
+class Tests(unittest.TestCase):
+    def test_profile(self):
+        """Test _RMFProfile class"""
+        p = src.profiling._RMFProfile('open', '/foo/test.rmf')
+        p.add('read hierarchy', 2000000, 10)
+        p.add('create atoms', 1000, 5)
+        p.add('create atoms', 3000, 7)
+        self.assertEqual(p.phases, {'read hierarchy': [2000000, 1, 10],
+                                    'create atoms': [4000, 2, 12]})
+        p.finish()
+        self.assertIsNotNone(p.total_ns)
+        j = p.get_json()
+        self.assertEqual(j['operation'], 'open')
+        self.assertEqual(j['phases'][1], {'name': 'create atoms', 'ns': 4000,
+                                          'calls': 2, 'objects': 12})
+        html = p.get_html()
+        self.assertIn('open of test.rmf (total', html)
+        self.assertIn('<td>read hierarchy</td>\n      <td>0.002</td>', html)
+
+    def test_new_profile(self):
+        """Test new_profile()"""
+        with mock.patch.dict(os.environ, {src.profiling.PROFILE_ENV: ''}):
+            self.assertIsNone(src.profiling.new_profile('open', 'x'))
+            try:
+                src.profiling.set_enabled(True)
+                p = src.profiling.new_profile('open', 'x')
+                self.assertIsInstance(p, src.profiling._RMFProfile)
+                self.assertIs(src.profiling.get_last_profile(), p)
+            finally:
+                src.profiling.set_enabled(False)
+            # No files are written without the environment variable
+            self.assertIsNone(src.profiling.start_cprofile())
+            src.profiling.finish(p)
+            src.profiling.finish(None)
+
+    def test_environment(self):
+        """Test profiling enabled by environment variable"""
+        with utils.temporary_directory() as tmpdir:
+            with mock.patch.dict(os.environ,
+                                 {src.profiling.PROFILE_ENV: tmpdir}):
+                p = src.profiling.new_profile('readtraj', '/foo/test.rmf')
+                self.assertIsNotNone(p)
+                cprofile = src.profiling.start_cprofile()
+                self.assertIsNotNone(cprofile)
+                p.add('read frames', 42, 1)
+                src.profiling.finish(p, cprofile)
+            jsons = [f for f in os.listdir(tmpdir) if f.endswith('.json')]
+            profs = [f for f in os.listdir(tmpdir) if f.endswith('.prof')]
+            self.assertEqual(len(profs), 1)
+            jfile, = jsons
+            self.assertTrue(jfile.startswith('test.rmf-readtraj-'))
+            with open(os.path.join(tmpdir, jfile)) as fh:
+                j = json.load(fh)
+            self.assertEqual(j['phases'], [{'name': 'read frames', 'ns': 42,
+                                            'calls': 1, 'objects': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
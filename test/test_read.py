@@ -1,4 +1,5 @@
 import os
+import sys
 import utils
 import unittest
 
@@ -6,7 +7,11 @@ TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 utils.set_search_paths(TOPDIR)
 
 import src  # noqa: E402
+import src.cmd  # noqa: E402
 import src.io  # noqa: E402
+import src.settings  # noqa: E402
+import src.cache  # noqa: E402
+import src.profiling  # noqa: E402
 from utils import make_session  # noqa: E402
 
 INDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'input'))
@@ -14,7 +19,7 @@ INDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'input'))
 RMF = utils.import_rmf_module()
 
 from chimerax.atomic import Pseudobond  # noqa: E402
-from chimerax.atomic import Atoms  # noqa: E402
+from chimerax.atomic import Atom, Atoms  # noqa: E402
 import chimerax.mmcif  # noqa: E402
 import chimerax.pdb  # noqa: E402
 
@@ -180,8 +185,43 @@ class Tests(unittest.TestCase):
             self.assertIsInstance(features[0].chimera_obj, Pseudobond)
             self.assertIsInstance(features[1].chimera_obj, Pseudobond)
             self.assertIsInstance(features[2].chimera_obj, Atoms)
+            self.assertEqual(len(features[2].chimera_obj), 3)
             child_feat, = features[0].children
             self.assertIsInstance(child_feat.chimera_obj, Pseudobond)
+            self.assertFalse(features[0].chimera_obj.halfbond)
+            self.assertEqual([a.name for a in features[1].chimera_obj.atoms],
+                             ['C', 'C'])
+            # Setting the object explicitly replaces any atom list
+            features[2].chimera_obj = None
+            self.assertIsNone(features[2].chimera_obj)
+
+    def test_rmf_atom_map(self):
+        """Test _RMFModel.get_rmf_atom_map()"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            bf = RMF.BallFactory(r)
+            rn.add_child("empty", RMF.REPRESENTATION)
+            for i in range(2):
+                b = bf.get(rn.add_child("ball%d" % i, RMF.GEOMETRY))
+                b.set_radius(1)
+                b.set_coordinates(RMF.Vector3(i, 0., 0.))
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m = structures[0]
+            atoms, index = m.get_rmf_atom_map()
+            self.assertEqual(index.dtype.name, 'int32')
+            # Root and "empty" nodes have no atoms
+            self.assertEqual(index.tolist(), [-1, -1, 0, 1])
+            ball0, ball1 = m.rmf_hierarchy.children[1:]
+            self.assertIs(atoms[0], ball0.chimera_obj)
+            self.assertIs(atoms[1], ball1.chimera_obj)
+            # Map is cached
+            self.assertIs(m.get_rmf_atom_map()[1], index)
 
     def test_read_geometry(self):
         """Test open_rmf handling of RMF geometry"""
@@ -216,6 +256,36 @@ class Tests(unittest.TestCase):
             # Two shapes should have been added
             shapes = structures[0]._drawing._drawing._shapes
             self.assertEqual(len(shapes), 2)
+            self.assertEqual([s[4] for s in shapes],
+                             ["test segment", "test segment2"])
+
+    def test_get_cylinders(self):
+        """Test _get_cylinders function"""
+        import numpy
+        axes = numpy.array([[0., 0., 1.], [0., 0., -1.], [1., 0., 0.],
+                            [0.6, -0.8, 0.], [0.48, 0.6, -0.64]])
+        rot = src.io._get_z_rotations(axes)
+        for r, axis in zip(rot, axes):
+            numpy.testing.assert_allclose(r.dot([0., 0., 1.]), axis,
+                                          atol=1e-9)
+            numpy.testing.assert_allclose(r.dot(r.T), numpy.identity(3),
+                                          atol=1e-9)
+            self.assertAlmostEqual(numpy.linalg.det(r), 1., delta=1e-9)
+        starts = numpy.array([[0., 0., 0.], [1., 2., 3.]])
+        ends = numpy.array([[0., 0., 5.], [1., 2., -1.]])
+        vertices, normals, triangles = src.io._get_cylinders(1.0, starts,
+                                                             ends)
+        self.assertEqual(vertices.shape, (2, 3, 3))
+        self.assertEqual(normals.shape, (2, 1, 3))
+        # The template is scaled along z by the length and moved to the
+        # center of the segment (mock template vertices are (i, i, i))
+        numpy.testing.assert_allclose(
+            vertices[0], [[0., 0., 2.5], [1., 1., 7.5], [2., 2., 12.5]],
+            atol=1e-5)
+        numpy.testing.assert_allclose(
+            vertices[1], [[1., 2., 1.], [2., 1., -3.], [3., 0., -7.]],
+            atol=1e-5)
+        numpy.testing.assert_allclose(normals[1], [[1., 0., 0.]], atol=1e-6)
 
     def test_read_balls(self):
         """Test open_rmf handling of RMF Balls"""
@@ -255,6 +325,293 @@ class Tests(unittest.TestCase):
             self.assertEqual([int(c) for c in a1.coord], [1, 2, 3])
             self.assertEqual([int(c) for c in a2.coord], [4, 5, 6])
 
+    def test_read_compressed(self):
+        """Test open_rmf of compressed files and of data in memory"""
+        import gzip
+        import lzma
+
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            bf = RMF.BallFactory(r)
+            b = bf.get(rn.add_child("ball", RMF.GEOMETRY))
+            b.set_radius(6)
+            b.set_coordinates(RMF.Vector3(1., 2., 3.))
+            r.add_frame("f1", RMF.FRAME)
+            b.set_coordinates(RMF.Vector3(4., 5., 6.))
+
+        def check_model(m):
+            state, = m.child_models()
+            a, = state.atoms
+            self.assertEqual([int(c) for c in a.coord], [1, 2, 3])
+            # The trajectory should be read from the same data in memory
+            src.cmd.readtraj(mock_session, state)
+            self.assertEqual(list(state.coordset_ids), [1, 2])
+            self.assertEqual([int(c) for c in state.coordsets[2][0]],
+                             [4, 5, 6])
+
+        with utils.temporary_directory() as tmpdir:
+            fname = os.path.join(tmpdir, 'test.rmf3')
+            make_rmf_file(fname)
+            with open(fname, 'rb') as fh:
+                contents = fh.read()
+            for suffix, module in (('.gz', gzip), ('.xz', lzma)):
+                with module.open(fname + suffix, 'wb') as fh:
+                    fh.write(contents)
+                mock_session = make_session()
+                mock_session.logger = MockLogger()
+                structures, status = src.io.open_rmf(mock_session,
+                                                     fname + suffix)
+                m, = structures
+                self.assertEqual(m._rmf_buffer, contents)
+                # Once decompressed, the file itself is not needed
+                os.unlink(fname + suffix)
+                check_model(m)
+
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(
+                mock_session, os.path.join(tmpdir, 'inmemory.rmf3'),
+                data=contents)
+            check_model(structures[0])
+
+    def test_read_frame_trajectory(self):
+        """Test open_rmf at a given frame, and with the trajectory"""
+        with utils.temporary_file(suffix='.rmf') as fname:
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            bf = RMF.BallFactory(r)
+            b = bf.get(rn.add_child("ball", RMF.GEOMETRY))
+            b.set_radius(6)
+            b.set_coordinates(RMF.Vector3(1., 2., 3.))
+            for i in range(1, 4):
+                r.add_frame("f%d" % i, RMF.FRAME)
+                b.set_coordinates(RMF.Vector3(1., 2., 3. + i))
+            del r, rn, bf, b
+
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 frame=2)
+            m, = structures
+            self.assertEqual(m._rmf_frame, 2)
+            state, = m.child_models()
+            a, = state.atoms
+            self.assertEqual([int(c) for c in a.coord], [1, 2, 5])
+            self.assertIn('Only frame 2 was read', status)
+            self.assertRaises(ValueError, src.io.open_rmf, mock_session,
+                              fname, frame=4)
+
+            try:
+                src.profiling.set_enabled(True)
+                structures, status = src.io.open_rmf(
+                    mock_session, fname, trajectory=True, first=1, step=2)
+            finally:
+                src.profiling.set_enabled(False)
+            m, = structures
+            state, = m.child_models()
+            self.assertEqual(list(state.coordset_ids), [1, 2, 4])
+            self.assertEqual([state.coordsets[i][0][2] for i in (2, 4)],
+                             [4., 6.])
+            self.assertIn('2 frames were read into coordsets', status)
+            # The already-open file should have been used for the trajectory
+            profile = src.profiling.get_last_profile()
+            self.assertEqual(profile.phases['open file'][1], 1)
+            self.assertEqual(profile.phases['read frames'][2], 2)
+
+            # The frame opened at should still be shown once the
+            # trajectory is read, whether or not it is part of it
+            for first, coordset_ids in ((0, [1, 2, 3, 4]), (3, [1, 4, 3])):
+                structures, status = src.io.open_rmf(
+                    mock_session, fname, frame=2, trajectory=True,
+                    first=first)
+                m, = structures
+                state, = m.child_models()
+                self.assertEqual(list(state.coordset_ids), coordset_ids)
+                self.assertEqual(state.active_coordset_id, 3)
+                self.assertEqual(state.coordsets[3][0][2], 5.)
+                a, = state.atoms
+                self.assertEqual([int(c) for c in a.coord], [1, 2, 5])
+
+    def test_static_topology(self):
+        """Test open_rmf reading topology from static data"""
+        with utils.temporary_file(suffix='.rmf') as fname:
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            cf = RMF.ChainFactory(r)
+            c = rn.add_child("A", RMF.REPRESENTATION)
+            cf.get(c).set_chain_id("A")
+            p1 = pf.get(c.add_child("p1", RMF.REPRESENTATION))
+            p1.set_mass(1.)
+            p1.set_radius(4.)
+            p1.set_coordinates(RMF.Vector3(1., 2., 3.))
+            r.add_frame("f1", RMF.FRAME)
+            # The radius of p1 changes in the second frame
+            p1.set_radius(6.)
+            # p2 has no static data
+            p2 = pf.get(c.add_child("p2", RMF.REPRESENTATION))
+            p2.set_frame_mass(2.)
+            p2.set_frame_radius(5.)
+            p2.set_frame_coordinates(RMF.Vector3(4., 5., 6.))
+            del r, rn, pf, cf, c, p1, p2
+
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 frame=1)
+            state, = structures[0].child_models()
+            self.assertEqual([a.radius for a in state.atoms], [6., 5.])
+            self.assertNotIn('static data', status)
+
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 frame=1,
+                                                 static_topology=True)
+            m, = structures
+            self.assertTrue(m._rmf_static_topology)
+            state, = m.child_models()
+            self.assertEqual([a.radius for a in state.atoms], [4., 5.])
+            self.assertEqual([a.mass for a in state.atoms], [1., 2.])
+            self.assertIn("Topology read from static data: chain id. "
+                          "Topology with no static data for some nodes, "
+                          "read from frame 1: mass, radius.", status)
+
+            rl = src.io._RMFLoader()
+            rl.frame = 1
+            rl.static_topology = True
+            m, = rl.load(fname, mock_session)
+            self.assertEqual(rl.topology_report,
+                             {'chain_id': [1, 0], 'mass': [1, 1],
+                              'radius': [1, 1]})
+            # The report should be kept in the cache, whose entries differ
+            # from those of a regular read
+            data = rl._get_cache_data(m)
+            rl2 = src.io._RMFLoader()
+            rl2.read_data(fname, src.io._RMFFileInfo(), data)
+            self.assertEqual(rl2.topology_report, rl.topology_report)
+            self.assertNotEqual(rl._get_cache_options(),
+                                rl2._get_cache_options())
+
+    def test_vectorized_atom_properties(self):
+        """Test that vectorized and per-atom property setting agree"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            bf = RMF.BallFactory(r)
+            cf = RMF.ColoredFactory(r)
+
+            b1 = bf.get(rn.add_child("ball1", RMF.GEOMETRY))
+            b1.set_radius(6)
+            b1.set_coordinates(RMF.Vector3(1., 2., 3.))
+
+            n = rn.add_child("ball2", RMF.GEOMETRY)
+            b2 = bf.get(n)
+            b2.set_radius(4)
+            b2.set_coordinates(RMF.Vector3(4., 5., 6.))
+            c2 = cf.get(n)
+            c2.set_rgb_color(RMF.Vector3(1, 0, 0))
+
+        def get_atom_properties(fname, vectorized):
+            mock_session = make_session()
+            rl = src.io._RMFLoader(vectorized=vectorized)
+            structures = rl.load(fname, mock_session)
+            state, = structures[0].child_models()
+            self.assertIs(structures[0].rmf_hierarchy.children[1].chimera_obj,
+                          state.atoms[1])
+            return [([int(c) for c in a.coord], int(a.radius),
+                     [int(c) for c in getattr(a, 'color', [])],
+                     a.draw_mode, a.mass) for a in state.atoms]
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            props = get_atom_properties(fname, vectorized=True)
+            self.assertEqual(props,
+                             [([1, 2, 3], 6, [], Atom.SPHERE_STYLE, 0.),
+                              ([4, 5, 6], 4, [255, 0, 0, 255],
+                               Atom.SPHERE_STYLE, 0.)])
+            self.assertEqual(get_atom_properties(fname, vectorized=False),
+                             props)
+
+    def test_reference_frames(self):
+        """Test transformation of particles in nested reference frames"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            bf = RMF.BallFactory(r)
+            rff = RMF.ReferenceFrameFactory(r)
+            top = rn.add_child("toprf", RMF.REPRESENTATION)
+            rf = rff.get(top)
+            rf.set_rotation(RMF.Vector4(0.5, 0.5, 0.5, 0.5))
+            rf.set_translation(RMF.Vector3(1, 2, 3))
+            bot = top.add_child("botrf", RMF.REPRESENTATION)
+            rf = rff.get(bot)
+            rf.set_rotation(RMF.Vector4(0.9238795, 0., 0.3826834, 0.))
+            rf.set_translation(RMF.Vector3(-9, 8, 7))
+            for parent in (top, bot, rn):
+                for i in range(3):
+                    b = bf.get(parent.add_child("ball", RMF.GEOMETRY))
+                    b.set_radius(1)
+                    b.set_coordinates(RMF.Vector3(i, 2. * i, 5. - i))
+
+        def get_expected(fname):
+            r = RMF.open_rmf_file_read_only(fname)
+            r.set_current_frame(RMF.FrameID(0))
+            rff = RMF.ReferenceFrameConstFactory(r)
+            bf = RMF.BallConstFactory(r)
+            top = r.get_root_node().get_children()[0]
+            bot = top.get_children()[0]
+            toptr = RMF.CoordinateTransformer(RMF.CoordinateTransformer(),
+                                              rff.get(top))
+            bottr = RMF.CoordinateTransformer(toptr, rff.get(bot))
+            coords = []
+            for node, tr in ((top, toptr), (bot, bottr),
+                             (r.get_root_node(), None)):
+                for child in node.get_children():
+                    if bf.get_is(child):
+                        c = bf.get(child).get_coordinates()
+                        if tr is not None:
+                            c = tr.get_global_coordinates(c)
+                        coords.append(list(c))
+            return coords
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            mock_session.logger = MockLogger()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            state = structures[0].child_models()[0]
+            coords = [list(a.coord) for a in state.atoms]
+            self.assertEqual(len(coords), 9)
+            for got, exp in zip(sorted(coords),
+                                sorted(get_expected(fname))):
+                for g, e in zip(got, exp):
+                    self.assertAlmostEqual(g, e, delta=1e-6)
+
+    def test_atom_table(self):
+        """Test _RMFAtomTable class"""
+        session = make_session()
+        state = src.io._RMFState(session)
+        t = src.io._RMFAtomTable()
+        self.assertEqual(t.create_atoms(), [])
+        r1 = t.add_residue(state, 'ALA', 'A', 1, 'foo', 2, 10.)
+        r2 = t.add_residue(state, 'GLY', 'A', 2, None, None, None)
+        self.assertEqual(t.add_atom(r1, 'CA', 'C', (1., 2., 3.), 4., 12.), 0)
+        self.assertEqual(t.add_atom(r2, 'N', 'N', (4., 5., 6.), 1., 14.), 1)
+        self.assertEqual(t.add_atom(r1, 'CB', 'C', (7., 8., 9.), 2., 12.), 2)
+        t.set_color(1, (0., 1., 0.))
+        self.assertEqual(len(t), 3)
+        atoms = t.create_atoms()
+        self.assertEqual([a.name for a in atoms], ['CA', 'N', 'CB'])
+        # Residues are created in the order their first atom is encountered
+        self.assertEqual(len(state.residues), 2)
+        self.assertEqual(list(atoms[1].color), [0, 255, 0, 255])
+        self.assertEqual(atoms[2].mass, 12.)
+
     def test_read_atoms_het(self):
         """Test open_rmf handling of RMF atoms with HET prefix"""
         def make_rmf_file(fname):
@@ -297,6 +654,109 @@ class Tests(unittest.TestCase):
             self.assertEqual(a1.name, 'N')
             self.assertEqual(a2.name, 'C')
 
+    def test_decorator_signatures(self):
+        """Test checking of node decorators"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            particlef = RMF.ParticleFactory(r)
+            residuef = RMF.ResidueFactory(r)
+            bf = RMF.BallFactory(r)
+            n = rn.add_child("H", RMF.REPRESENTATION)
+            RMF.ChainFactory(r).get(n).set_chain_id('H')
+            for resnum in range(1, 11):
+                rn = n.add_child("%d" % resnum, RMF.REPRESENTATION)
+                residuef.get(rn).set_residue_index(resnum)
+                residuef.get(rn).set_residue_type('ALA')
+                p = particlef.get(rn.add_child("CA", RMF.REPRESENTATION))
+                p.set_mass(12.)
+                p.set_radius(1.)
+                p.set_coordinates(RMF.Vector3(1, 2, 3))
+            for i in range(5):
+                b = bf.get(r.get_root_node().add_child("ball",
+                                                       RMF.GEOMETRY))
+                b.set_radius(1.)
+                b.set_coordinates(RMF.Vector3(1, 2, 3))
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            rl = src.io._RMFLoader()
+            structures = rl.load(fname, mock_session)
+            state, = structures[0].child_models()
+            self.assertEqual(len(state.atoms), 15)
+            nfactories = len(rl.signatures.factories)
+            # Root node (of no decorator type) is checked against every
+            # factory; the 21 other REPRESENTATION nodes against the 9
+            # hierarchy factories, plus 3 more for the 10 particles;
+            # balls only need ball, color and segment checks
+            self.assertEqual(rl.probe_count,
+                             nfactories + 21 * 9 + 10 * 3 + 5 * 3)
+            # Nodes of the same shape share a signature
+            chain = structures[0].rmf_hierarchy.children[0]
+            r = RMF.open_rmf_file_read_only(fname)
+            ca1, ca2 = [r.get_node(RMF.NodeID(res.children[0].rmf_index))
+                        for res in chain.children[:2]]
+            self.assertIs(rl.signatures.get(ca1), rl.signatures.get(ca2))
+            node_type, decorators = rl.signatures.get(ca1)
+            self.assertEqual(node_type, RMF.REPRESENTATION)
+            self.assertEqual(decorators,
+                             frozenset(['iparticlef', 'particlef']))
+            # Signatures are cached, so no further probes are needed
+            probes = rl.probe_count
+            rl.signatures.get(ca1)
+            self.assertEqual(rl.probe_count, probes)
+
+    def test_walk_tree(self):
+        """Test _walk_tree function"""
+        tree = {'root': ['a', 'b'], 'a': ['c', 'd'], 'b': [], 'c': [],
+                'd': ['e'], 'e': []}
+        pre = []
+        post = []
+
+        def visit(node, level):
+            pre.append((node, level))
+            return [(child, level + 1) for child in tree[node]]
+        src.io._walk_tree([('root', 0)], visit,
+                          lambda node, level: post.append(node))
+        self.assertEqual(pre, [('root', 0), ('a', 1), ('c', 2), ('d', 2),
+                               ('e', 3), ('b', 1)])
+        self.assertEqual(post, ['c', 'e', 'd', 'a', 'b', 'root'])
+
+        # Multiple roots, no post-order callback
+        pre = []
+        src.io._walk_tree([('a', 0), ('b', 0)], visit)
+        self.assertEqual([x[0] for x in pre], ['a', 'c', 'd', 'e', 'b'])
+
+    def test_read_deep_hierarchy(self):
+        """Test open_rmf handling of hierarchies deeper than Python's
+           recursion limit"""
+        depth = sys.getrecursionlimit() + 100
+
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            n = r.get_root_node()
+            for i in range(depth):
+                n = n.add_child("node%d" % i, RMF.REPRESENTATION)
+            b = RMF.BallFactory(r).get(n.add_child("ball", RMF.GEOMETRY))
+            b.set_radius(1.)
+            b.set_coordinates(RMF.Vector3(1., 2., 3.))
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            nodes = list(src.cmd._print_hierarchy(
+                structures[0].rmf_hierarchy, -1))
+            # root, depth nodes, ball
+            self.assertEqual(len([x for x in nodes if x.startswith('<li>')]),
+                             depth + 2)
+            self.assertEqual(nodes.index('<li>ball'), 2 * (depth + 1))
+            state, = structures[0].child_models()
+            self.assertEqual(len(state.atoms), 1)
+
     def test_alternatives(self):
         """Test open_rmf handling of RMF alternatives"""
         def make_rmf_file(fname):
@@ -343,6 +803,506 @@ class Tests(unittest.TestCase):
             self.assertEqual([c.name for c in root.children],
                              ['topp1', 'topp2', 'topg1'])
 
+    def test_read_resolutions(self):
+        """Test open_rmf reading only some resolutions"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+
+            af = RMF.AlternativesFactory(r)
+            pf = RMF.ParticleFactory(r)
+            rf = RMF.ExplicitResolutionFactory(r)
+
+            def add_particles(n, num):
+                for i in range(num):
+                    b = pf.get(n.add_child("p%d" % i, RMF.REPRESENTATION))
+                    b.set_mass(1)
+                    b.set_radius(4)
+                    b.set_coordinates(RMF.Vector3(4., 5., 6.))
+
+            n = rn.add_child("res1", RMF.REPRESENTATION)
+            rf.get(n).set_explicit_resolution(1.)
+            add_particles(n, 10)
+            a = af.get(n)
+
+            alt = r.add_node("res10", RMF.REPRESENTATION)
+            rf.get(alt).set_explicit_resolution(10.)
+            add_particles(alt, 1)
+            a.add_alternative(alt, RMF.PARTICLE)
+
+            alt = r.add_node("res30", RMF.REPRESENTATION)
+            rf.get(alt).set_explicit_resolution(30.)
+            add_particles(alt, 1)
+            a.add_alternative(alt, RMF.PARTICLE)
+            # Node with no resolution should always be read
+            add_particles(rn, 1)
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 resolution='all')
+            self.assertEqual(
+                [c.name for c in structures[0].rmf_hierarchy.children],
+                ['res1', 'res10', 'res30', 'p0'])
+            state, = structures[0].child_models()
+            self.assertEqual(len(state.atoms), 13)
+            self.assertEqual(structures[0]._skipped_rmf_resolutions, set())
+
+            # Default is to read only the coarsest alternative
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m = structures[0]
+            self.assertEqual([c.name for c in m.rmf_hierarchy.children],
+                             ['res30', 'p0'])
+            self.assertEqual(m._skipped_rmf_resolutions, set((1., 10.)))
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 resolution='coarsest')
+            self.assertEqual(
+                [c.name for c in structures[0].rmf_hierarchy.children],
+                ['res30', 'p0'])
+
+            # Skip the primary representation, but not all alternatives
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 resolution=[10., 30.])
+            self.assertEqual(
+                [c.name for c in structures[0].rmf_hierarchy.children],
+                ['res10', 'res30', 'p0'])
+            state, = structures[0].child_models()
+            self.assertEqual(len(state.atoms), 3)
+
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 resolution=[1])
+            m = structures[0]
+            self.assertEqual([c.name for c in m.rmf_hierarchy.children],
+                             ['res1', 'p0'])
+            state, = m.child_models()
+            self.assertEqual(len(state.atoms), 11)
+            # Skipped resolutions should still be recorded
+            self.assertEqual(m._rmf_resolutions, set((1., 10., 30.)))
+            self.assertEqual(m._skipped_rmf_resolutions, set((10., 30.)))
+            self.assertEqual(m._selected_rmf_resolutions, set((None, 1.)))
+            self.assertIn('Representation read at the following '
+                          'resolutions: 1.0. Representation at the following '
+                          'resolutions was not read: 10.0, 30.0.', status)
+
+            # Default should come from settings
+            settings = src.settings.get_settings(mock_session)
+            settings.resolutions = [10.]
+            try:
+                structures, status = src.io.open_rmf(mock_session, fname)
+            finally:
+                settings.resolutions = 'coarsest'
+            self.assertEqual(
+                [c.name for c in structures[0].rmf_hierarchy.children],
+                ['res10', 'p0'])
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 resolution='all')
+            self.assertEqual(structures[0]._skipped_rmf_resolutions, set())
+
+            # Resolution can also be given to the open command
+            oinfo = src.bundle_api.run_provider(mock_session, "RMF", None)
+            self.assertIn('resolution', oinfo.open_args)
+            structures, status = oinfo.open(mock_session, fname, fname,
+                                            resolution=[10.])
+            self.assertEqual(structures[0]._skipped_rmf_resolutions,
+                             set((1., 30.)))
+
+    def test_load_skipped_resolution(self):
+        """Test reading a skipped resolution after the file was opened"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+
+            af = RMF.AlternativesFactory(r)
+            pf = RMF.ParticleFactory(r)
+            rf = RMF.ExplicitResolutionFactory(r)
+            sf = RMF.StateFactory(r)
+            cf = RMF.ChainFactory(r)
+
+            def add_particles(n, num):
+                for i in range(num):
+                    b = pf.get(n.add_child("p%d" % i, RMF.REPRESENTATION))
+                    b.set_mass(1)
+                    b.set_radius(4)
+                    b.set_coordinates(RMF.Vector3(4., 5., 6.))
+
+            s = rn.add_child("state0", RMF.REPRESENTATION)
+            sf.get(s).set_state_index(0)
+            c = s.add_child("A", RMF.REPRESENTATION)
+            cf.get(c).set_chain_id("A")
+            n = c.add_child("res1", RMF.REPRESENTATION)
+            rf.get(n).set_explicit_resolution(1.)
+            add_particles(n, 10)
+            a = af.get(n)
+
+            alt = r.add_node("res10", RMF.REPRESENTATION)
+            rf.get(alt).set_explicit_resolution(10.)
+            add_particles(alt, 2)
+            a.add_alternative(alt, RMF.PARTICLE)
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            m = structures[0]
+            state, = m.child_models()
+            self.assertEqual(len(state.atoms), 2)
+            self.assertEqual(m._skipped_rmf_resolutions, set((1.,)))
+            chain, = m.rmf_hierarchy.children[0].children
+            self.assertEqual([c.name for c in chain.children], ['res10'])
+
+            # Nothing to do for resolutions that were read
+            self.assertEqual(m._load_skipped_rmf_resolution(10.), 0)
+
+            # If the file cannot be read, it can be tried again later
+            os.rename(fname, fname + '.moved')
+            try:
+                self.assertRaises(OSError, m._load_skipped_rmf_resolution,
+                                  1.)
+            finally:
+                os.rename(fname + '.moved', fname)
+            self.assertEqual(m._skipped_rmf_resolutions, set((1.,)))
+            self.assertEqual(len(state.atoms), 2)
+
+            self.assertEqual(m._load_skipped_rmf_resolution(1.), 10)
+            # New atoms should be added to the existing state and the
+            # existing hierarchy
+            self.assertEqual(m.child_models(), [state])
+            self.assertEqual(len(state.atoms), 12)
+            self.assertEqual([c.name for c in chain.children],
+                             ['res10', 'res1'])
+            res1 = chain.children[1]
+            self.assertIs(res1.parent(), chain)
+            self.assertEqual(res1.resolution, 1.)
+            self.assertEqual(len(res1.children), 10)
+            atom = res1.children[0].chimera_obj
+            self.assertIs(atom.structure, state)
+            self.assertEqual(len(state.residues), 2)
+            self.assertEqual(state.residues[1].resolution, 1.)
+            # Made-up residue numbers should follow the existing ones
+            self.assertEqual([(r.chain_id, r.number) for r in state.residues],
+                             [('A', 1), ('A', 2)])
+            self.assertEqual(m._skipped_rmf_resolutions, set())
+            self.assertEqual(m._skipped_rmf_nodes, [])
+            self.assertEqual(m._selected_rmf_resolutions,
+                             set((None, 1., 10.)))
+            self.assertEqual(m._rmf_resolutions, set((1., 10.)))
+            # Chains should not be recorded twice
+            self.assertEqual(len(m._rmf_chains), 1)
+            # Already read
+            self.assertEqual(m._load_skipped_rmf_resolution(1.), 0)
+
+    def test_read_states(self):
+        """Test open_rmf reading only some states"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            sf = RMF.StateFactory(r)
+            for i in range(3):
+                s = rn.add_child("s%d" % i, RMF.REPRESENTATION)
+                sf.get(s).set_state_index(i)
+                for j in range(i + 1):
+                    p = pf.get(s.add_child("p%d" % j, RMF.REPRESENTATION))
+                    p.set_mass(1)
+                    p.set_radius(4)
+                    p.set_coordinates(RMF.Vector3(4., 5., 6.))
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            structures, status = src.io.open_rmf(mock_session, fname)
+            self.assertEqual(len(structures[0].child_models()), 3)
+            self.assertEqual(structures[0]._skipped_rmf_states, [])
+
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 states=[0, 2])
+            m = structures[0]
+            self.assertEqual([c.name for c in m.rmf_hierarchy.children],
+                             ['s0', 's2'])
+            s0, s2 = m.child_models()
+            self.assertEqual(len(s0.atoms), 1)
+            self.assertEqual(len(s2.atoms), 3)
+            s1_node = m._skipped_rmf_states[0][2]
+            self.assertEqual(m._skipped_rmf_states, [(1, 's1', s1_node, 0)])
+            self.assertIn('1 of 3 states were not read: 1.', status)
+
+            # Nothing to do for states that were read
+            self.assertEqual(m._load_skipped_rmf_state(0), 0)
+            # If the file cannot be read, it can be tried again later
+            os.rename(fname, fname + '.moved')
+            try:
+                self.assertRaises(OSError, m._load_skipped_rmf_state, 1)
+            finally:
+                os.rename(fname + '.moved', fname)
+            self.assertEqual(m._skipped_rmf_states, [(1, 's1', s1_node, 0)])
+            self.assertNotIn(s1_node, m._rmf_state_indexes)
+            self.assertEqual(m._load_skipped_rmf_state(1), 2)
+            self.assertEqual([c.name for c in m.rmf_hierarchy.children],
+                             ['s0', 's2', 's1'])
+            s0b, s2b, s1 = m.child_models()
+            self.assertIs(s0b, s0)
+            self.assertEqual(len(s1.atoms), 2)
+            self.assertEqual(m._rmf_states[s1_node], s1)
+            self.assertEqual(m._skipped_rmf_states, [])
+
+            # States can also be given to the open command
+            oinfo = src.bundle_api.run_provider(mock_session, "RMF", None)
+            self.assertIn('states', oinfo.open_args)
+            structures, status = oinfo.open(mock_session, fname, fname,
+                                            states=[1])
+            self.assertEqual([s[0] for s in structures[0]._skipped_rmf_states],
+                             [0, 2])
+
+    @unittest.skipIf(utils.no_gui, "Cannot test in real ChimeraX environment")
+    def test_read_background(self):
+        """Test reading an RMF file in a background thread"""
+        class StatusLogger(MockLogger):
+            def __init__(self):
+                super().__init__()
+                self.status_log = []
+                self.error_log = []
+
+            def status(self, msg):
+                self.status_log.append(msg)
+
+            def error(self, msg):
+                self.error_log.append(msg)
+
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            pf = RMF.ParticleFactory(r)
+            sf = RMF.StateFactory(r)
+            for i in range(2):
+                s = rn.add_child("s%d" % i, RMF.REPRESENTATION)
+                sf.get(s).set_state_index(i)
+                for j in range(3):
+                    p = pf.get(s.add_child("p%d" % j, RMF.REPRESENTATION))
+                    p.set_mass(1)
+                    p.set_radius(4)
+                    p.set_coordinates(RMF.Vector3(4., 5., 6.))
+
+        def run_frames(session, load):
+            load._thread.join()
+            for i in range(100):
+                if load not in src.io._RMFBackgroundLoad.active:
+                    return i
+                session.triggers.activate_trigger('new frame', None)
+            self.fail("Background load did not finish")
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            mock_session.ui.is_gui = True
+            mock_session.logger = StatusLogger()
+            structures, status = src.io.open_rmf(mock_session, fname,
+                                                 background=True)
+            self.assertEqual(structures, [])
+            self.assertIn('in the background', status)
+            load, = src.io._RMFBackgroundLoad.active
+            run_frames(mock_session, load)
+            m = mock_session.models.list()[0]
+            self.assertEqual([len(s.atoms) for s in m.child_models()],
+                             [3, 3])
+            (msg, is_html), = mock_session.logger.info_log
+            self.assertIn('Opened RMF file with 1 frame', msg)
+
+            # Build atoms in several steps, one per frame
+            rl = src.io._RMFLoader()
+            rl.chunk_size = 2
+            load = src.io._RMFBackgroundLoad(mock_session, rl, fname)
+            load.start()
+            # Read in the thread, then three steps to make six atoms,
+            # and one to finish up
+            self.assertEqual(run_frames(mock_session, load), 4)
+            self.assertIn('Building %s: 66%%' % os.path.basename(fname),
+                          mock_session.logger.status_log)
+            self.assertEqual(
+                [len(s.atoms) for s in load.top_level.child_models()], [3, 3])
+
+            # Cancelled loads add no models
+            nmodels = len(mock_session.models.list())
+            load = src.io._RMFBackgroundLoad(mock_session, src.io._RMFLoader(),
+                                             fname)
+            load.cancel()
+            load.start()
+            run_frames(mock_session, load)
+            self.assertIsInstance(load.error, src.io._RMFLoadCancelled)
+            self.assertEqual(len(mock_session.models.list()), nmodels)
+            self.assertEqual(mock_session.logger.status_log[-1],
+                             'Reading %s was cancelled'
+                             % os.path.basename(fname))
+
+            # Errors are reported in the log
+            load = src.io._RMFBackgroundLoad(mock_session, src.io._RMFLoader(),
+                                             '/not/exist.rmf')
+            load.start()
+            run_frames(mock_session, load)
+            self.assertEqual(len(mock_session.models.list()), nmodels)
+            self.assertEqual(len(mock_session.logger.error_log), 1)
+
+            # Errors while building models or reading the trajectory are
+            # also reported, and the partly-built model is deleted
+            class BrokenBuildLoader(src.io._RMFLoader):
+                def build(self, top_level):
+                    yield 0.5
+                    raise ValueError("build failed")
+
+            class BrokenTrajectoryLoader(src.io._RMFLoader):
+                def read_trajectory(self, top_level):
+                    raise ValueError("trajectory failed")
+
+            for loader_class, msg in (
+                    (BrokenBuildLoader, "build failed"),
+                    (BrokenTrajectoryLoader, "trajectory failed")):
+                ninfo = len(mock_session.logger.info_log)
+                load = src.io._RMFBackgroundLoad(mock_session,
+                                                 loader_class(), fname)
+                load.start()
+                run_frames(mock_session, load)
+                self.assertTrue(load.top_level.was_deleted)
+                self.assertEqual(len(mock_session.models.list()), nmodels)
+                self.assertEqual(mock_session.logger.error_log[-1],
+                                 "Could not read %s: %s"
+                                 % (os.path.basename(fname), msg))
+                # Nothing should be reported as opened
+                self.assertEqual(len(mock_session.logger.info_log), ninfo)
+
+    def test_read_cached(self):
+        """Test reopening an unchanged RMF file from the cache"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            sf = RMF.StateFactory(r)
+            pf = RMF.ParticleFactory(r)
+            bf = RMF.BallFactory(r)
+            cf = RMF.ColoredFactory(r)
+            rf = RMF.RepresentationFactory(r)
+            s = rn.add_child("s0", RMF.REPRESENTATION)
+            sf.get(s).set_state_index(0)
+            n = s.add_child("H", RMF.REPRESENTATION)
+            RMF.ChainFactory(r).get(n).set_chain_id('H')
+            parts = []
+            for i in range(3):
+                p = n.add_child("p%d" % i, RMF.REPRESENTATION)
+                pf.get(p).set_mass(1)
+                pf.get(p).set_radius(4)
+                pf.get(p).set_coordinates(RMF.Vector3(i, 5., 6.))
+                parts.append(p)
+            cf.get(parts[1]).set_rgb_color(RMF.Vector3(1, 0, 0))
+            b = RMF.BondFactory(r).get(s.add_child("bond", RMF.BOND))
+            b.set_bonded_0(parts[0].get_id().get_index())
+            b.set_bonded_1(parts[1].get_id().get_index())
+            ball = rn.add_child("ball", RMF.GEOMETRY)
+            bf.get(ball).set_radius(2)
+            bf.get(ball).set_coordinates(RMF.Vector3(7., 8., 9.))
+            f = rn.add_child("feat", RMF.FEATURE)
+            rf.get(f).set_representation([parts[2].get_id(), ball.get_id()])
+            child = f.add_child("child feat", RMF.FEATURE)
+            rf.get(child).set_representation([parts[0].get_id(),
+                                              ball.get_id()])
+            seg = RMF.SegmentFactory(r).get(rn.add_child("seg",
+                                                         RMF.GEOMETRY))
+            seg.set_coordinates_list([RMF.Vector3(0, 0, 0),
+                                      RMF.Vector3(5, 5, 5)])
+            prov = n.add_child("struc", RMF.PROVENANCE)
+            p = RMF.StructureProvenanceFactory(r).get(prov)
+            p.set_chain('A')
+            p.set_residue_offset(42)
+            p.set_filename('xyz')
+            p = RMF.SampleProvenanceFactory(r).get(
+                prov.add_child("sample", RMF.PROVENANCE))
+            p.set_frames(100)
+            p.set_iterations(10)
+            p.set_method('Monte Carlo')
+            p.set_replicas(8)
+
+        def summarize(m):
+            def visit(node, context):
+                nodes.append((node.name, node.rmf_index,
+                              getattr(node, 'resolution', None),
+                              type(node.chimera_obj).__name__))
+                return [(child, None) for child in node.children]
+            nodes = []
+            src.io._walk_tree([(m.rmf_hierarchy, None)], visit)
+            src.io._walk_tree([(f, None) for f in m.rmf_features], visit)
+            state, balls = m.child_models()[:2]
+            return (nodes,
+                    [(a.name, [int(c) for c in a.coord], int(a.radius),
+                      [int(c) for c in getattr(a, 'color', [])])
+                     for a in state.atoms + balls.atoms],
+                    len(state.bonds),
+                    [(p.name, p.previous.name, p.hierarchy_node.name)
+                     for p in m.rmf_provenance],
+                    [(c[0], c[1].name) for c in m._rmf_chains],
+                    len(m._drawing._drawing._shapes))
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            with utils.temporary_directory() as tmpdir:
+                cache = src.cache._RMFCache(tmpdir, 1024 * 1024)
+                mock_session = make_session()
+                rl = src.io._RMFLoader()
+                rl.cache = cache
+                cold = rl.load(fname, mock_session)[0]
+                self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+                rl = src.io._RMFLoader()
+                rl.cache = cache
+                # RMF should not be needed to read from the cache
+                rl._open = None
+                warm = rl.load(fname, mock_session)[0]
+                self.assertEqual(summarize(warm), summarize(cold))
+                self.assertEqual(warm.rmf_filename, cold.rmf_filename)
+                self.assertEqual(rl.frame_count, 1)
+
+                # Different options need a different cache entry
+                rl = src.io._RMFLoader(resolutions=[1.0])
+                rl.cache = cache
+                rl.load(fname, mock_session)
+                self.assertEqual(len(os.listdir(tmpdir)), 2)
+
+    def test_read_profile(self):
+        """Test profiling of open_rmf"""
+        def make_rmf_file(fname):
+            r = RMF.create_rmf_file(fname)
+            r.add_frame("root", RMF.FRAME)
+            rn = r.get_root_node()
+            n = rn.add_child("p0", RMF.REPRESENTATION)
+            p = RMF.ParticleFactory(r).get(n)
+            p.set_mass(1)
+            p.set_radius(4)
+            p.set_coordinates(RMF.Vector3(4., 5., 6.))
+            p = RMF.StructureProvenanceFactory(r).get(
+                rn.add_child("struc", RMF.PROVENANCE))
+            p.set_chain('A')
+            p.set_residue_offset(42)
+            p.set_filename('xyz')
+
+        with utils.temporary_file(suffix='.rmf') as fname:
+            make_rmf_file(fname)
+            mock_session = make_session()
+            try:
+                src.profiling.set_enabled(True)
+                structures, status = src.io.open_rmf(mock_session, fname)
+            finally:
+                src.profiling.set_enabled(False)
+            prof = src.profiling.get_last_profile()
+            self.assertEqual(prof.operation, 'open')
+            self.assertIsNotNone(prof.total_ns)
+            phases = prof.phases
+            # Root, particle and provenance nodes
+            self.assertEqual(phases['read hierarchy'][2], 3)
+            self.assertEqual(phases['decorator probes'][1], 3)
+            self.assertEqual(phases['read provenance'][1:], [1, 1])
+            self.assertEqual(phases['create atoms'][1:], [1, 1])
+
     def test_provenance(self):
         """Test open_rmf handling of RMF provenance"""
         def make_rmf_file(fname):
@@ -802,6 +1762,104 @@ END
         self.assertEqual(newn.rmf_index, 1)
         self.assertEqual(newn.children, [])
 
+    def test_hierarchy_store(self):
+        """Test _RMFHierarchy columnar store"""
+        h = src.io._RMFHierarchy(capacity=2)
+        root = h.add_node("root", 0)
+        c1 = h.add_node("child", 1, root)
+        c2 = h.add_node("child", 2, root)
+        gc = h.add_node("grandchild", 3, c1)
+        self.assertEqual(len(h), 4)
+        self.assertEqual(h.names, ["root", "child", "grandchild"])
+        self.assertEqual(h.get_children(root), [c1, c2])
+        self.assertEqual(h.get_children(c1), [gc])
+        self.assertEqual(h.get_children(gc), [])
+        self.assertEqual(list(h.parent), [-1, root, root, c1])
+        self.assertEqual(h.get_subtree(root), [root, c1, gc, c2])
+        self.assertEqual(h.get_name(c2), "child")
+        self.assertIsNone(h.get_resolution(c1))
+        h.set_resolution(c2, 10.)
+        self.assertAlmostEqual(h.get_resolution(c2), 10., delta=1e-6)
+
+        # Views are created on demand and shared
+        n = h.node(c1)
+        self.assertIs(h.node(c1), n)
+        self.assertEqual(n.name, "child")
+        self.assertEqual(n.rmf_index, 1)
+        self.assertIs(n.parent(), h.node(root))
+        self.assertIsNone(h.node(root).parent)
+        self.assertEqual([x.name for x in n.children], ["grandchild"])
+
+        h.set_objects([c1, gc], ['obj1', 'obj2'])
+        h.set_object(c1, 'obj3')
+        self.assertEqual(n.chimera_obj, 'obj3')
+        self.assertIsNone(h.get_object(c2))
+        self.assertEqual(h.get_node_objects(), [(c1, 'obj3'), (gc, 'obj2')])
+
+        # Nodes at unwanted resolutions are hidden
+        h.set_resolution(c1, 1.)
+        h.set_resolution_filter(set([None, 10.]))
+        self.assertEqual(h.get_filtered_children(root), [c2])
+        self.assertEqual(h.get_filtered_child_count(root), 1)
+        self.assertEqual(h.get_filtered_child(root, 0), c2)
+        self.assertEqual(h.get_filtered_row(c2), 0)
+        self.assertEqual(h.get_filtered_row(c1), -1)
+        h.set_resolution_filter(set([None, 1., 10.]))
+        self.assertEqual(h.get_filtered_children(root), [c1, c2])
+        self.assertEqual(h.get_filtered_children(c1), [gc])
+
+    def test_hierarchy_graft(self):
+        """Test adding nodes from one hierarchy to another"""
+        root = src.io._RMFHierarchyNode(MockRMFNode("root", 0))
+        child = src.io._RMFHierarchyNode(MockRMFNode("child", 1))
+        gchild = src.io._RMFHierarchyNode(MockRMFNode("gchild", 2))
+        gchild.chimera_obj = 'obj'
+        child.add_children([gchild])
+        root.add_child(child)
+        # Existing views now point into the root's hierarchy
+        self.assertIs(child._hierarchy, root._hierarchy)
+        self.assertIs(gchild._hierarchy, root._hierarchy)
+        self.assertEqual(root.children, [child])
+        self.assertIs(gchild.parent(), child)
+        self.assertEqual(gchild.chimera_obj, 'obj')
+        self.assertRaises(ValueError, root.add_child, child)
+
+    def test_hierarchy_store_snapshot(self):
+        """Test take/restore snapshot of _RMFHierarchy"""
+        session = make_session()
+        model = src.io._RMFModel(session, "test model")
+        state = model._add_state("state 0")
+        session.models.add([model])
+        residue = state.new_residue('ALA', 'A', 1)
+        atom1 = state.new_atom('C', 'C')
+        residue.add_atom(atom1)
+        atom2 = state.new_atom('N', 'N')
+        residue.add_atom(atom2)
+        h = src.io._RMFHierarchy()
+        root = h.add_node("root", 0)
+        c1 = h.add_node("c1", 1, root)
+        h.add_node("c2", 2, root)
+        h.set_resolution(c1, 1.)
+        h.set_objects([root, c1], [atom2, atom1])
+        model.rmf_features = []
+        model.rmf_hierarchy = h.node(root)
+
+        s = model.rmf_hierarchy.take_snapshot(session, None)
+        self.assertEqual(s['version'], 2)
+        d = h.take_snapshot(session, None)
+        newh = src.io._RMFHierarchy.restore_snapshot(session, d)
+        self.assertEqual(len(newh), 3)
+        self.assertEqual(newh.get_children(root), [1, 2])
+        self.assertAlmostEqual(newh.get_resolution(c1), 1., delta=1e-6)
+        self.assertIsNone(newh.get_resolution(2))
+        model.rmf_hierarchy = src.io._RMFHierarchyNode.restore_snapshot(
+            session, {'version': 2, 'hierarchy': newh, 'index': root})
+        self.assertEqual(model.rmf_hierarchy.name, "root")
+        src.io._restore_chimera_obj(session, model)
+        self.assertIs(newh.get_object(root), atom2)
+        self.assertIs(newh.get_object(c1), atom1)
+        self.assertIsNone(newh.get_object(2))
+
     def test_feature_snapshot(self):
         """Test take/restore snapshot of RMFFeature"""
         rmf_node = MockRMFNode("r1", 1)
@@ -972,12 +2030,16 @@ END
         s.rmf_hierarchy = []
         s._provenance_map['testfname'] = model1
         s._provenance_map['test2'] = model2
+        s._skipped_rmf_nodes = [(10., 5, 1)]
+        s._rmf_states = {3: model1, 4: model2}
         model2.delete()
         d = s.take_snapshot(session, None)
         news = src.io._RMFModel.restore_snapshot(session, d)
         self.assertIsInstance(news, src.io._RMFModel)
         self.assertEqual(news.rmf_filename, 'foo')
         self.assertEqual(news._provenance_map, {'testfname': model1.id})
+        self.assertEqual(news._skipped_rmf_nodes, [(10., 5, 1)])
+        self.assertEqual(news._rmf_states, {3: model1.id})
 
     def test_save_snapshot_chimera_obj(self):
         """Test save_snapshot of Chimera objects"""
@@ -7,6 +7,7 @@ TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 utils.set_search_paths(TOPDIR)
 
 from Qt.QtWidgets import QTreeView, QPushButton, QCheckBox  # noqa: E402
+from Qt.QtWidgets import QComboBox  # noqa: E402
 from Qt.QtCore import QModelIndex, Qt  # noqa: E402
 
 import src  # noqa: E402
@@ -25,6 +26,14 @@ class MockToolInfo:
         self.name = name
 
 
+class MockLogger:
+    def __init__(self):
+        self.error_log = []
+
+    def error(self, msg):
+        self.error_log.append(msg)
+
+
 class MockRMFNode:
     def __init__(self, name, index):
         self.name, self.index = name, index
@@ -320,6 +329,15 @@ class Tests(unittest.TestCase):
         m1.rmf_provenance = []
         m1._rmf_resolutions = set((1, 10))
         m1._selected_rmf_resolutions = set((1, None))
+        # Resolution 10 was not read from the file
+        m1._skipped_rmf_resolutions = set((10,))
+        loaded = []
+
+        def mock_load(res):
+            loaded.append(res)
+            m1._skipped_rmf_resolutions.discard(res)
+            return 0
+        m1._load_skipped_rmf_resolution = mock_load
         mock_session.models.add((m1,))
         r = src.tool.RMFViewer(mock_session, "RMF Viewer")
         tree1 = get_first_tree(r.model_stack.widget(0))
@@ -328,7 +346,23 @@ class Tests(unittest.TestCase):
         # Show/hide resolution 10
         cb = QCheckBox('foo')
         cb.setChecked(True)
-        r._resolution_button_clicked(cb, tree1, 10)
+        r._resolution_button_clicked(cb, tree1, 10, m1)
+        # Resolution should be read from the file on first show only
+        self.assertEqual(loaded, [10])
+        r._resolution_button_clicked(cb, tree1, 10, m1)
+        self.assertEqual(loaded, [10])
+
+        # If the resolution cannot be read, it should not be shown
+        def mock_load_fail(res):
+            raise OSError("read failed")
+        m1._load_skipped_rmf_resolution = mock_load_fail
+        m1._skipped_rmf_resolutions.add(10)
+        mock_session.logger = MockLogger()
+        r._resolution_button_clicked(cb, tree1, 10, m1)
+        self.assertEqual(
+            mock_session.logger.error_log,
+            ["Could not read resolution 10.0 of %s: read failed" % m1])
+        self.assertFalse(cb.isChecked())
         cb = QCheckBox('bar')
         cb.setChecked(False)
         r._resolution_button_clicked(cb, tree1, 10)
@@ -337,6 +371,46 @@ class Tests(unittest.TestCase):
         for b in res1b, res10b:
             b.click()
 
+    @unittest.skipIf(utils.no_gui, "Cannot test without GUI")
+    def test_read_state_clicked(self):
+        """Test reading a state that was not read when the file was opened"""
+        def get_state_list(stack):
+            for w in stack.widget(1).children():
+                if isinstance(w, QComboBox):
+                    return w
+            raise ValueError("could not find state list")
+
+        root = make_node("root", 0)
+        mock_session = make_session()
+        m1 = Model(mock_session, 'test')
+        m1.rmf_hierarchy = root
+        m1.rmf_features = []
+        m1.rmf_provenance = []
+        m1._rmf_resolutions = set()
+        m1._selected_rmf_resolutions = set((None,))
+        m1._skipped_rmf_states = [(1, 's1', 4, 0), (3, 's3', 8, 0)]
+        loaded = []
+        m1._load_skipped_rmf_state = lambda istate: loaded.append(istate)
+        mock_session.models.add((m1,))
+        r = src.tool.RMFViewer(mock_session, "RMF Viewer")
+        state_list = get_state_list(r.model_stack.widget(0))
+        self.assertEqual(state_list.count(), 2)
+        self.assertEqual(state_list.itemText(1), "3: s3")
+        state_list.setCurrentIndex(1)
+        r._read_state_button_clicked(state_list, m1)
+        self.assertEqual(loaded, [3])
+
+        # Errors should be reported, and the state can be read again
+        def mock_load_fail(istate):
+            raise OSError("read failed")
+        m1._load_skipped_rmf_state = mock_load_fail
+        mock_session.logger = MockLogger()
+        button = QPushButton('Read')
+        r._read_state_button_clicked(state_list, m1, button)
+        self.assertEqual(mock_session.logger.error_log,
+                         ["Could not read state 3 of %s: read failed" % m1])
+        self.assertTrue(button.isEnabled())
+
     @unittest.skipIf(utils.no_gui, "Cannot test without GUI")
     def test_feature_selected(self):
         """Test selecting features"""